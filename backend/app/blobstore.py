@@ -0,0 +1,320 @@
+"""
+    Content-addressed blob store for project files.
+    Blobs live under the key blobs/ab/cd/<sha256> of the storage backend (<files_dir>/blobs/... locally,
+    see storage.py); storage_blobs.ref_count counts the ProjectFile and ProjectFileVersion rows pointing
+    at each blob. Local cold blobs (see retention.py) are stored compressed under
+    <cold_dir>/ab/cd/<sha256>.zst|.gz instead; readers find them from the hot path alone, without a DB lookup.
+"""
+import os, gzip, shutil, hashlib, uuid, asyncio, logging, contextlib
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import config
+from .db import SessionLocal
+from .models.models import ProjectFile
+from .models.models_files import StorageBlob
+from .file_responses import Reader
+from .storage import temp_path
+from . import jobs, storage, usage
+
+try:
+    import zstandard
+except ImportError:  # optional; the cold tier falls back to gzip
+    zstandard = None
+
+log = logging.getLogger(__name__)
+
+def blob_key(sha256: str) -> str:
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def blob_path(sha256: str) -> str:
+    """Local-driver path of a blob."""
+    return os.path.join(config.storage.files_dir, "blobs", sha256[:2], sha256[2:4], sha256)
+
+def _cold_dir() -> str:
+    return config.storage.cold_dir or os.path.join(config.storage.files_dir, "cold")
+
+_COLD_EXT = {"zstd": ".zst", "gzip": ".gz"}
+_CHUNK = 256 * 1024
+
+def cold_codec() -> str:
+    return "zstd" if config.storage.cold_codec == "zstd" and zstandard is not None else "gzip"
+
+def cold_path(sha256: str, codec: str) -> str:
+    return os.path.join(_cold_dir(), sha256[:2], sha256[2:4], sha256 + _COLD_EXT[codec])
+
+def _blob_sha(path: str) -> str | None:
+    """The hash when `path` is a blob path, else None (legacy per-project files)."""
+    name = os.path.basename(path)
+    if len(name) != 64 or os.path.abspath(path) != os.path.abspath(blob_path(name)):
+        return None
+    return name
+
+def locate(path: str) -> tuple[str | None, str | None]:
+    """
+        (file to read, codec) for a stored path: the hot file if present, else a cold copy of the blob.
+        Remote locators are returned as they are, without a round trip.
+    """
+    if storage.is_remote(path):
+        return path, None
+    if os.path.exists(path):
+        return path, None
+    sha256 = _blob_sha(path)
+    if sha256:
+        for codec in _COLD_EXT:
+            cp = cold_path(sha256, codec)
+            if os.path.exists(cp):
+                return cp, codec
+    return None, None
+
+def exists(path: str) -> bool:
+    if storage.is_remote(path):
+        return storage.exists_sync(path)
+    return locate(path)[0] is not None
+
+def _open_codec(real: str, codec: str | None):
+    if codec is None:
+        return open(real, "rb")
+    if codec == "gzip":
+        return gzip.open(real, "rb")
+    if zstandard is None:
+        raise RuntimeError(f"zstandard is not installed, cannot read {real}")
+    return zstandard.ZstdDecompressor().stream_reader(open(real, "rb"), closefd=True)
+
+def open_blob(path: str):
+    """Blocking binary reader over a stored path's content, decompressing cold blobs on the fly."""
+    if storage.is_remote(path):
+        return storage.open_stream(path)
+    real, codec = locate(path)
+    if real is None:
+        raise FileNotFoundError(path)
+    return _open_codec(real, codec)
+
+@contextlib.contextmanager
+def local_copy(path: str) -> Iterator[str]:
+    """
+        A local file holding a stored path's content for the duration of the block (blocking). Hot and
+        remote content goes through storage.local_copy; a cold blob is decompressed to a staging file.
+    """
+    if storage.is_remote(path):
+        with storage.local_copy(path) as local:
+            yield local
+        return
+    real, codec = locate(path)
+    if real is None:
+        raise FileNotFoundError(path)
+    if codec is None:
+        yield real
+        return
+    tmp = temp_path()
+    try:
+        with open_blob(path) as src, open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst, _CHUNK)
+        yield tmp
+    finally:
+        _discard(tmp)
+
+def cold_reader(path: str) -> Reader:
+    # compressed streams are not seekable: a range start is reached by decompressing and discarding
+    async def read(start: int, length: int):
+        f = await asyncio.to_thread(open_blob, path)
+        try:
+            skip = start
+            while skip > 0:
+                chunk = await asyncio.to_thread(f.read, min(_CHUNK, skip))
+                if not chunk:
+                    return
+                skip -= len(chunk)
+            remaining = length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+    return read
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _move_into_place(tmp: str, dest: str):
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(tmp, dest)
+
+async def put(db: AsyncSession, tmp: str, sha256: str, size: int, refs: int = 1, contract_id: int | None = None) -> str:
+    """
+        Adopt the staged file `tmp` as blob `sha256` with `refs` new references and return its locator.
+        An existing blob is reused (wherever it is stored) and `tmp` discarded. A new blob goes to the
+        configured storage backend. The blob row stays locked until the caller commits, which keeps
+        the garbage collector off it. A new blob is charged to `contract_id`.
+    """
+    for _ in range(2):
+        res = await db.execute(update(StorageBlob).where(StorageBlob.sha256 == sha256).values(ref_count=StorageBlob.ref_count + refs, unreferenced_at=None))
+        if res.rowcount:
+            res = await db.execute(select(StorageBlob.stored_path).where(StorageBlob.sha256 == sha256))
+            dest = res.scalar_one()
+            if await storage.exists(dest):
+                await asyncio.to_thread(_discard, tmp)
+            else:
+                # row survived a lost (or frozen) file: heal it in place with the identical content
+                await storage.put(tmp, dest)
+                await _mark_hot(db, sha256)
+            return dest
+        dest = storage.locator(blob_key(sha256))
+        try:
+            async with db.begin_nested():
+                db.add(StorageBlob(sha256=sha256, stored_path=dest, size_bytes=size, ref_count=refs, contract_id=contract_id))
+        except IntegrityError:
+            # a concurrent upload of the same content inserted it first; take the update path
+            continue
+        await usage.add_blob_bytes(db, contract_id, size)
+        await storage.put(tmp, dest)
+        return dest
+    raise RuntimeError(f"could not register blob {sha256}")
+
+async def incref(db: AsyncSession, sha256: str | None, n: int = 1):
+    if not sha256 or not n:
+        return
+    await db.execute(update(StorageBlob).where(StorageBlob.sha256 == sha256).values(ref_count=StorageBlob.ref_count + n, unreferenced_at=None))
+
+async def decref(db: AsyncSession, sha256: str | None, n: int = 1):
+    """Drop references; blobs reaching zero become eligible for GC after the grace period."""
+    if not sha256 or not n:
+        return
+    await db.execute(update(StorageBlob).where(StorageBlob.sha256 == sha256).values(ref_count=StorageBlob.ref_count - n))
+    await db.execute(update(StorageBlob).where(StorageBlob.sha256 == sha256, StorageBlob.ref_count <= 0, StorageBlob.unreferenced_at.is_(None)).values(unreferenced_at=datetime.utcnow()))
+
+def _physical_size(blob: StorageBlob) -> int:
+    if blob.tier == "cold" and blob.cold_size_bytes is not None:
+        return blob.cold_size_bytes
+    return blob.size_bytes or 0
+
+def _compress(src: str, dest: str, codec: str) -> int:
+    with open(src, "rb") as fin, open(dest, "wb") as fout:
+        if codec == "zstd":
+            zstandard.ZstdCompressor(level=config.storage.cold_level).copy_stream(fin, fout, read_size=_CHUNK, write_size=_CHUNK)
+        else:
+            with gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=min(max(config.storage.cold_level, 1), 9)) as gz:
+                shutil.copyfileobj(fin, gz, _CHUNK)
+    return os.path.getsize(dest)
+
+def _digest(real: str, codec: str | None) -> str:
+    h = hashlib.sha256()
+    with _open_codec(real, codec) as f:
+        while chunk := f.read(_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _decompress(real: str, codec: str, dest: str):
+    with _open_codec(real, codec) as fin, open(dest, "wb") as fout:
+        shutil.copyfileobj(fin, fout, _CHUNK)
+
+async def _mark_hot(db: AsyncSession, sha256: str):
+    """Flip a (locked) blob row back to hot once its plain file is in place, dropping the cold copy."""
+    blob = await db.get(StorageBlob, sha256, populate_existing=True)
+    if blob is None or blob.tier != "cold":
+        return
+    await usage.add_blob_bytes(db, blob.contract_id, (blob.size_bytes or 0) - _physical_size(blob))
+    if blob.cold_path:
+        await asyncio.to_thread(_discard, blob.cold_path)
+    blob.tier, blob.cold_path, blob.codec, blob.cold_size_bytes = "hot", None, None, None
+
+async def freeze(db: AsyncSession, sha256: str, codec: str | None = None) -> int | None:
+    """
+        Move a hot blob to the cold tier and commit; returns the bytes saved, None if skipped.
+        The compressed copy is written and verified first. The plain file is removed under the blob's
+        row lock, so a concurrent `put` of the same content waits and then re-creates it hot.
+        Blobs that are the current content of any ProjectFile are never frozen.
+    """
+    codec = codec or cold_codec()
+    blob = await db.get(StorageBlob, sha256)
+    await db.commit()
+    # the cold tier is local; object stores have their own storage classes
+    if blob is None or blob.tier != "hot" or storage.is_remote(blob.stored_path) or not await asyncio.to_thread(os.path.exists, blob.stored_path):
+        return None
+    dest = cold_path(sha256, codec)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{uuid.uuid4().hex}.part"
+    try:
+        cold_size = await asyncio.to_thread(_compress, blob.stored_path, tmp, codec)
+        if await asyncio.to_thread(_digest, tmp, codec) != sha256:
+            log.warning("freeze: %s did not round-trip through %s, left hot", sha256, codec)
+            return None
+        res = await db.execute(select(StorageBlob).where(StorageBlob.sha256 == sha256, StorageBlob.tier == "hot", StorageBlob.ref_count > 0).with_for_update().execution_options(populate_existing=True))
+        blob = res.scalar_one_or_none()
+        res = await db.execute(select(ProjectFile.id).where(ProjectFile.sha256 == sha256).limit(1))
+        if blob is None or res.first() is not None:
+            await db.rollback()
+            return None
+        await asyncio.to_thread(os.replace, tmp, dest)
+        await asyncio.to_thread(_discard, blob.stored_path)
+        await usage.add_blob_bytes(db, blob.contract_id, cold_size - (blob.size_bytes or 0))
+        blob.tier, blob.cold_path, blob.codec, blob.cold_size_bytes = "cold", dest, codec, cold_size
+        await db.commit()
+        return (blob.size_bytes or 0) - cold_size
+    finally:
+        await asyncio.to_thread(_discard, tmp)
+
+async def thaw(db: AsyncSession, sha256: str | None):
+    """Bring a cold blob back to the hot tier (e.g. a restore makes an old revision current). Caller commits."""
+    if not sha256:
+        return
+    res = await db.execute(select(StorageBlob).where(StorageBlob.sha256 == sha256).with_for_update().execution_options(populate_existing=True))
+    blob = res.scalar_one_or_none()
+    if blob is None or blob.tier != "cold":
+        return
+    if not await asyncio.to_thread(os.path.exists, blob.stored_path):
+        real, codec = await asyncio.to_thread(locate, blob.stored_path)
+        if real is None:
+            raise FileNotFoundError(blob.stored_path)
+        tmp = temp_path()
+        try:
+            await asyncio.to_thread(_decompress, real, codec, tmp)
+            await asyncio.to_thread(_move_into_place, tmp, blob.stored_path)
+        finally:
+            await asyncio.to_thread(_discard, tmp)
+    await _mark_hot(db, sha256)
+
+async def collect_garbage(grace: timedelta | None = None, batch: int = 200) -> int:
+    """
+        Delete blobs unreferenced for longer than `grace`. Each blob is re-checked under a row lock
+        and its file removed before the row delete commits, so a concurrent `put` of the same
+        content waits and then re-creates it.
+    """
+    if grace is None:
+        grace = timedelta(minutes=config.storage.blob_gc_grace_minutes)
+    cutoff = datetime.utcnow() - grace
+    removed = 0
+    async with SessionLocal() as db:
+        res = await db.execute(select(StorageBlob.sha256).where(StorageBlob.ref_count <= 0, StorageBlob.unreferenced_at < cutoff).limit(batch))
+        candidates = res.scalars().all()
+        await db.commit()
+        for sha256 in candidates:
+            res = await db.execute(select(StorageBlob).where(StorageBlob.sha256 == sha256, StorageBlob.ref_count <= 0, StorageBlob.unreferenced_at < cutoff).with_for_update())
+            blob = res.scalar_one_or_none()
+            if not blob:
+                await db.rollback()
+                continue
+            await storage.delete(blob.stored_path)
+            if blob.cold_path:
+                await asyncio.to_thread(_discard, blob.cold_path)
+            await usage.add_blob_bytes(db, blob.contract_id, -_physical_size(blob))
+            await db.delete(blob)
+            await db.commit()
+            removed += 1
+    if removed:
+        log.info("blob gc removed %d blobs", removed)
+    return removed
+
+@jobs.every(3600, name="blob_gc")
+async def _blob_gc_job():
+    await collect_garbage()
@@ -34,6 +34,47 @@ class DBConfig:
 class StorageConfig:
     files_dir: str = "./var/files"
     public_base: str = "http://localhost:8000/public"
+    # 0 = unlimited; per-project overrides keyed by contract id, e.g. {"12" = 2048}
+    max_upload_mb: int = 0
+    project_max_upload_mb: dict = field(default_factory=dict)
+    # unreferenced blobs are kept this long before the GC deletes them
+    blob_gc_grace_minutes: int = 60
+    # resumable upload sessions expire after this long without a chunk
+    upload_session_hours: int = 24
+    thumbnail_workers: int = 2
+    # SQLite FTS5 search index; empty = <files_dir>/search.sqlite
+    search_db: str = ""
+    # nightly storage scrub: "report" (dry run), "quarantine" or "delete"
+    scrub_mode: str = "report"
+    # cold tier for old revisions; empty = <files_dir>/cold. "zstd" needs the zstandard package (else gzip)
+    cold_dir: str = ""
+    cold_codec: str = "zstd"
+    cold_level: int = 10
+    # public share links: HMAC key (empty = derived from security.jwt_secret) and default lifetime
+    share_secret: str = ""
+    share_link_hours: int = 72
+    # "sendfile" serves from this process (zero-copy when the ASGI server supports it);
+    # "accel" hands the file to nginx via X-Accel-Redirect under share_accel_prefix (internal location -> files_dir)
+    share_offload: str = "sendfile"
+    share_accel_prefix: str = "/_protected/"
+    # where new content is stored: "local" (files_dir) or "s3" (see [s3]); existing rows keep their locator
+    backend: str = "local"
+
+@dataclass
+class S3Config:
+    # S3-compatible endpoint; empty = AWS. MinIO: endpoint_url = "http://minio:9000", addressing_style = "path"
+    endpoint_url: str = ""
+    region: str = ""
+    bucket: str = "intranet-files"
+    access_key: str = ""
+    secret_key: str = ""
+    prefix: str = ""
+    addressing_style: str = "auto"
+    multipart_mb: int = 16
+    max_concurrency: int = 8
+    # redirect downloads to presigned URLs instead of streaming them through the app
+    presign_downloads: bool = False
+    presign_seconds: int = 900
 
 @dataclass
 class CORSConfig:
@@ -48,6 +89,7 @@ class Config:
     security: SecurityConfig = field(default_factory=SecurityConfig)
     database: DBConfig = field(default_factory=DBConfig)
     storage: StorageConfig = field(default_factory=StorageConfig)
+    s3: S3Config = field(default_factory=S3Config)
     cors: CORSConfig = field(default_factory=CORSConfig)
 
 def _load_toml(path: str) -> dict:
@@ -0,0 +1,300 @@
+"""
+    Critical path method over one contract's schedule. Activities are the leaf items (summary items take
+    their dates from the rollup, so links to or from them are ignored); links are
+    project_schedule_dependencies rows:
+
+      FS  successor starts after the predecessor finishes (+ lag)
+      SS  successor starts after the predecessor starts (+ lag)
+      FF  successor finishes after the predecessor finishes (+ lag)
+      SF  successor finishes after the predecessor starts (+ lag)
+
+    Times are whole calendar days counted from the earliest planned start. An activity lasts its planned
+    days (at least 1) and cannot start before its own planned start. The full forward and backward passes
+    run level by level over numpy arrays, so every activity of a topological level is relaxed at once;
+    without numpy the same passes run node by node. `recalc` with changed item ids re-walks only the
+    downstream cone (forward) and upstream cone (backward) of those items while the project finish holds.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models.models_schedule import ProjectScheduleItem, ScheduleDependency
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python passes give the same results
+    np = None
+
+log = logging.getLogger(__name__)
+
+TYPES = ("FS", "SS", "FF", "SF")
+_MIN_LEVEL_WIDTH = 8
+_RESULT_FIELDS = ("early_start", "early_finish", "late_start", "late_finish", "total_float", "critical")
+
+class Schedule:
+    """Pass results as day offsets from the network's base date, indexed like Network.ids (None = in or behind a loop)."""
+    def __init__(self, es: list, ef: list, ls: list, lf: list):
+        self.es, self.ef, self.ls, self.lf = es, ef, ls, lf
+        done = [f for f in ef if f is not None]
+        self.finish = max(done) if done else 0
+
+    def total_float(self, k: int) -> Optional[int]:
+        return None if self.es[k] is None else self.ls[k] - self.es[k]
+
+class Network:
+    def __init__(self, items: Iterable[tuple], deps: Iterable[tuple]):
+        items = list(items)
+        parents = {r[1] for r in items if r[1] is not None}
+        self.summary_ids = [r[0] for r in items if r[0] in parents]
+        leaves = [r for r in items if r[0] not in parents]
+        starts = [r[2] for r in leaves if r[2] is not None]
+        self.base: date = min(starts) if starts else date.today()
+        self.ids: list[int] = [r[0] for r in leaves]
+        self.index = {i: k for k, i in enumerate(self.ids)}
+        self.dur = [max((r[3] - r[2]).days + 1, 1) if r[2] and r[3] else 1 for r in leaves]
+        self.lb = [(r[2] - self.base).days if r[2] else 0 for r in leaves]
+        # stored results (the tail of each item row), used as the starting point for incremental passes
+        self.stored = {r[0]: tuple(r[4:]) for r in items}
+        self.src, self.dst, self.lag, self.from_finish, self.to_finish = [], [], [], [], []
+        self.ignored = 0
+        for pred, succ, kind, lag in deps:
+            a, b = self.index.get(pred), self.index.get(succ)
+            if a is None or b is None or a == b or kind not in TYPES:
+                self.ignored += 1
+                continue
+            self.src.append(a)
+            self.dst.append(b)
+            self.lag.append(lag or 0)
+            self.from_finish.append(kind[0] == "F")
+            self.to_finish.append(kind[1] == "F")
+        n = len(self.ids)
+        self.out: list[list[int]] = [[] for _ in range(n)]
+        self.inn: list[list[int]] = [[] for _ in range(n)]
+        for e, (a, b) in enumerate(zip(self.src, self.dst)):
+            self.out[a].append(e)
+            self.inn[b].append(e)
+        self._topo()
+
+    def _topo(self):
+        """Kahn's algorithm with levels (longest link count from a start); activities left over sit in or behind a loop."""
+        n = len(self.ids)
+        indeg = [len(x) for x in self.inn]
+        self.level = [0] * n
+        self.order = [k for k in range(n) if indeg[k] == 0]
+        for k in self.order:  # the list grows while we walk it
+            for e in self.out[k]:
+                j = self.dst[e]
+                self.level[j] = max(self.level[j], self.level[k] + 1)
+                indeg[j] -= 1
+                if indeg[j] == 0:
+                    self.order.append(j)
+        self.pos = {k: p for p, k in enumerate(self.order)}
+        self.cyclic = [k for k in range(n) if k not in self.pos]
+        for k in self.cyclic:
+            self.level[k] = -1
+
+    @classmethod
+    async def load(cls, db: AsyncSession, contract_id: int) -> "Network":
+        P, D = ProjectScheduleItem, ScheduleDependency
+        res = await db.execute(select(P.id, P.parent_id, P.planned_start, P.planned_end, P.early_start, P.early_finish,
+                                      P.late_start, P.late_finish, P.total_float, P.critical)
+                               .where(P.contract_id == contract_id))
+        items = res.all()
+        res = await db.execute(select(D.predecessor_id, D.successor_id, D.type, D.lag_days).where(D.contract_id == contract_id))
+        return cls(items, res.all())
+
+    # ---------- node-by-node passes ----------
+
+    def _forward(self, j: int, es: list, ef: list):
+        start = self.lb[j]
+        for e in self.inn[j]:
+            i = self.src[e]
+            if es[i] is None:
+                continue
+            t = (ef[i] if self.from_finish[e] else es[i]) + self.lag[e] - (self.dur[j] if self.to_finish[e] else 0)
+            if t > start:
+                start = t
+        es[j], ef[j] = start, start + self.dur[j]
+
+    def _backward(self, i: int, ls: list, lf: list, finish: int):
+        end = finish
+        for e in self.out[i]:
+            j = self.dst[e]
+            if ls[j] is None:
+                continue
+            t = (lf[j] if self.to_finish[e] else ls[j]) - self.lag[e] + (0 if self.from_finish[e] else self.dur[i])
+            if t < end:
+                end = t
+        ls[i], lf[i] = end - self.dur[i], end
+
+    def _compute_python(self) -> Schedule:
+        n = len(self.ids)
+        es, ef, ls, lf = [None] * n, [None] * n, [None] * n, [None] * n
+        for j in self.order:
+            self._forward(j, es, ef)
+        finish = max((f for f in ef if f is not None), default=0)
+        for i in reversed(self.order):
+            self._backward(i, ls, lf, finish)
+        return Schedule(es, ef, ls, lf)
+
+    # ---------- vectorized passes ----------
+
+    def _compute_numpy(self) -> Schedule:
+        n = len(self.ids)
+        level = np.asarray(self.level, dtype=np.int64)
+        dur = np.asarray(self.dur, dtype=np.int64)
+        es = np.asarray(self.lb, dtype=np.int64)
+        src, dst = np.asarray(self.src, dtype=np.int64), np.asarray(self.dst, dtype=np.int64)
+        lag = np.asarray(self.lag, dtype=np.int64)
+        ff, tf = np.asarray(self.from_finish, dtype=bool), np.asarray(self.to_finish, dtype=bool)
+        live = (level[src] >= 0) & (level[dst] >= 0) if len(src) else np.zeros(0, dtype=bool)
+        src, dst, lag, ff, tf = src[live], dst[live], lag[live], ff[live], tf[live]
+        top = int(level.max()) if n else -1
+        # nodes and links bucketed by level: forward relaxes links into level L, backward links out of level L
+        node_order = np.argsort(level, kind="stable")
+        node_cut = np.searchsorted(level[node_order], np.arange(top + 2))
+        in_order = np.argsort(level[dst], kind="stable")
+        in_cut = np.searchsorted(level[dst][in_order], np.arange(top + 2))
+        out_order = np.argsort(level[src], kind="stable")
+        out_cut = np.searchsorted(level[src][out_order], np.arange(top + 2))
+        ef = es + dur
+        for L in range(top + 1):
+            edges = in_order[in_cut[L]:in_cut[L + 1]]
+            if len(edges):
+                s, d = src[edges], dst[edges]
+                cand = np.where(ff[edges], ef[s], es[s]) + lag[edges] - np.where(tf[edges], dur[d], 0)
+                np.maximum.at(es, d, cand)
+            nodes = node_order[node_cut[L]:node_cut[L + 1]]
+            ef[nodes] = es[nodes] + dur[nodes]
+        ok = level >= 0
+        finish = int(ef[ok].max()) if ok.any() else 0
+        lf = np.full(n, finish, dtype=np.int64)
+        ls = lf - dur
+        for L in range(top, -1, -1):
+            edges = out_order[out_cut[L]:out_cut[L + 1]]
+            if len(edges):
+                s, d = src[edges], dst[edges]
+                cand = np.where(tf[edges], lf[d], ls[d]) - lag[edges] + np.where(ff[edges], 0, dur[s])
+                np.minimum.at(lf, s, cand)
+            nodes = node_order[node_cut[L]:node_cut[L + 1]]
+            ls[nodes] = lf[nodes] - dur[nodes]
+        out = [[None if not ok[k] else int(v) for k, v in enumerate(a.tolist())] for a in (es, ef, ls, lf)]
+        return Schedule(*out)
+
+    def compute(self) -> Schedule:
+        """Full forward and backward pass."""
+        # a level costs a few numpy calls, so long thin chains are faster node by node
+        if np is not None and len(self.ids) >= _MIN_LEVEL_WIDTH * (max(self.level, default=0) + 1):
+            return self._compute_numpy()
+        return self._compute_python()
+
+    # ---------- incremental ----------
+
+    def _cone(self, start: Iterable[int], adj: list[list[int]], ends: list[int]) -> set[int]:
+        seen, stack = set(start), list(start)
+        while stack:
+            for e in adj[stack.pop()]:
+                j = ends[e]
+                if j not in seen:
+                    seen.add(j)
+                    stack.append(j)
+        return seen
+
+    def previous(self) -> Optional[Schedule]:
+        """The stored results as a Schedule, or None when any activity has not been computed yet."""
+        cols = ([], [], [], [])
+        for k, i in enumerate(self.ids):
+            s = self.stored.get(i)
+            if k in self.pos and (not s or None in s[:4]):
+                return None
+            vals = (None,) * 4 if k not in self.pos else (
+                (s[0] - self.base).days, (s[1] - self.base).days + 1, (s[2] - self.base).days, (s[3] - self.base).days + 1)
+            for c, v in zip(cols, vals):
+                c.append(v)
+        # unplanned activities start at the project start; if that moved, every offset is stale
+        if min((v for v in cols[0] if v is not None), default=0) != 0:
+            return None
+        return Schedule(*cols)
+
+    def update(self, prev: Schedule, changed: Iterable[int]) -> Schedule:
+        """Re-run the passes for `changed` activities (dates or duration edited) against `prev`."""
+        changed = [k for k in changed if k in self.pos]
+        es, ef, ls, lf = list(prev.es), list(prev.ef), list(prev.ls), list(prev.lf)
+        down = self._cone(changed, self.out, self.dst)
+        for j in sorted(down & self.pos.keys(), key=self.pos.__getitem__):
+            self._forward(j, es, ef)
+        finish = max((f for f in ef if f is not None), default=0)
+        if finish != prev.finish:
+            # the end date moved, so every late date moves with it
+            return self.compute()
+        up = self._cone(changed, self.inn, self.src)
+        for i in sorted(up & self.pos.keys(), key=self.pos.__getitem__, reverse=True):
+            self._backward(i, ls, lf, finish)
+        return Schedule(es, ef, ls, lf)
+
+    # ---------- results ----------
+
+    def values(self, sched: Schedule, k: int) -> tuple:
+        if sched.es[k] is None:
+            return (None, None, None, None, None, False)
+        day = lambda v: self.base + timedelta(days=v)
+        tf = sched.total_float(k)
+        return (day(sched.es[k]), day(sched.ef[k] - 1), day(sched.ls[k]), day(sched.lf[k] - 1), tf, tf <= 0)
+
+    def critical_path(self, sched: Schedule) -> list[int]:
+        """Zero-float activity ids in the order they run."""
+        crit = [k for k in self.order if sched.total_float(k) is not None and sched.total_float(k) <= 0]
+        return [self.ids[k] for k in sorted(crit, key=lambda k: (sched.es[k], sched.ef[k], self.pos[k]))]
+
+    def changes(self, sched: Schedule) -> list[dict]:
+        """Bulk UPDATE parameters for items whose stored results differ (summaries are cleared)."""
+        rows = []
+        for k, i in enumerate(self.ids):
+            vals = self.values(sched, k)
+            if self.stored.get(i) != vals:
+                rows.append({"id": i, **dict(zip(_RESULT_FIELDS, vals))})
+        cleared = (None, None, None, None, None, False)
+        for i in self.summary_ids:
+            if self.stored.get(i) != cleared:
+                rows.append({"id": i, **dict(zip(_RESULT_FIELDS, cleared))})
+        return rows
+
+def creates_loop(links: Iterable[tuple[int, int]], predecessor_id: int, successor_id: int) -> bool:
+    """True if linking predecessor -> successor closes a loop over the existing (pred, succ) links."""
+    out: dict[int, list[int]] = {}
+    for a, b in links:
+        out.setdefault(a, []).append(b)
+    seen, stack = {successor_id}, [successor_id]
+    while stack:
+        cur = stack.pop()
+        if cur == predecessor_id:
+            return True
+        for nxt in out.get(cur, ()):
+            if nxt not in seen:
+                seen.add(nxt)
+                stack.append(nxt)
+    return False
+
+async def recalc(db: AsyncSession, contract_id: int, changed: Optional[Iterable[int]] = None) -> tuple[Network, Schedule, int]:
+    """
+        Recompute and store a contract's CPM results; returns (network, schedule, rows written). With
+        `changed` item ids (date edits only, same links and hierarchy) the stored results are patched
+        incrementally; otherwise, or when nothing is stored yet, the whole network is recomputed.
+    """
+    net = await Network.load(db, contract_id)
+    prev = net.previous() if changed is not None else None
+    if prev is None:
+        sched = net.compute()
+    else:
+        sched = net.update(prev, [net.index[i] for i in changed if i in net.index])
+    rows = net.changes(sched)
+    if rows:
+        await db.execute(update(ProjectScheduleItem), rows)
+    if net.cyclic:
+        log.warning("cpm: contract %s has %d activities in dependency loops", contract_id, len(net.cyclic))
+    return net, sched, len(rows)
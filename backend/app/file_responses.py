@@ -0,0 +1,210 @@
+"""
+    Conditional and byte-range file responses: strong ETags, If-None-Match / If-Modified-Since (304),
+    If-Range, single ranges (206) and multi-range requests (multipart/byteranges).
+    SendfileResponse serves whole files through the server's zero-copy path when it offers one.
+"""
+import os, uuid, asyncio, aiofiles
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Callable, Optional
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 32
+
+# reader(start, length) -> async iterator over the bytes of that slice
+Reader = Callable[[int, int], AsyncIterator[bytes]]
+
+def local_reader(path: str) -> Reader:
+    async def read(start: int, length: int):
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    return read
+
+def _http_date(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def _etag_list(header: str) -> list[str]:
+    return [t.strip() for t in header.split(",") if t.strip()]
+
+def _weak_match(etag: str, header: str) -> bool:
+    opaque = etag.removeprefix("W/")
+    return any(t == "*" or t.removeprefix("W/") == opaque for t in _etag_list(header))
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return _weak_match(etag, inm)
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        since = _parse_http_date(ims)
+        lm = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+        return since is not None and lm.replace(microsecond=0) <= since
+    return False
+
+def _if_range_ok(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    value = request.headers.get("if-range")
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        # strong comparison only
+        return not value.startswith("W/") and not etag.startswith("W/") and value == etag
+    since = _parse_http_date(value)
+    if since is None or last_modified is None:
+        return False
+    lm = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+    return lm.replace(microsecond=0) == since
+
+def parse_range(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    """
+        Parse a `bytes=` Range header into sorted, merged inclusive (start, end) pairs.
+        Returns None when the header should be ignored and [] when nothing is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                n = int(last)
+                if n <= 0:
+                    continue
+                start, end = max(size - n, 0), size - 1
+            else:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                end = min(int(last), size - 1) if last else size - 1
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+    ranges.sort()
+    merged: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def content_disposition(filename: str) -> str:
+    ascii_name = filename.encode("ascii", "replace").decode().replace('"', "_")
+    return f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(filename)}'
+
+async def send_file(request: Request, path: str | None, *, etag: str, media_type: str, filename: str,
+                    last_modified: Optional[datetime] = None, size: Optional[int] = None,
+                    reader: Optional[Reader] = None) -> Response:
+    """Serve `path` (or `reader` over `size` bytes) honouring validators and Range requests."""
+    if size is None:
+        size = (await asyncio.to_thread(os.stat, path)).st_size
+    if reader is None:
+        reader = local_reader(path)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": content_disposition(filename),
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "Content-Disposition"})
+
+    range_header = request.headers.get("range")
+    ranges = None
+    if range_header and _if_range_ok(request, etag, last_modified):
+        ranges = parse_range(range_header, size)
+        if ranges == []:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", "Accept-Ranges": "bytes"})
+
+    if not ranges:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(reader(0, size), media_type=media_type, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(reader(start, end - start + 1), status_code=206, media_type=media_type, headers=headers)
+
+    boundary = uuid.uuid4().hex
+    part_heads = [
+        (f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n").encode()
+        for start, end in ranges
+    ]
+    tail = f"--{boundary}--\r\n".encode()
+    length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(part_heads, ranges)) + len(tail)
+
+    async def body():
+        for head, (start, end) in zip(part_heads, ranges):
+            yield head
+            async for chunk in reader(start, end - start + 1):
+                yield chunk
+            yield b"\r\n"
+        yield tail
+
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(body(), status_code=206, media_type=f"multipart/byteranges; boundary={boundary}", headers=headers)
+
+class SendfileResponse(Response):
+    """
+        Whole-file 200 response. Uses the ASGI `http.response.zerocopy` extension (the server calls
+        os.sendfile on the socket) or `http.response.pathsend` when the server advertises them,
+        otherwise falls back to chunked reads off the event loop.
+    """
+    def __init__(self, path: str, size: int, media_type: str, headers: Optional[dict] = None):
+        self.path = os.path.abspath(path)
+        self.size = size
+        headers = dict(headers or {})
+        headers["Content-Length"] = str(size)
+        super().__init__(status_code=200, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope, receive, send):
+        extensions = scope.get("extensions") or {}
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopy" in extensions:
+            f = await asyncio.to_thread(open, self.path, "rb")
+            try:
+                await send({"type": "http.response.zerocopy", "file": f, "offset": 0, "count": self.size, "more_body": False})
+            finally:
+                await asyncio.to_thread(f.close)
+        elif "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": self.path})
+        else:
+            async for chunk in local_reader(self.path)(0, self.size):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,91 @@
+"""
+    Server-side Gantt view. The schedule tree is loaded and rolled up once (schedule_tree), collapsed to the
+    requested depth (plus explicitly expanded items), and only one page of visible rows is returned. Each
+    row carries its rolled-up envelope and progress and its coverage of week or month buckets over the
+    visible window: the fraction of each bucket the bar occupies, from the first bucket it touches. The
+    payload grows with rows on screen x buckets on screen, not with the schedule.
+"""
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import Iterator, Optional
+
+from .schedule_tree import Node, ScheduleTree
+
+MAX_BUCKETS = 370
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+def _next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+def buckets(start: date, end: date, unit: str) -> list[tuple[date, date]]:
+    """Half-open [from, to) buckets covering start..end (inclusive), aligned to Mondays or month starts."""
+    out = []
+    cur = _month_start(start) if unit == "month" else start - timedelta(days=start.weekday())
+    while cur <= end and len(out) < MAX_BUCKETS:
+        nxt = _next_month(cur) if unit == "month" else cur + timedelta(days=7)
+        out.append((cur, nxt))
+        cur = nxt
+    return out
+
+def coverage(start: Optional[date], end: Optional[date], bks: list[tuple[date, date]], starts: list[date]) -> Optional[dict]:
+    """{"from": first bucket index, "values": [fraction of each bucket covered]} for the bar start..end."""
+    if start is None or end is None or not bks or end < bks[0][0] or start >= bks[-1][1]:
+        return None
+    stop = end + timedelta(days=1)
+    first = max(bisect_right(starts, start) - 1, 0)
+    values = []
+    for lo, hi in bks[first:]:
+        if lo >= stop:
+            break
+        overlap = (min(hi, stop) - max(lo, start)).days
+        values.append(round(max(overlap, 0) / (hi - lo).days, 3))
+    return {"from": first, "values": values}
+
+def visible(tree: ScheduleTree, depth: int, expand: set[int]) -> Iterator[Node]:
+    """Display-order walk that only descends below `depth` into expanded items."""
+    stack = list(reversed(tree.roots))
+    while stack:
+        n = stack.pop()
+        yield n
+        if n.children and (n.depth + 1 < depth or n.id in expand):
+            stack.extend(reversed(n.children))
+
+async def view(db, contract_id: int, depth: int = 2, expand: Optional[set[int]] = None, start: Optional[date] = None,
+               end: Optional[date] = None, unit: str = "week", offset: int = 0, limit: int = 200) -> dict:
+    expand = expand or set()
+    tree = await ScheduleTree.load(db, contract_id)
+    tree.recompute()
+    root_starts = [n.planned_start for n in tree.roots if n.planned_start]
+    root_ends = [n.planned_end for n in tree.roots if n.planned_end]
+    project = (min(root_starts) if root_starts else None, max(root_ends) if root_ends else None)
+    start = start or project[0] or date.today()
+    end = end or project[1] or start
+    if end < start:
+        start, end = end, start
+    bks = buckets(start, end, unit)
+    bucket_starts = [lo for lo, _ in bks]
+
+    rows, total = [], 0
+    for n in visible(tree, depth, expand):
+        total += 1
+        if total <= offset or len(rows) >= limit:
+            continue
+        expanded = bool(n.children) and (n.depth + 1 < depth or n.id in expand)
+        rows.append({
+            "id": n.id, "parent_id": n.parent_id, "title": n.title, "depth": n.depth,
+            "has_children": bool(n.children), "expanded": expanded,
+            "planned_start": n.planned_start, "planned_end": n.planned_end,
+            "actual_start": n.actual_start, "actual_end": n.actual_end, "progress": n.progress,
+            "planned": coverage(n.planned_start, n.planned_end, bks, bucket_starts),
+            "actual": coverage(n.actual_start, n.actual_end or (date.today() if n.actual_start else None), bks, bucket_starts),
+        })
+    return {
+        "window": {"start": start, "end": end, "unit": unit},
+        "project": {"start": project[0], "end": project[1]},
+        "buckets": [{"start": lo, "end": hi - timedelta(days=1)} for lo, hi in bks],
+        "total_rows": total,
+        "offset": offset,
+        "rows": rows,
+    }
@@ -0,0 +1,89 @@
+"""Periodic background jobs and worker queues, started and stopped with the app (see main.py)."""
+import asyncio, logging
+from typing import Awaitable, Callable
+
+log = logging.getLogger(__name__)
+
+_jobs: list[tuple[str, float, Callable[[], Awaitable[None]]]] = []
+_queues: list["WorkQueue"] = []
+_tasks: list[asyncio.Task] = []
+_shutdown: list[Callable[[], Awaitable[None]]] = []
+
+def every(seconds: float, name: str | None = None):
+    """Register `async def fn()` to run every `seconds` once the app has started."""
+    def deco(fn):
+        _jobs.append((name or fn.__name__, seconds, fn))
+        return fn
+    return deco
+
+def at_shutdown(fn):
+    """Register `async def fn()` to run once on shutdown, after the jobs and workers are cancelled."""
+    _shutdown.append(fn)
+    return fn
+
+async def _loop(name: str, seconds: float, fn: Callable[[], Awaitable[None]]):
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("background job %s failed", name)
+
+class WorkQueue:
+    """
+        Bounded queue drained by `workers` tasks calling `await handler(item)`.
+        Items submitted before startup wait in the queue; when it is full new items are dropped.
+    """
+    def __init__(self, name: str, handler: Callable[[object], Awaitable[None]], workers: int = 2, maxsize: int = 1000):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue | None = None
+        _queues.append(self)
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.maxsize)
+        return self._queue
+
+    def submit(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            log.warning("work queue %s is full, dropping %r", self.name, item)
+            return False
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self.handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("work queue %s failed on %r", self.name, item)
+            finally:
+                self.queue.task_done()
+
+def start():
+    for name, seconds, fn in _jobs:
+        _tasks.append(asyncio.create_task(_loop(name, seconds, fn), name=name))
+    for q in _queues:
+        for i in range(max(1, q.workers)):
+            _tasks.append(asyncio.create_task(q._worker(), name=f"{q.name}-{i}"))
+
+async def stop():
+    for t in _tasks:
+        t.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    for fn in _shutdown:
+        try:
+            await fn()
+        except Exception:
+            log.exception("shutdown hook %s failed", fn.__name__)
@@ -2,9 +2,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import config
 from app.db import engine, Base
+from app import jobs
 from app.routers import auth, projects, admin, contracts, finance, helpdesk, qa, safety, library, hr, recruitment, tasks, leave_request, timesheet, contact_directory, ticket, cute
 from app.routers.schedule import router as schedule_router
 from app.routers.files_ext import router as files_ext_router
+from app.routers.search import router as search_router
+from app.routers.shares import router as shares_router
 from app.routers.usersprofile import router as userprofile
 
 app = FastAPI(title=config.app.name, debug=config.app.debug)
@@ -21,6 +24,11 @@ app.add_middleware(
 async def on_startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    jobs.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await jobs.stop()
 
 # Include routers (each only once)
 app.include_router(auth.router)
@@ -37,6 +45,8 @@ app.include_router(recruitment.router)
 app.include_router(tasks.router)
 app.include_router(schedule_router)
 app.include_router(files_ext_router)
+app.include_router(search_router)
+app.include_router(shares_router)
 app.include_router(userprofile)
 app.include_router(leave_request.router)
 app.include_router(timesheet.router)
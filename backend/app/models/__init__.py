@@ -1,5 +1,5 @@
 from .models import Role, User, UserProfile, Office, Contract, UserFavorite, ContractAccess, ContractClientToken, LeaveRequest, Timesheet, Budget, Invoice, QAChecklist, SafetyReport, EnvironmentReport, HelpdeskTicket, Client, FileShare, FileDownloadLog, LibraryCategory, LibraryItem, ProjectMessage, ProjectFile, Holiday, Task,ContactDirectory
-from .models_files import ProjectFileVersion, ProjectFolderPermission
-from .models_schedule import ProjectFolder, ProjectScheduleItem
+from .models_files import ProjectFileVersion, ProjectFolderPermission, FolderPermissionStamp, StorageBlob, UploadSession, UploadSessionChunk, ContractStorageUsage, FolderStorageUsage, RetentionPolicy
+from .models_schedule import ProjectFolder, ProjectFolderClosure, ProjectFolderClosureReady, ProjectScheduleItem, ScheduleDependency, ScheduleBaseline, ScheduleBaselineItem
 from .recruitment import Recruitment
 from .models import Cute
\ No newline at end of file
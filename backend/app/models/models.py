@@ -1,15 +1,12 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Column, Integer, String, DateTime, Date, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, Boolean, ForeignKey, Index, Computed
 from sqlalchemy import Date, Enum
 from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime, date
-from sqlalchemy.ext.declarative import declarative_base
 from ..db import Base
 import enum
 
 
-Base = declarative_base() 
-
 class Role(Base):
     __tablename__ = "roles"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -239,7 +236,7 @@ class FileShare(Base):
     stored_path: Mapped[str] = mapped_column(String(1000))
     size_bytes: Mapped[int]
     mime_type: Mapped[str | None] = mapped_column(String(100))
-    token: Mapped[str] = mapped_column(String(255))
+    token: Mapped[str] = mapped_column(String(255), index=True)
     downloads: Mapped[int] = mapped_column(default=0)
     last_download_at: Mapped[datetime | None]
 
@@ -265,6 +262,7 @@ class LibraryItem(Base):
     category_id: Mapped[int | None]
     title: Mapped[str] = mapped_column(String(255))
     path: Mapped[str] = mapped_column(String(1000))
+    sha256: Mapped[str | None] = mapped_column(String(64), index=True)
     uploaded_by: Mapped[int | None]
 
 
@@ -280,16 +278,29 @@ class ProjectMessage(Base):
 
 class ProjectFile(Base):
     __tablename__ = "project_files"
+    # back the keyset-paginated folder listing, one per sort key (InnoDB appends id to the key)
+    __table_args__ = (
+        Index("ix_project_files_folder_name", "contract_id", "folder", "deleted_at", "original_name"),
+        Index("ix_project_files_folder_size", "contract_id", "folder", "deleted_at", "size_bytes"),
+        Index("ix_project_files_folder_uploaded", "contract_id", "folder", "deleted_at", "uploaded_at"),
+        Index("ix_project_files_folder_revision", "contract_id", "folder", "deleted_at", "revision_sort"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     contract_id: Mapped[int] = mapped_column(
         ForeignKey("contracts.id", ondelete="CASCADE")
     )
     original_name: Mapped[str] = mapped_column(String(255))
     stored_path: Mapped[str] = mapped_column(String(500))
+    sha256: Mapped[str | None] = mapped_column(String(64), index=True)
     content_type: Mapped[str | None] = mapped_column(String(100))
     size_bytes: Mapped[int] = mapped_column(default=0)
+    # NULL = project root
     folder: Mapped[str | None] = mapped_column(String(255))
     description: Mapped[str | None] = mapped_column(Text)
+    # highest ProjectFileVersion.revision_no; NULL until backfilled
+    latest_revision_no: Mapped[int | None] = mapped_column(Integer)
+    # listing sort key: not-yet-backfilled rows count as revision 1
+    revision_sort: Mapped[int] = mapped_column(Integer, Computed("COALESCE(latest_revision_no, 1)", persisted=True))
     uploaded_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
     deleted_at: Mapped[datetime | None] = mapped_column(DateTime)
 
@@ -310,12 +321,17 @@ class Task(Base):
     description: Mapped[str | None] = mapped_column(Text)
     status: Mapped[str] = mapped_column(String(20), default="todo")
     order_index: Mapped[int] = mapped_column(default=0)
+    # fractional rank within the (user, status) column (see app.ranking)
+    sort_key: Mapped[str | None] = mapped_column(String(64, collation="utf8mb4_bin"), nullable=True)
     color: Mapped[str | None] = mapped_column(String(16))
     deadline: Mapped[date | None] = mapped_column(Date)
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
         default=datetime.utcnow, onupdate=datetime.utcnow
-)
+    )
+
+    __table_args__ = (Index("ix_tasks_column_key", "user_id", "status", "sort_key"),)
+
 class Ticket(Base):
     __tablename__ = "tickets"
 
@@ -1,6 +1,6 @@
 
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, String, ForeignKey, DateTime, BigInteger
+from sqlalchemy import Integer, String, ForeignKey, DateTime, BigInteger, Boolean
 from datetime import datetime
 from ..db import Base
 
@@ -10,6 +10,7 @@ class ProjectFileVersion(Base):
     file_id: Mapped[int] = mapped_column(ForeignKey("project_files.id", ondelete="CASCADE"), index=True)
     revision_no: Mapped[int] = mapped_column(Integer, default=1)
     stored_path: Mapped[str] = mapped_column(String(500))
+    sha256: Mapped[str | None] = mapped_column(String(64), index=True)
     content_type: Mapped[str | None] = mapped_column(String(100))
     size_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
     uploaded_by: Mapped[int | None] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"))
@@ -24,3 +25,79 @@ class ProjectFolderPermission(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     can_read: Mapped[int] = mapped_column(Integer, default=1)   # 0/1
     can_write: Mapped[int] = mapped_column(Integer, default=0)  # 0/1
+
+
+class FolderPermissionStamp(Base):
+    __tablename__ = "project_permission_stamps"
+    contract_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # bumped in the transaction of every permission or folder tree change; cached matrices compare it
+    version: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class StorageBlob(Base):
+    __tablename__ = "storage_blobs"
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    stored_path: Mapped[str] = mapped_column(String(500))
+    size_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0, index=True)
+    contract_id: Mapped[int | None] = mapped_column(Integer, nullable=True)  # contract that stored it first (usage accounting)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    unreferenced_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # "hot" = plain file at stored_path; "cold" = compressed copy at cold_path (see blobstore.freeze)
+    tier: Mapped[str] = mapped_column(String(8), default="hot")
+    cold_path: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    codec: Mapped[str | None] = mapped_column(String(8), nullable=True)
+    cold_size_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)  # uuid4 hex
+    contract_id: Mapped[int] = mapped_column(Integer, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    folder: Mapped[str | None] = mapped_column(String(255))
+    filename: Mapped[str] = mapped_column(String(255))
+    content_type: Mapped[str | None] = mapped_column(String(100))
+    total_size: Mapped[int] = mapped_column(BigInteger)
+    replace_file_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class UploadSessionChunk(Base):
+    __tablename__ = "upload_session_chunks"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    session_id: Mapped[str] = mapped_column(ForeignKey("upload_sessions.id", ondelete="CASCADE"), index=True)
+    offset: Mapped[int] = mapped_column(BigInteger)
+    length: Mapped[int] = mapped_column(BigInteger)
+    # one object per received chunk on the storage backend, so any node can finalize the session
+    stored_path: Mapped[str] = mapped_column(String(500))
+
+
+class ContractStorageUsage(Base):
+    __tablename__ = "contract_storage_usage"
+    contract_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bytes_used: Mapped[int] = mapped_column(BigInteger, default=0)
+    file_count: Mapped[int] = mapped_column(Integer, default=0)
+    version_count: Mapped[int] = mapped_column(Integer, default=0)
+    blob_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+    quota_bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+
+
+class FolderStorageUsage(Base):
+    __tablename__ = "folder_storage_usage"
+    contract_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    folder_id: Mapped[int] = mapped_column(Integer, primary_key=True)  # 0 = project root
+    bytes_used: Mapped[int] = mapped_column(BigInteger, default=0)
+    file_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class RetentionPolicy(Base):
+    __tablename__ = "file_retention_policies"
+    contract_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    enabled: Mapped[bool] = mapped_column(Boolean, default=True)
+    # the newest N revisions of every file (and the current file) always stay hot
+    keep_hot_revisions: Mapped[int] = mapped_column(Integer, default=3)
+    # older revisions go cold once they are at least this old
+    cold_after_days: Mapped[int] = mapped_column(Integer, default=30)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
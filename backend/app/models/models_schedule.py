@@ -1,6 +1,6 @@
 
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Date, Integer, ForeignKey, DateTime
+from sqlalchemy import String, Date, Integer, ForeignKey, DateTime, Index, Boolean, UniqueConstraint
 from datetime import datetime, date
 from ..db import Base
 
@@ -14,6 +14,21 @@ class ProjectFolder(Base):
     path: Mapped[str] = mapped_column(String(1000), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_project_folders_parent_name", "contract_id", "parent_id", "name"),)
+
+class ProjectFolderClosure(Base):
+    """Ancestor index over project_folders: one row per (ancestor, descendant) pair, including depth-0 self rows."""
+    __tablename__ = "project_folder_closure"
+    ancestor_id: Mapped[int] = mapped_column(ForeignKey("project_folders.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id: Mapped[int] = mapped_column(ForeignKey("project_folders.id", ondelete="CASCADE"), primary_key=True, index=True)
+    depth: Mapped[int] = mapped_column(Integer, default=0)
+
+class ProjectFolderClosureReady(Base):
+    """Contracts whose closure rows are known to be complete (checked or built once, then trusted by every worker)."""
+    __tablename__ = "project_folder_closure_ready"
+    contract_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    built_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 class ProjectScheduleItem(Base):
     __tablename__ = "project_schedule_items"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -26,5 +41,52 @@ class ProjectScheduleItem(Base):
     actual_end: Mapped[date | None] = mapped_column(Date, nullable=True)
     progress: Mapped[int] = mapped_column(Integer, default=0)
     sort_index: Mapped[int] = mapped_column(Integer, default=0)
+    # fractional rank among siblings (see app.ranking); binary collation so keys compare bytewise
+    sort_key: Mapped[str | None] = mapped_column(String(64, collation="utf8mb4_bin"), nullable=True)
+    # critical path results for leaf activities (written by app.cpm)
+    early_start: Mapped[date | None] = mapped_column(Date, nullable=True)
+    early_finish: Mapped[date | None] = mapped_column(Date, nullable=True)
+    late_start: Mapped[date | None] = mapped_column(Date, nullable=True)
+    late_finish: Mapped[date | None] = mapped_column(Date, nullable=True)
+    total_float: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    critical: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_schedule_items_sibling_key", "contract_id", "parent_id", "sort_key"),)
+
+class ScheduleDependency(Base):
+    """Logic link between two schedule items: FS / SS / FF / SF with a lag in days (negative = lead)."""
+    __tablename__ = "project_schedule_dependencies"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    contract_id: Mapped[int] = mapped_column(ForeignKey("contracts.id", ondelete="CASCADE"), index=True)
+    predecessor_id: Mapped[int] = mapped_column(ForeignKey("project_schedule_items.id", ondelete="CASCADE"))
+    successor_id: Mapped[int] = mapped_column(ForeignKey("project_schedule_items.id", ondelete="CASCADE"), index=True)
+    type: Mapped[str] = mapped_column(String(2), default="FS")
+    lag_days: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint("predecessor_id", "successor_id", name="uq_schedule_dependency_pair"),)
+
+class ScheduleBaseline(Base):
+    """Immutable snapshot of a contract's schedule items (rows in schedule_baseline_items)."""
+    __tablename__ = "schedule_baselines"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    contract_id: Mapped[int] = mapped_column(ForeignKey("contracts.id", ondelete="CASCADE"), index=True)
+    name: Mapped[str] = mapped_column(String(255))
+    item_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_by: Mapped[int | None] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class ScheduleBaselineItem(Base):
+    """One item as it stood when the baseline was taken; item_id is kept without a FK so deletions survive."""
+    __tablename__ = "schedule_baseline_items"
+    baseline_id: Mapped[int] = mapped_column(ForeignKey("schedule_baselines.id", ondelete="CASCADE"), primary_key=True)
+    item_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    parent_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    title: Mapped[str] = mapped_column(String(255))
+    planned_start: Mapped[date | None] = mapped_column(Date, nullable=True)
+    planned_end: Mapped[date | None] = mapped_column(Date, nullable=True)
+    actual_start: Mapped[date | None] = mapped_column(Date, nullable=True)
+    actual_end: Mapped[date | None] = mapped_column(Date, nullable=True)
+    progress: Mapped[int] = mapped_column(Integer, default=0)
@@ -0,0 +1,194 @@
+"""
+    Project file access: contract membership and per-user folder permissions.
+
+    A user's effective (can_read, can_write) for every folder of a contract is resolved in memory from
+    their permission rows and the folder tree, and cached per process. The cache is keyed by the
+    contract's row in project_permission_stamps, which every permission or folder tree change bumps in
+    its own transaction, so a change made through any worker applies to the next request everywhere.
+    The cache is bounded: least recently used contracts, and users within a contract, are evicted.
+"""
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models.models import ContractAccess, User
+from .models.models_files import ProjectFolderPermission, FolderPermissionStamp
+from .models.models_schedule import ProjectFolder
+from .usage import ROOT_FOLDER
+
+async def can_access(db: AsyncSession, user: User, project_id: int) -> bool:
+    if getattr(user, "role_id", None) == 1:
+        return True
+    res = await db.execute(select(ContractAccess).where(ContractAccess.contract_id == project_id, ContractAccess.user_id == user.id))
+    return res.scalar_one_or_none() is not None
+
+async def folder_id_from_path(db: AsyncSession, contract_id: int, path: str | None, strict: bool = True) -> int | None:
+    """
+        Folder id of a folder path, None for the project root ('' / None). Matched on the indexed path
+        column, so it compares like the column collation (case-insensitive) and names containing '/'
+        resolve. A path that names no folder raises 404 rather than falling back to the root's
+        permissions; strict=False counts it as the root instead (usage accounting, as usage.recount does).
+    """
+    if not path:
+        return None
+    res = await db.execute(select(ProjectFolder.id).where(ProjectFolder.contract_id == contract_id, ProjectFolder.path == path).limit(1))
+    fid = res.scalar_one_or_none()
+    if fid is None and strict:
+        raise HTTPException(404, "Folder not found")
+    return fid
+
+class FolderPermMatrix:
+    """
+        Effective (can_read, can_write) of one user for every folder of a contract.
+        Built from two queries (folders + the user's permission rows), inheritance resolved in memory.
+    """
+    def __init__(self, enabled: bool, parents: dict[int, int | None], explicit: dict[int | None, tuple[bool, bool]]):
+        self.enabled = enabled
+        self._parents = parents
+        self._explicit = explicit
+        self._resolved: dict[int, tuple[bool, bool]] = {}
+        if enabled:
+            self._resolve_all()
+
+    def _resolve_all(self):
+        root = self._explicit.get(None, (False, False))
+        for fid in self._parents:
+            if fid in self._resolved:
+                continue
+            # walk up until an explicit entry or an already resolved ancestor; a cycle falls back to root
+            pending, seen = [], set()
+            perm = root
+            current = fid
+            while current is not None and current not in seen:
+                if current in self._resolved:
+                    perm = self._resolved[current]
+                    break
+                if current in self._explicit:
+                    perm = self._explicit[current]
+                    self._resolved[current] = perm
+                    break
+                pending.append(current)
+                seen.add(current)
+                if current not in self._parents:
+                    break
+                current = self._parents[current]
+            for p in pending:
+                self._resolved[p] = perm
+
+    def get(self, folder_id: int | None) -> tuple[bool, bool]:
+        if not self.enabled:
+            return True, True
+        if folder_id is None:
+            return self._explicit.get(None, (False, False))
+        perm = self._resolved.get(folder_id)
+        if perm is None:
+            # folder unknown to this contract: explicit entry or root fallback
+            perm = self._explicit.get(folder_id) or self._explicit.get(None, (False, False))
+        return perm
+
+    def readable(self) -> list[int]:
+        """Ids of the folders this user can read, ROOT_FOLDER standing for the project root (enabled matrices)."""
+        out = [fid for fid, (can_read, _) in self._resolved.items() if can_read]
+        if self._explicit.get(None, (False, False))[0]:
+            out.append(ROOT_FOLDER)
+        return out
+
+# everything allowed: admins
+ALLOW_ALL = FolderPermMatrix(False, {}, {})
+
+# contract_id -> user_id -> (stamp, matrix), both levels in LRU order; reused while the contract's stamp is unchanged
+_PERM_CACHE: OrderedDict[int, OrderedDict[int, tuple[int, FolderPermMatrix]]] = OrderedDict()
+_CACHE_CONTRACTS = 256
+_CACHE_USERS = 64
+
+def _cache_get(contract_id: int, user_id: int) -> tuple[int, FolderPermMatrix] | None:
+    users = _PERM_CACHE.get(contract_id)
+    if users is None or user_id not in users:
+        return None
+    _PERM_CACHE.move_to_end(contract_id)
+    users.move_to_end(user_id)
+    return users[user_id]
+
+def _cache_put(contract_id: int, user_id: int, entry: tuple[int, FolderPermMatrix]):
+    users = _PERM_CACHE.get(contract_id)
+    if users is None:
+        users = _PERM_CACHE[contract_id] = OrderedDict()
+        if len(_PERM_CACHE) > _CACHE_CONTRACTS:
+            _PERM_CACHE.popitem(last=False)
+    _PERM_CACHE.move_to_end(contract_id)
+    users[user_id] = entry
+    users.move_to_end(user_id)
+    if len(users) > _CACHE_USERS:
+        users.popitem(last=False)
+
+async def bump(db: AsyncSession, contract_id: int):
+    """Invalidate the cached permission matrices of a contract in every process; call before the commit."""
+    _PERM_CACHE.pop(contract_id, None)
+    stamp = update(FolderPermissionStamp).where(FolderPermissionStamp.contract_id == contract_id).values(version=FolderPermissionStamp.version + 1)
+    res = await db.execute(stamp)
+    if res.rowcount:
+        return
+    try:
+        async with db.begin_nested():
+            db.add(FolderPermissionStamp(contract_id=contract_id, version=1))
+    except IntegrityError:
+        # created concurrently
+        await db.execute(stamp)
+
+async def perm_matrix(db: AsyncSession, contract_id: int, user: User) -> FolderPermMatrix:
+    # read first: the permission rows below come from the same snapshot as the stamp
+    res = await db.execute(select(FolderPermissionStamp.version).where(FolderPermissionStamp.contract_id == contract_id))
+    stamp = res.scalar_one_or_none() or 0
+    hit = _cache_get(contract_id, user.id)
+    if hit and hit[0] == stamp:
+        return hit[1]
+    res = await db.execute(select(ProjectFolderPermission.folder_id, ProjectFolderPermission.can_read, ProjectFolderPermission.can_write).where(ProjectFolderPermission.contract_id == contract_id, ProjectFolderPermission.user_id == user.id))
+    explicit: dict[int | None, tuple[bool, bool]] = {}
+    for folder_id, can_read, can_write in res.all():
+        explicit.setdefault(folder_id, (bool(can_read), bool(can_write)))
+    enabled = bool(explicit)
+    if not enabled:
+        res = await db.execute(select(ProjectFolderPermission.id).where(ProjectFolderPermission.contract_id == contract_id).limit(1))
+        enabled = res.first() is not None
+    parents: dict[int, int | None] = {}
+    if enabled:
+        res = await db.execute(select(ProjectFolder.id, ProjectFolder.parent_id).where(ProjectFolder.contract_id == contract_id))
+        parents = {fid: pid for fid, pid in res.all()}
+    matrix = FolderPermMatrix(enabled, parents, explicit)
+    _cache_put(contract_id, user.id, (stamp, matrix))
+    return matrix
+
+async def user_matrix(db: AsyncSession, contract_id: int, user: User) -> FolderPermMatrix:
+    """perm_matrix with the admin bypass: resolve once, then matrix.get(folder_id) per folder without queries."""
+    if getattr(user, "role_id", None) == 1:
+        return ALLOW_ALL
+    return await perm_matrix(db, contract_id, user)
+
+async def effective_perm(db: AsyncSession, contract_id: int, user: User, folder_id: int | None) -> tuple[bool, bool]:
+    """
+        Return (can_read, can_write) for user on folder (inherit up the tree). Admin bypasses.
+        If the project has no permission rows, default to (True, True) for project members.
+        No explicit entry on the folder, its ancestors or the root => deny.
+    """
+    matrix = await user_matrix(db, contract_id, user)
+    return matrix.get(folder_id)
+
+async def readable_scope(db: AsyncSession, user: User, contract_id: int | None = None) -> dict[int, list[int] | None] | None:
+    """
+        What a user can read across projects (or in `contract_id` only), for filtering inside a query:
+        {contract_id: None (every folder) or [readable folder ids]}. None means unrestricted (admin).
+    """
+    if getattr(user, "role_id", None) == 1:
+        return None if contract_id is None else {contract_id: None}
+    q = select(ContractAccess.contract_id).where(ContractAccess.user_id == user.id)
+    if contract_id is not None:
+        q = q.where(ContractAccess.contract_id == contract_id)
+    res = await db.execute(q)
+    scope: dict[int, list[int] | None] = {}
+    for cid in set(res.scalars().all()):
+        matrix = await perm_matrix(db, cid, user)
+        scope[cid] = matrix.readable() if matrix.enabled else None
+    return scope
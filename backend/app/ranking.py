@@ -0,0 +1,166 @@
+"""
+    Fractional rank keys for manually ordered lists (schedule siblings, kanban columns).
+
+    A rank is a base-62 string compared bytewise (the column uses a binary collation); a key can always
+    be minted strictly between two neighbours, so moving an item rewrites only that item's row. Keys
+    never end in '0', which keeps "between" well defined. Repeated inserts at the same spot make keys
+    grow by about one character per ~6 halvings; appending at the end increments the leading digits
+    instead, so a key grows by one character per ~60 appends. `rebalance` rewrites over-long groups
+    with short, evenly spaced keys.
+"""
+import logging
+from typing import Hashable, Iterable, Optional, Sequence
+
+from sqlalchemy import select, update, func, or_
+
+from .db import SessionLocal
+from .models.models import Task
+from .models.models_schedule import ProjectScheduleItem
+from . import jobs
+
+log = logging.getLogger(__name__)
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+_INDEX = {c: i for i, c in enumerate(DIGITS)}
+REBALANCE_LENGTH = 24
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    """A key strictly between a and b ('' = start, None = end); neither may end in '0'."""
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    lo = _INDEX[a[0]] if a else 0
+    hi = _INDEX[b[0]] if b is not None else BASE
+    if hi - lo > 1:
+        return DIGITS[(lo + hi) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[lo] + _midpoint(a[1:], None)
+
+def _increment(a: str) -> str:
+    """The shortest key above a: a prefix of a with its first digit below 'z' bumped, else a + '1'."""
+    for i, c in enumerate(a):
+        if c != DIGITS[-1]:
+            return a[:i] + DIGITS[_INDEX[c] + 1]
+    return a + DIGITS[1]
+
+def between(before: Optional[str], after: Optional[str]) -> str:
+    """Rank for an item placed after `before` and before `after` (None = list start / end)."""
+    a, b = before or "", after or None
+    if b is not None and a >= b:
+        raise ValueError(f"rank {a!r} is not below {b!r}")
+    if b is None and a:
+        return _increment(a)
+    return _midpoint(a, b)
+
+def first(after: Optional[str] = None) -> str:
+    return between(None, after)
+
+def last(before: Optional[str] = None) -> str:
+    return between(before, None)
+
+def spread(n: int) -> list[str]:
+    """`n` evenly spaced keys of the smallest sufficient length, in ascending order."""
+    if n <= 0:
+        return []
+    width, span = 1, BASE
+    while span <= n:
+        width, span = width + 1, span * BASE
+    out = []
+    for i in range(1, n + 1):
+        v, digits = i * span // (n + 1), []
+        for _ in range(width):
+            v, d = divmod(v, BASE)
+            digits.append(DIGITS[d])
+        out.append("".join(reversed(digits)).rstrip("0"))
+    return out
+
+def append(before: Optional[str], n: int) -> list[str]:
+    """`n` evenly spaced keys after `before` (None = empty list), in ascending order, for a batch of appends."""
+    prefix = _increment(before) if before else ""
+    return [prefix + k for k in spread(n)]
+
+def place(keys: Sequence[Optional[str]], index: int) -> str:
+    """Rank for inserting at `index` into a list whose current ranks are `keys` (ascending)."""
+    before = keys[index - 1] if index > 0 else None
+    after = keys[index] if index < len(keys) else None
+    return between(before, after)
+
+# ---------- moves ----------
+
+def apply_moves(groups: dict[Hashable, list[list]], moves: Iterable[tuple]) -> dict:
+    """
+        Apply drag-and-drop moves in order against in-memory lists.
+
+        `groups` maps a group (sibling list / kanban column) to its rows as [id, key] in display order;
+        `moves` are (id, target_group, after_id, before_id) with after/before naming the neighbour
+        (neither = end of list). Returns {id: (group, key)} for the rows whose position changed:
+        normally just the moved rows, plus a whole group when its keys had to be re-spaced (NULL or
+        duplicate keys, or a new key longer than REBALANCE_LENGTH, so the column never overflows).
+    """
+    where = {row[0]: g for g, rows in groups.items() for row in rows}
+    changed: dict = {}
+    for item_id, target, after_id, before_id in moves:
+        if item_id not in where:
+            continue
+        rows = groups[where[item_id]]
+        row = next(r for r in rows if r[0] == item_id)
+        rows.remove(row)
+        dest = groups.setdefault(target, [])
+        ids = [r[0] for r in dest]
+        if after_id is not None and after_id in ids:
+            idx = ids.index(after_id) + 1
+        elif before_id is not None and before_id in ids:
+            idx = ids.index(before_id)
+        else:
+            idx = len(dest)
+        dest.insert(idx, row)
+        where[item_id] = target
+        keys = [r[1] for r in dest]
+        try:
+            if None in keys[:idx] or None in keys[idx + 1:]:
+                raise ValueError("unranked rows")
+            key = place(keys[:idx] + keys[idx + 1:], idx)
+            if len(key) > REBALANCE_LENGTH:
+                raise ValueError("rank too long")
+            row[1] = key
+            changed[item_id] = (target, key)
+        except ValueError:
+            for r, k in zip(dest, spread(len(dest))):
+                r[1] = k
+                changed[r[0]] = (target, k)
+    return changed
+
+# ---------- rebalancing ----------
+
+async def _rebalance_groups(db, model, group_cols, order_cols) -> int:
+    """Rewrite every group with over-long or missing keys; one executemany per group."""
+    res = await db.execute(select(*group_cols).group_by(*group_cols)
+                           .having(or_(func.max(func.char_length(model.sort_key)) > REBALANCE_LENGTH,
+                                       func.count() > func.count(model.sort_key))))
+    groups = res.all()
+    for group in groups:
+        cond = [c.is_(None) if v is None else c == v for c, v in zip(group_cols, group)]
+        res = await db.execute(select(model.id).where(*cond).order_by(model.sort_key, *order_cols, model.id))
+        ids = res.scalars().all()
+        await db.execute(update(model), [{"id": i, "sort_key": k} for i, k in zip(ids, spread(len(ids)))])
+    return len(groups)
+
+async def rebalance() -> dict:
+    """Re-space over-long (or missing) rank keys in schedule sibling lists and kanban columns."""
+    async with SessionLocal() as db:
+        P = ProjectScheduleItem
+        items = await _rebalance_groups(db, P, (P.contract_id, P.parent_id), (P.sort_index,))
+        tasks = await _rebalance_groups(db, Task, (Task.user_id, Task.status), (Task.order_index,))
+        await db.commit()
+    return {"schedule_groups": items, "task_groups": tasks}
+
+@jobs.every(24 * 3600, name="rank_rebalance")
+async def _rebalance_job():
+    report = await rebalance()
+    if report["schedule_groups"] or report["task_groups"]:
+        log.info("ranking: rebalanced %d schedule and %d task groups", report["schedule_groups"], report["task_groups"])
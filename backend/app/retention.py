@@ -0,0 +1,103 @@
+"""
+    Revision retention: per-project policies keep the newest revisions of every file on hot storage and
+    move older revision blobs to the compressed cold tier (blobstore.freeze). Runs as a background job;
+    downloads of cold revisions decompress on the fly and a restore thaws the blob again.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from .db import SessionLocal
+from .models.models import ProjectFile
+from .models.models_files import ProjectFileVersion, RetentionPolicy, StorageBlob
+from . import blobstore, jobs
+
+log = logging.getLogger(__name__)
+
+_BATCH = 200
+
+@dataclass
+class CompactionReport:
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    candidates: int = 0
+    frozen: int = 0
+    bytes_saved: int = 0
+    errors: list[str] = field(default_factory=list)
+
+def _is_old(policy: RetentionPolicy | None, revision_no: int, latest: int | None, uploaded_at: datetime | None, now: datetime) -> bool:
+    # no policy (or a disabled one) keeps everything hot
+    if policy is None or not policy.enabled or latest is None:
+        return False
+    if revision_no > latest - max(policy.keep_hot_revisions, 1):
+        return False
+    return uploaded_at is None or uploaded_at <= now - timedelta(days=max(policy.cold_after_days, 0))
+
+async def _candidates(db, policies: dict[int, RetentionPolicy], now: datetime) -> list[str]:
+    """Hot blobs whose every referencing version is old under its own project's policy."""
+    found: set[str] = set()
+    for policy in policies.values():
+        if not policy.enabled:
+            continue
+        cutoff = now - timedelta(days=max(policy.cold_after_days, 0))
+        res = await db.execute(
+            select(ProjectFileVersion.sha256).distinct()
+            .join(ProjectFile, ProjectFile.id == ProjectFileVersion.file_id)
+            .join(StorageBlob, StorageBlob.sha256 == ProjectFileVersion.sha256)
+            .where(ProjectFile.contract_id == policy.contract_id, ProjectFile.deleted_at.is_(None),
+                   ProjectFile.latest_revision_no.is_not(None),
+                   ProjectFileVersion.revision_no <= ProjectFile.latest_revision_no - max(policy.keep_hot_revisions, 1),
+                   ProjectFileVersion.uploaded_at <= cutoff,
+                   StorageBlob.tier == "hot", StorageBlob.ref_count > 0, StorageBlob.stored_path.not_like("s3://%")))
+        found.update(res.scalars().all())
+    if not found:
+        return []
+    # content is shared across files and projects: drop blobs that some other row still needs hot
+    shas = sorted(found)
+    keep: set[str] = set()
+    for i in range(0, len(shas), _BATCH):
+        batch = shas[i:i + _BATCH]
+        res = await db.execute(select(ProjectFile.sha256).where(ProjectFile.sha256.in_(batch)))
+        keep.update(res.scalars().all())
+        res = await db.execute(
+            select(ProjectFileVersion.sha256, ProjectFileVersion.revision_no, ProjectFileVersion.uploaded_at,
+                   ProjectFile.latest_revision_no, ProjectFile.contract_id)
+            .join(ProjectFile, ProjectFile.id == ProjectFileVersion.file_id)
+            .where(ProjectFileVersion.sha256.in_(batch)))
+        for sha256, rev, uploaded_at, latest, contract_id in res.all():
+            if not _is_old(policies.get(contract_id), rev, latest, uploaded_at, now):
+                keep.add(sha256)
+    return [s for s in shas if s not in keep]
+
+async def compact(limit: int = 500) -> CompactionReport:
+    """Freeze up to `limit` eligible revision blobs; each blob is its own transaction."""
+    report = CompactionReport()
+    now = datetime.utcnow()
+    async with SessionLocal() as db:
+        res = await db.execute(select(RetentionPolicy))
+        policies = {p.contract_id: p for p in res.scalars().all()}
+        shas = await _candidates(db, policies, now) if policies else []
+        await db.commit()
+        report.candidates = len(shas)
+        for sha256 in shas[:limit]:
+            try:
+                saved = await blobstore.freeze(db, sha256)
+            except Exception as e:
+                await db.rollback()
+                log.exception("retention: freezing %s failed", sha256)
+                report.errors.append(f"{sha256}: {e}")
+                continue
+            if saved is not None:
+                report.frozen += 1
+                report.bytes_saved += saved
+    report.finished_at = datetime.utcnow()
+    return report
+
+@jobs.every(6 * 3600, name="retention_compaction")
+async def _compaction_job():
+    report = await compact()
+    if report.candidates:
+        log.info("retention: %d candidates, %d frozen, %d bytes saved, %d errors",
+                 report.candidates, report.frozen, report.bytes_saved, len(report.errors))
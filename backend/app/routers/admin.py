@@ -1,9 +1,12 @@
 
+from dataclasses import asdict
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, delete
 from ..security import get_db, get_current_user, get_password_hash
 from ..models.models import Holiday, User, Role, Contract, Client, ContractAccess
+from .. import scrubber, usage, retention
+from ..models.models_files import ContractStorageUsage
 from ..schemas import UserCreate, UserUpdate, UserOut, ContractCreate, ContractUpdate, ClientCreate, ClientUpdate, RoleCreate, RoleUpdate
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
@@ -203,3 +206,46 @@ async def update_project_access(project_id: int, user_id: int, payload: dict, db
         raise HTTPException(status_code=422, detail="Invalid role")
     await db.execute(update(ContractAccess).where(ContractAccess.contract_id==project_id, ContractAccess.user_id==user_id).values(role=role))
     await db.commit(); return {"ok": True}
+
+@router.post("/storage/scrub")
+async def scrub_storage(mode: str = "report", verify_checksums: bool = False, min_age_minutes: int = 60, u: User = Depends(get_current_user)):
+    """Reconcile stored files with DB references; mode=report is a dry run."""
+    ensure_admin(u)
+    if mode not in ("report", "quarantine", "delete"):
+        raise HTTPException(status_code=400, detail="mode must be report, quarantine or delete")
+    report = await scrubber.scrub(mode, verify_checksums=verify_checksums, min_age_minutes=max(min_age_minutes, 5))
+    return asdict(report)
+
+@router.post("/storage/compact")
+async def compact_storage(limit: int = 500, u: User = Depends(get_current_user)):
+    """Run the retention compaction now instead of waiting for the background job."""
+    ensure_admin(u)
+    report = await retention.compact(limit=limit)
+    return asdict(report)
+
+@router.get("/storage/usage")
+async def storage_usage(db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    ensure_admin(u)
+    res = await db.execute(select(ContractStorageUsage, Contract.code, Contract.name).outerjoin(Contract, Contract.id == ContractStorageUsage.contract_id).order_by(ContractStorageUsage.bytes_used.desc()))
+    return [{"contract_id": c.contract_id, "code": code, "name": name, "bytes_used": c.bytes_used, "file_count": c.file_count,
+             "version_count": c.version_count, "blob_bytes": c.blob_bytes, "quota_bytes": c.quota_bytes} for c, code, name in res.all()]
+
+@router.put("/projects/{project_id}/storage-quota")
+async def set_storage_quota(project_id: int, quota_bytes: int | None = None, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Set (or clear, with no quota_bytes) the storage quota of a project."""
+    ensure_admin(u)
+    row = await db.get(ContractStorageUsage, project_id)
+    if row is None:
+        await usage.recount(db, project_id)
+        row = await db.get(ContractStorageUsage, project_id)
+    row.quota_bytes = quota_bytes
+    await db.commit()
+    return {"ok": True, "quota_bytes": quota_bytes}
+
+@router.post("/projects/{project_id}/storage-recount")
+async def recount_storage(project_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Rebuild a project's usage counters from the file tables."""
+    ensure_admin(u)
+    await usage.recount(db, project_id)
+    await db.commit()
+    return {"ok": True}
@@ -1,83 +1,39 @@
 
-import os, uuid, shutil
-from datetime import datetime
-from typing import Optional, List, Tuple
+import os, uuid, json, base64, asyncio, hashlib, logging, mimetypes
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Optional, List, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Query
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
-from sqlalchemy import select, func, update, text
+from sqlalchemy import select, func, update, delete, insert, literal, true, tuple_, String
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 
 from ..security import get_db, get_current_user
 from ..config import config
-from ..models.models import ProjectFile, ContractAccess, User
-from ..models.models_schedule import ProjectFolder
-from ..models.models_files import ProjectFileVersion, ProjectFolderPermission
+from ..db import SessionLocal
+from ..utils import CHUNK_SIZE, StoredUpload, stream_upload, upload_limit
+from .. import blobstore, jobs, permissions, storage, thumbnails, search_index, usage
+from ..file_responses import send_file, content_disposition
+from ..zipstream import ZipEntry, stream_zip
+from ..models.models import ProjectFile, ContractAccess, User, LibraryItem
+from ..models.models_schedule import ProjectFolder, ProjectFolderClosure, ProjectFolderClosureReady
+from ..models.models_files import ProjectFileVersion, ProjectFolderPermission, StorageBlob, UploadSession, UploadSessionChunk, ContractStorageUsage, FolderStorageUsage, RetentionPolicy
 
 router = APIRouter(prefix="/api/files", tags=["files"])
+log = logging.getLogger(__name__)
 
 # --------- helpers ---------
 
-async def _permissions_enabled(db: AsyncSession, contract_id: int) -> bool:
-    res = await db.execute(select(func.count(ProjectFolderPermission.id)).where(ProjectFolderPermission.contract_id == contract_id))
-    return (res.scalar_one() or 0) > 0
-
-async def _folder_id_from_path(db: AsyncSession, contract_id: int, path: str | None) -> int | None:
-    if not path:
-        return None
-    res = await db.execute(select(ProjectFolder.id).where(ProjectFolder.contract_id == contract_id, ProjectFolder.path == path))
-    row = res.first()
-    return row[0] if row else None
-
-async def _effective_perm(db: AsyncSession, contract_id: int, user: User, folder_id: int | None) -> tuple[bool, bool]:
-    """
-        Return (can_read, can_write) for user on folder (inherit up the tree). Admin bypasses.
-        If the project has no permission rows, default to (True, True) for project members.
-    """
-    # Admin role bypass
-    if getattr(user, "role_id", None) == 1:
-        return True, True
-    # If no permissions configured, allow
-    if not await _permissions_enabled(db, contract_id):
-        return True, True
-    # Build ancestor chain including None/root
-    chain = []
-    current = folder_id
-    visited = set()
-    while current is not None and current not in visited:
-        chain.append(current)
-        visited.add(current)
-        par = await db.get(ProjectFolder, current)
-        if not par:
-            break
-        current = par.parent_id
-    chain.append(None)  # root fallback
-    # Walk downwards from most specific to least
-    for fid in chain:
-        q = select(ProjectFolderPermission).where(ProjectFolderPermission.contract_id == contract_id, ProjectFolderPermission.user_id == user.id)
-        if fid is None:
-            q = q.where(ProjectFolderPermission.folder_id.is_(None))
-        else:
-            q = q.where(ProjectFolderPermission.folder_id == fid)
-        res = await db.execute(q)
-        p = res.scalar_one_or_none()
-        if p:
-            return (bool(p.can_read), bool(p.can_write))
-    # no explicit entry => deny
-    return False, False
-
-def _proj_dir(contract_id: int) -> str:
-    base = getattr(config.storage, "files_dir", "./var/files")
-    p = os.path.join(base, str(contract_id))
-    os.makedirs(p, exist_ok=True)
-    return p
-
-async def _can_access(db: AsyncSession, user: User, project_id: int) -> bool:
-    if getattr(user, "role_id", None) == 1:
-        return True
-    res = await db.execute(select(ContractAccess).where(ContractAccess.contract_id == project_id, ContractAccess.user_id == user.id))
-    return res.scalar_one_or_none() is not None
+async def _latest_revisions(db: AsyncSession, file_ids: List[int]) -> dict[int, int]:
+    """Max revision_no per file in one grouped query (files without versions are absent)."""
+    if not file_ids:
+        return {}
+    res = await db.execute(select(ProjectFileVersion.file_id, func.max(ProjectFileVersion.revision_no)).where(ProjectFileVersion.file_id.in_(file_ids)).group_by(ProjectFileVersion.file_id))
+    return {fid: rev or 0 for fid, rev in res.all()}
 
 async def _folder_path(db: AsyncSession, folder_id: Optional[int]) -> Optional[str]:
     if not folder_id:
@@ -87,7 +43,12 @@ async def _folder_path(db: AsyncSession, folder_id: Optional[int]) -> Optional[s
         return None
     return f.path
 
-async def _ensure_unique_folder(db: AsyncSession, contract_id: int, parent_id: Optional[int], name: str) -> Tuple[str, Optional[str]]:
+def _like_prefix(path: str) -> str:
+    """LIKE pattern matching everything below `path` ('_' and '%' in folder names are literal)."""
+    escaped = path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "/%"
+
+async def _ensure_unique_folder(db: AsyncSession, contract_id: int, parent_id: Optional[int], name: str, exclude_id: Optional[int] = None) -> Tuple[str, Optional[str]]:
     """Return (path, err)."""
     base_path = ""
     if parent_id:
@@ -96,32 +57,182 @@ async def _ensure_unique_folder(db: AsyncSession, contract_id: int, parent_id: O
             return "", "Parent not found"
         base_path = p.path
     path = name if not base_path else f"{base_path}/{name}"
-    # check duplicate
-    res = await db.execute(select(ProjectFolder).where(ProjectFolder.contract_id == contract_id, ProjectFolder.path == path))
-    if res.scalar_one_or_none():
+    # check duplicate among siblings
+    q = select(ProjectFolder.id).where(ProjectFolder.contract_id == contract_id, ProjectFolder.name == name)
+    q = q.where(ProjectFolder.parent_id.is_(None)) if not parent_id else q.where(ProjectFolder.parent_id == parent_id)
+    if exclude_id is not None:
+        q = q.where(ProjectFolder.id != exclude_id)
+    res = await db.execute(q.limit(1))
+    if res.first():
         return "", "Folder already exists"
     return path, None
 
+# --- closure table (project_folder_closure) ---
+# contracts known to have complete closure rows: project_folder_closure_ready, mirrored in this process
+_CLOSURE_READY: set[int] = set()
+
+async def _ensure_closure(db: AsyncSession, contract_id: int):
+    """
+        Build the closure rows of a contract once if they are missing (folders created before the table
+        existed) and record that in project_folder_closure_ready. Commits when it had to build, so call it
+        before making other changes.
+    """
+    if contract_id in _CLOSURE_READY:
+        return
+    if await db.get(ProjectFolderClosureReady, contract_id) is not None:
+        _CLOSURE_READY.add(contract_id)
+        return
+    res = await db.execute(select(ProjectFolder.id, ProjectFolder.parent_id).where(ProjectFolder.contract_id == contract_id))
+    parents = {fid: pid for fid, pid in res.all()}
+    if parents:
+        res = await db.execute(select(func.count()).select_from(ProjectFolderClosure).where(ProjectFolderClosure.descendant_id.in_(select(ProjectFolder.id).where(ProjectFolder.contract_id == contract_id)), ProjectFolderClosure.depth == 0))
+        if (res.scalar_one() or 0) < len(parents):
+            await db.execute(delete(ProjectFolderClosure).where(ProjectFolderClosure.descendant_id.in_(list(parents))))
+            rows = []
+            for fid in parents:
+                current, depth, seen = fid, 0, set()
+                while current is not None and current in parents and current not in seen:
+                    seen.add(current)
+                    rows.append({"ancestor_id": current, "descendant_id": fid, "depth": depth})
+                    current, depth = parents[current], depth + 1
+            await db.execute(insert(ProjectFolderClosure), rows)
+    try:
+        async with db.begin_nested():
+            db.add(ProjectFolderClosureReady(contract_id=contract_id))
+    except IntegrityError:
+        pass  # recorded concurrently
+    await db.commit()
+    _CLOSURE_READY.add(contract_id)
+
+async def _closure_add(db: AsyncSession, folder_id: int, parent_id: Optional[int]):
+    await db.execute(insert(ProjectFolderClosure).values(ancestor_id=folder_id, descendant_id=folder_id, depth=0))
+    if parent_id:
+        await db.execute(insert(ProjectFolderClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(ProjectFolderClosure.ancestor_id, literal(folder_id), ProjectFolderClosure.depth + 1).where(ProjectFolderClosure.descendant_id == parent_id)))
+
+async def _subtree_ids(db: AsyncSession, folder_id: int) -> List[int]:
+    res = await db.execute(select(ProjectFolderClosure.descendant_id).where(ProjectFolderClosure.ancestor_id == folder_id))
+    return list(res.scalars().all())
+
+async def _closure_move(db: AsyncSession, folder_id: int, new_parent_id: Optional[int]) -> List[int]:
+    """Re-hang the subtree of `folder_id` under `new_parent_id`; returns the subtree ids."""
+    subtree = await _subtree_ids(db, folder_id)
+    # detach from the old ancestors, keep links inside the subtree
+    await db.execute(delete(ProjectFolderClosure).where(ProjectFolderClosure.descendant_id.in_(subtree), ProjectFolderClosure.ancestor_id.not_in(subtree)))
+    if new_parent_id:
+        sup = aliased(ProjectFolderClosure)
+        sub = aliased(ProjectFolderClosure)
+        await db.execute(insert(ProjectFolderClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(sup.ancestor_id, sub.descendant_id, sup.depth + sub.depth + 1).join(sub, true()).where(sup.descendant_id == new_parent_id, sub.ancestor_id == folder_id)))
+    return subtree
+
+async def _upload_cap(db: AsyncSession, project_id: int) -> Optional[int]:
+    """Byte limit for the next upload: the size limit, narrowed by what is left of the project quota."""
+    limit = upload_limit(project_id)
+    remaining = await usage.remaining_quota(db, project_id)
+    if remaining is not None:
+        if remaining <= 0:
+            raise HTTPException(507, "Project storage quota exceeded")
+        limit = remaining if limit is None else min(limit, remaining)
+    return limit
+
+def _safe_filename(filename: Optional[str]) -> str:
+    orig = os.path.basename(filename or "upload.bin")
+    return orig.replace("\\", "_").replace("/", "_")
+
+async def _store_upload(db: AsyncSession, u: User, project_id: int, folder: Optional[str], pf: Optional[ProjectFile],
+                        safe_name: str, content_type: str, stored: StoredUpload, folder_id: Optional[int] = None) -> Tuple[dict, Callable[[], None]]:
+    """
+        Adopt a staged upload as a new ProjectFile (in `folder`, whose id is `folder_id`), or as the
+        next revision of `pf`. Flushes but does not commit; returns (response, publish) where publish()
+        queues the preview and search indexing and must only run once the caller has committed.
+    """
+    size = stored.size
+    if pf is not None:
+        pf_folder_id = await permissions.folder_id_from_path(db, project_id, pf.folder, strict=False)
+        # Replace: create a new version row for the uploaded file and set ProjectFile to the new blob.
+        # First, store the current file as a version row if it's not already recorded as latest rev
+        curr_max = pf.latest_revision_no
+        if curr_max is None:
+            curr_max = (await _latest_revisions(db, [pf.id])).get(pf.id, 0)
+        if curr_max == 0:
+            # persist current state as revision 1
+            v = ProjectFileVersion(file_id=pf.id, revision_no=1, stored_path=pf.stored_path, sha256=pf.sha256, content_type=pf.content_type, size_bytes=pf.size_bytes, uploaded_by=getattr(u, "id", None))
+            db.add(v)
+            await blobstore.incref(db, pf.sha256)
+            # its bytes were already counted as a file without versions
+            await usage.add(db, project_id, pf_folder_id, versions=1)
+            await db.flush()
+            next_rev = 2
+        else:
+            next_rev = curr_max + 1
+
+        # Save new blob: one reference for the ProjectFile row, one for the version row
+        dest = await blobstore.put(db, stored.path, stored.sha256, size, refs=2, contract_id=project_id)
+        await blobstore.decref(db, pf.sha256)
+        await usage.add(db, project_id, pf_folder_id, bytes_used=size, versions=1)
+
+        # Update ProjectFile to point to new blob
+        pf.original_name = safe_name
+        pf.stored_path = dest
+        pf.sha256 = stored.sha256
+        pf.content_type = content_type
+        pf.size_bytes = size
+        pf.latest_revision_no = next_rev
+        await db.flush()
+
+        # Record uploaded revision as next_rev in versions table
+        v2 = ProjectFileVersion(file_id=pf.id, revision_no=next_rev, stored_path=dest, sha256=stored.sha256, content_type=content_type, size_bytes=size, uploaded_by=getattr(u, "id", None))
+        db.add(v2)
+        await db.flush()
+        out = {"id": pf.id, "revision_no": next_rev, "name": pf.original_name, "size_bytes": pf.size_bytes, "folder": pf.folder or ""}
+        # a path that names no folder stays out of folder-scoped search results
+        doc_folder_id = pf_folder_id if pf_folder_id is not None or not pf.folder else search_index.UNKNOWN_FOLDER
+        return out, partial(_publish_upload, pf, v2, doc_folder_id)
+
+    # New upload
+    dest = await blobstore.put(db, stored.path, stored.sha256, size, refs=2, contract_id=project_id)
+    await usage.add(db, project_id, folder_id, bytes_used=size, files=1, versions=1)
+
+    pf = ProjectFile(contract_id=project_id, original_name=safe_name, stored_path=dest, sha256=stored.sha256, content_type=content_type, size_bytes=size, folder=(folder or None), latest_revision_no=1)
+    db.add(pf)
+    await db.flush()
+    # initial version 1
+    v = ProjectFileVersion(file_id=pf.id, revision_no=1, stored_path=dest, sha256=stored.sha256, content_type=content_type, size_bytes=size, uploaded_by=getattr(u, "id", None))
+    db.add(v)
+    await db.flush()
+    out = {"id": pf.id, "name": pf.original_name, "size_bytes": pf.size_bytes, "folder": pf.folder or "", "revision_no": 1}
+    return out, partial(_publish_upload, pf, v, folder_id)
+
+def _publish_upload(pf: ProjectFile, version: ProjectFileVersion, folder_id: Optional[int]):
+    """Queue the preview and the search documents of a committed upload."""
+    thumbnails.enqueue(pf.stored_path, pf.sha256, pf.content_type)
+    search_index.enqueue(search_index.file_doc(pf, folder_id))
+    search_index.enqueue(search_index.version_doc(version, pf, folder_id))
+
 # --------- Folders ----------
 @router.get("/projects/{project_id}/folders")
 async def list_folders(project_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    if not await _can_access(db, u, project_id):
+    if not await permissions.can_access(db, u, project_id):
         raise HTTPException(403, "Not allowed")
     res = await db.execute(select(ProjectFolder).where(ProjectFolder.contract_id == project_id).order_by(ProjectFolder.path.asc()))
     rows = res.scalars().all()
+    matrix = await permissions.user_matrix(db, project_id, u)
     out = []
     for f in rows:
-        can_read, _ = await _effective_perm(db, project_id, u, f.id)
+        can_read, _ = matrix.get(f.id)
         if can_read:
             out.append({"id": f.id, "name": f.name, "path": f.path, "parent_id": f.parent_id})
-    return [{"id": f.id, "name": f.name, "path": f.path, "parent_id": f.parent_id} for f in rows]
+    return out
 
 @router.post("/projects/{project_id}/folders")
 async def create_folder(project_id: int,
                         name: str = Form(...),
                         parent_id: Optional[int] = Form(None),
                         db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    if not await _can_access(db, u, project_id):
+    if not await permissions.can_access(db, u, project_id):
         raise HTTPException(403, "Not allowed")
     name = name.strip().strip("/")
     if not name:
@@ -129,8 +240,12 @@ async def create_folder(project_id: int,
     path, err = await _ensure_unique_folder(db, project_id, parent_id, name)
     if err:
         raise HTTPException(400, err)
+    await _ensure_closure(db, project_id)
     folder = ProjectFolder(contract_id=project_id, parent_id=parent_id, name=name, path=path)
     db.add(folder)
+    await db.flush()
+    await _closure_add(db, folder.id, parent_id)
+    await permissions.bump(db, project_id)
     await db.commit()
     await db.refresh(folder)
     return {"id": folder.id, "name": folder.name, "path": folder.path, "parent_id": folder.parent_id}
@@ -143,68 +258,185 @@ async def rename_or_move_folder(folder_id: int,
     folder = await db.get(ProjectFolder, folder_id)
     if not folder:
         raise HTTPException(404, "Folder not found")
-    if not await _can_access(db, u, folder.contract_id):
+    if not await permissions.can_access(db, u, folder.contract_id):
         raise HTTPException(403, "Not allowed")
+    # permission checks
+    can_read, can_write_here = await permissions.effective_perm(db, folder.contract_id, u, folder.id)
+    if not can_write_here: raise HTTPException(403, "No write access on this folder")
     # compute new path
     new_name = folder.name if name is None else name.strip().strip("/")
+    if not new_name:
+        raise HTTPException(400, "Invalid name")
     new_parent = folder.parent_id if parent_id is None else parent_id
-    base_path = ""
+    await _ensure_closure(db, folder.contract_id)
     if new_parent:
-        p = await db.get(ProjectFolder, new_parent)
-        if not p or p.contract_id != folder.contract_id:
-            raise HTTPException(400, "Parent not found")
         # prevent making a folder its own descendant
-        if p.path.startswith(folder.path + "/") or p.id == folder.id:
+        res = await db.execute(select(ProjectFolderClosure.depth).where(ProjectFolderClosure.ancestor_id == folder.id, ProjectFolderClosure.descendant_id == new_parent))
+        if res.first():
             raise HTTPException(400, "Invalid parent (cycle)")
-        base_path = p.path
-    new_path = new_name if not base_path else f"{base_path}/{new_name}"
-    # update folder and its descendants' path
-    # permission checks
-    can_read, can_write_here = await _effective_perm(db, folder.contract_id, u, folder.id)
-    if not can_write_here: raise HTTPException(403, "No write access on this folder")
+    new_path, err = await _ensure_unique_folder(db, folder.contract_id, new_parent, new_name, exclude_id=folder.id)
+    if err:
+        raise HTTPException(400, err)
     old_path = folder.path
+    moved = new_parent != folder.parent_id
     folder.name = new_name
     folder.parent_id = new_parent
     folder.path = new_path
     await db.flush()
-    # rename descendants
-    res = await db.execute(select(ProjectFolder).where(ProjectFolder.contract_id == folder.contract_id, ProjectFolder.path.like(old_path + "/%")))
-    for child in res.scalars().all():
-        child.path = child.path.replace(old_path + "/", new_path + "/", 1)
-    # move files under this subtree by matching path prefix in ProjectFile.folder (string path)
-    await db.execute(text("UPDATE project_files SET folder = REPLACE(folder, :oldp, :newp) WHERE folder LIKE :oldpref").bindparams(oldp=old_path + "/", newp=new_path + "/", oldpref=old_path + "/%"))
+    if moved:
+        await _closure_move(db, folder.id, new_parent)
+    if new_path != old_path:
+        # rewrite the path prefix of every descendant in one statement
+        descendants = select(ProjectFolderClosure.descendant_id).where(ProjectFolderClosure.ancestor_id == folder.id, ProjectFolderClosure.depth > 0)
+        await db.execute(update(ProjectFolder).where(ProjectFolder.id.in_(descendants)).values(path=literal(new_path, String) + func.substr(ProjectFolder.path, len(old_path) + 1)).execution_options(synchronize_session=False))
+        # files reference folders by path: move those in the folder and below it
+        await db.execute(update(ProjectFile).where(ProjectFile.contract_id == folder.contract_id, (ProjectFile.folder == old_path) | ProjectFile.folder.like(_like_prefix(old_path), escape="\\")).values(folder=literal(new_path, String) + func.substr(ProjectFile.folder, len(old_path) + 1)).execution_options(synchronize_session=False))
+    await permissions.bump(db, folder.contract_id)
     await db.commit()
     return {"ok": True, "path": new_path}
 
-# ---------- Files ----------
-@router.get("/projects/{project_id}/items")
-async def list_file_items(project_id: int, folder: Optional[str] = None, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    if not await _can_access(db, u, project_id):
+@router.delete("/folders/{folder_id}")
+async def delete_folder(folder_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Delete a folder and its subfolders; refused while any of them still holds files."""
+    folder = await db.get(ProjectFolder, folder_id)
+    if not folder:
+        raise HTTPException(404, "Folder not found")
+    if not await permissions.can_access(db, u, folder.contract_id):
         raise HTTPException(403, "Not allowed")
-    # permission check on folder
-    fid = await _folder_id_from_path(db, project_id, folder)
-    can_read, _ = await _effective_perm(db, project_id, u, fid)
-    if not can_read:
-        raise HTTPException(403, "No read access to this folder")
-    # list files living exactly in this folder path (or NULL/'' for root)
+    _, can_write = await permissions.effective_perm(db, folder.contract_id, u, folder.id)
+    if not can_write:
+        raise HTTPException(403, "No write access on this folder")
+    await _ensure_closure(db, folder.contract_id)
+    subtree = await _subtree_ids(db, folder.id)
+    subtree_paths = select(ProjectFolder.path).where(ProjectFolder.id.in_(subtree))
+    res = await db.execute(select(ProjectFile.id).where(ProjectFile.contract_id == folder.contract_id, ProjectFile.folder.in_(subtree_paths), ProjectFile.deleted_at.is_(None)).limit(1))
+    if res.first():
+        raise HTTPException(409, "Folder is not empty")
+    await db.execute(delete(ProjectFolderClosure).where(ProjectFolderClosure.descendant_id.in_(subtree)))
+    await db.execute(delete(ProjectFolder).where(ProjectFolder.id.in_(subtree)).execution_options(synchronize_session=False))
+    await permissions.bump(db, folder.contract_id)
+    await db.commit()
+    return {"ok": True, "deleted": len(subtree)}
+
+# ---------- Files ----------
+def _folder_filter(folder: Optional[str]):
+    # root files are stored with folder NULL (v036 normalized legacy ''), one ref lookup on the listing indexes
     if folder in (None, "", "null", "NULL"):
-        res = await db.execute(select(ProjectFile).where(ProjectFile.contract_id == project_id).where((ProjectFile.folder.is_(None)) | (ProjectFile.folder == "")).where(ProjectFile.deleted_at.is_(None)).order_by(ProjectFile.original_name.asc()))
-    else:
-        res = await db.execute(select(ProjectFile).where(ProjectFile.contract_id == project_id, ProjectFile.folder == folder, ProjectFile.deleted_at.is_(None)).order_by(ProjectFile.original_name.asc()))
-    files = [f for f in (res.scalars().all()) if getattr(f, 'deleted_at', None) is None]
+        return ProjectFile.folder.is_(None)
+    return ProjectFile.folder == folder
+
+async def _file_items(db: AsyncSession, files: List[ProjectFile]) -> List[dict]:
+    # rows not backfilled yet fall back to one grouped MAX(revision_no) over the versions table
+    missing = await _latest_revisions(db, [f.id for f in files if f.latest_revision_no is None])
     out = []
     for f in files:
-        # revision number = count of versions for this file
-        vres = await db.execute(select(func.coalesce(func.max(ProjectFileVersion.revision_no), 0)).where(ProjectFileVersion.file_id == f.id))
-        maxrev = vres.scalar_one() or 0
+        maxrev = f.latest_revision_no if f.latest_revision_no is not None else missing.get(f.id, 0)
         # The ProjectFile row itself represents the latest revision too; if we never stored rev 1, set to maxrev or 1
         latest_rev = maxrev if maxrev > 0 else 1
         out.append({
             "id": f.id, "name": f.original_name, "size_bytes": f.size_bytes, "content_type": f.content_type,
-            "folder": f.folder or "", "uploaded_at": getattr(f, "uploaded_at", None), "revision_no": latest_rev
+            "folder": f.folder or "", "uploaded_at": getattr(f, "uploaded_at", None), "revision_no": latest_rev,
+            "sha256": f.sha256,
         })
     return out
 
+@router.get("/projects/{project_id}/items")
+async def list_file_items(project_id: int, folder: Optional[str] = None, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    if not await permissions.can_access(db, u, project_id):
+        raise HTTPException(403, "Not allowed")
+    # permission check on folder
+    fid = await permissions.folder_id_from_path(db, project_id, folder)
+    can_read, _ = await permissions.effective_perm(db, project_id, u, fid)
+    if not can_read:
+        raise HTTPException(403, "No read access to this folder")
+    # list files living exactly in this folder path (or NULL/'' for root)
+    res = await db.execute(select(ProjectFile).where(ProjectFile.contract_id == project_id, _folder_filter(folder), ProjectFile.deleted_at.is_(None)).order_by(ProjectFile.original_name.asc()))
+    return await _file_items(db, list(res.scalars().all()))
+
+# sort key -> indexed column (ix_project_files_folder_*); only uploaded_at can be NULL (legacy rows)
+_PAGE_SORTS = {
+    "name": ProjectFile.original_name,
+    "size": ProjectFile.size_bytes,
+    "uploaded_at": ProjectFile.uploaded_at,
+    "revision": ProjectFile.revision_sort,
+}
+_NULLABLE_SORTS = {"uploaded_at"}
+
+def _encode_cursor(sort: str, value, file_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, file_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, sort: str):
+    """(sort value, file id) of a cursor; the value is None when the row's sort key was NULL."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        csort, value, file_id = json.loads(raw)
+        if csort != sort or not isinstance(file_id, int):
+            raise ValueError
+        if value is None:
+            pass
+        elif sort == "uploaded_at":
+            value = datetime.fromisoformat(value)
+        elif sort in ("size", "revision") and not isinstance(value, int):
+            raise ValueError
+        elif sort == "name" and not isinstance(value, str):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    return value, file_id
+
+@router.get("/projects/{project_id}/items/page")
+async def list_file_items_page(project_id: int, folder: Optional[str] = None,
+                               sort: str = Query("name", pattern="^(name|size|uploaded_at|revision)$"),
+                               order: str = Query("asc", pattern="^(asc|desc)$"),
+                               limit: int = Query(100, ge=1, le=500),
+                               cursor: Optional[str] = None,
+                               db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """One page of a folder listing, ordered by (sort key, id) and continued with the opaque next_cursor."""
+    if not await permissions.can_access(db, u, project_id):
+        raise HTTPException(403, "Not allowed")
+    fid = await permissions.folder_id_from_path(db, project_id, folder)
+    can_read, _ = await permissions.effective_perm(db, project_id, u, fid)
+    if not can_read:
+        raise HTTPException(403, "No read access to this folder")
+    key, file_id = _PAGE_SORTS[sort], ProjectFile.id
+    base = select(ProjectFile).where(ProjectFile.contract_id == project_id, _folder_filter(folder), ProjectFile.deleted_at.is_(None))
+    # each phase is one range scan over its listing index: the keyed rows by (key, id), and for a nullable
+    # key the NULL rows by id, after the keyed rows ascending and before them descending
+    asc = order == "asc"
+    keyed = [key.is_not(None)] if sort in _NULLABLE_SORTS else []
+    phases = [("keyed", keyed, (key.asc(), file_id.asc()) if asc else (key.desc(), file_id.desc()))]
+    if sort in _NULLABLE_SORTS:
+        null_phase = ("null", [key.is_(None)], (file_id.asc(),) if asc else (file_id.desc(),))
+        phases = phases + [null_phase] if asc else [null_phase] + phases
+    if cursor:
+        value, last_id = _decode_cursor(cursor, sort)
+        if value is None and sort not in _NULLABLE_SORTS:
+            raise HTTPException(400, "Invalid cursor")
+        start = next(k for k, p in enumerate(phases) if p[0] == ("null" if value is None else "keyed"))
+        name, conds, ordering = phases[start]
+        if value is None:
+            after = file_id > last_id if asc else file_id < last_id
+        else:
+            after = tuple_(key, file_id) > tuple_(value, last_id) if asc else tuple_(key, file_id) < tuple_(value, last_id)
+        phases = [(name, conds + [after], ordering)] + phases[start + 1:]
+    files: List[ProjectFile] = []
+    for _, conds, ordering in phases:
+        res = await db.execute(base.where(*conds).order_by(*ordering).limit(limit + 1 - len(files)))
+        files.extend(res.scalars().all())
+        if len(files) > limit:
+            break
+    next_cursor = None
+    if len(files) > limit:
+        files = files[:limit]
+        last = files[-1]
+        value = {"name": last.original_name, "size": last.size_bytes, "uploaded_at": last.uploaded_at,
+                 "revision": last.revision_sort}[sort]
+        next_cursor = _encode_cursor(sort, value, last.id)
+    return {"items": await _file_items(db, files), "next_cursor": next_cursor}
+
 @router.patch("/items/{file_id}")
 async def update_file(file_id: int,
                       folder: Optional[str] = Form(None),
@@ -213,20 +445,25 @@ async def update_file(file_id: int,
     f = await db.get(ProjectFile, file_id)
     if not f:
         raise HTTPException(404, "File not found")
-    if not await _can_access(db, u, f.contract_id):
+    if not await permissions.can_access(db, u, f.contract_id):
         raise HTTPException(403, "Not allowed")
     # permission checks for move/rename
-    src_fid = await _folder_id_from_path(db, f.contract_id, f.folder or None)
-    _, can_write_src = await _effective_perm(db, f.contract_id, u, src_fid)
+    src_fid = await permissions.folder_id_from_path(db, f.contract_id, f.folder or None)
+    _, can_write_src = await permissions.effective_perm(db, f.contract_id, u, src_fid)
     if not can_write_src: raise HTTPException(403, "No write access (source)")
     if folder is not None:
-        dst_fid = await _folder_id_from_path(db, f.contract_id, folder or None)
-        _, can_write_dst = await _effective_perm(db, f.contract_id, u, dst_fid)
+        dst_fid = await permissions.folder_id_from_path(db, f.contract_id, folder or None)
+        _, can_write_dst = await permissions.effective_perm(db, f.contract_id, u, dst_fid)
         if not can_write_dst: raise HTTPException(403, "No write access (destination)")
+        footprint, _ = await usage.file_footprint(db, f)
+        await usage.move(db, f.contract_id, src_fid, dst_fid, footprint)
         f.folder = folder or None
     if name is not None and name.strip():
         f.original_name = name.strip()
     await db.commit()
+    if folder is not None or (name is not None and name.strip()):
+        # the file document carries the title and the folder scope of the file and its revisions
+        search_index.enqueue(search_index.file_doc(f, dst_fid if folder is not None else src_fid))
     return {"ok": True}
 
 @router.post("/items/reorder")
@@ -244,113 +481,523 @@ async def upload_file(project_id: int,
                       folder: Optional[str] = Form(None),
                       replace_file_id: Optional[int] = Form(None),
                       db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    if not await _can_access(db, u, project_id):
+    if not await permissions.can_access(db, u, project_id):
         raise HTTPException(403, "Not allowed")
     # write permission on target
-    fid = await _folder_id_from_path(db, project_id, folder)
-    _, can_write = await _effective_perm(db, project_id, u, fid)
+    fid = await permissions.folder_id_from_path(db, project_id, folder)
+    _, can_write = await permissions.effective_perm(db, project_id, u, fid)
     if not can_write:
         raise HTTPException(403, "No write access to this folder")
 
-    os.makedirs(_proj_dir(project_id), exist_ok=True)
-
     # Sanitize filename
-    orig = os.path.basename(file.filename or "upload.bin")
-    safe_name = orig.replace("\\", "_").replace("/", "_")
+    safe_name = _safe_filename(file.filename)
     content_type = file.content_type or "application/octet-stream"
 
+    pf = None
     if replace_file_id:
-        # Replace: create a new version row for the uploaded file and set ProjectFile to the new blob.
         pf = await db.get(ProjectFile, replace_file_id)
         if not pf or pf.contract_id != project_id:
             raise HTTPException(404, "File to replace not found")
-        # First, store the current file as a version row if it's not already recorded as latest rev
-        res = await db.execute(select(func.coalesce(func.max(ProjectFileVersion.revision_no), 0)).where(ProjectFileVersion.file_id == pf.id))
-        curr_max = res.scalar_one() or 0
-        if curr_max == 0:
-            # persist current state as revision 1
-            v = ProjectFileVersion(file_id=pf.id, revision_no=1, stored_path=pf.stored_path, content_type=pf.content_type, size_bytes=pf.size_bytes, uploaded_by=getattr(u, "id", None))
-            db.add(v)
-            await db.flush()
-            next_rev = 2
-        else:
-            next_rev = curr_max + 1
 
-        # Save new blob
-        new_basename = f"{uuid.uuid4().hex}-{safe_name}"
-        dest = os.path.join(_proj_dir(project_id), new_basename)
-        with open(dest, "wb") as out:
-            shutil.copyfileobj(file.file, out)
-        size = os.path.getsize(dest)
+    # Stage the upload (hashing as it streams) before touching the DB
+    stored = await stream_upload(file, blobstore.temp_path(), await _upload_cap(db, project_id))
+    out, publish = await _store_upload(db, u, project_id, folder, pf, safe_name, content_type, stored, folder_id=fid)
+    await db.commit()
+    publish()
+    return out
 
-        # Update ProjectFile to point to new blob
-        pf.original_name = safe_name
-        pf.stored_path = dest
-        pf.content_type = content_type
-        pf.size_bytes = size
-        await db.flush()
+_BATCH_MAX_FILES = 500
+_BATCH_PARALLEL = 4
 
-        # Record uploaded revision as next_rev in versions table
-        v2 = ProjectFileVersion(file_id=pf.id, revision_no=next_rev, stored_path=dest, content_type=content_type, size_bytes=size, uploaded_by=getattr(u, "id", None))
-        db.add(v2)
+@router.post("/projects/{project_id}/upload/batch")
+async def upload_batch(project_id: int,
+                       files: List[UploadFile] = File(...),
+                       folder: Optional[str] = Form(None),
+                       db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """
+        Upload many new files into one folder: permissions are checked once, files are staged
+        concurrently and all rows are written in one transaction. Returns a result per file.
+    """
+    if not await permissions.can_access(db, u, project_id):
+        raise HTTPException(403, "Not allowed")
+    fid = await permissions.folder_id_from_path(db, project_id, folder)
+    _, can_write = await permissions.effective_perm(db, project_id, u, fid)
+    if not can_write:
+        raise HTTPException(403, "No write access to this folder")
+    if len(files) > _BATCH_MAX_FILES:
+        raise HTTPException(400, f"At most {_BATCH_MAX_FILES} files per batch")
+    cap = await _upload_cap(db, project_id)
+    remaining = await usage.remaining_quota(db, project_id)
+    await db.commit()
+
+    # stage every upload (hashing as it streams), at most _BATCH_PARALLEL at a time
+    sem = asyncio.Semaphore(_BATCH_PARALLEL)
+    results: list[dict] = [{"name": _safe_filename(f.filename), "ok": False} for f in files]
+    staged: list[Optional[StoredUpload]] = [None] * len(files)
+
+    async def stage(i: int, f: UploadFile):
+        async with sem:
+            try:
+                staged[i] = await stream_upload(f, blobstore.temp_path(), cap)
+            except HTTPException as e:
+                results[i]["error"] = e.detail
+            except OSError as e:
+                results[i]["error"] = f"Could not store upload: {e.strerror or e}"
+
+    await asyncio.gather(*(stage(i, f) for i, f in enumerate(files)))
+
+    # the quota covers the batch as a whole: files past it fail, in upload order
+    accepted: list[int] = []
+    budget = remaining
+    for i, st in enumerate(staged):
+        if st is None:
+            continue
+        if budget is not None and st.size > budget:
+            results[i]["error"] = "Project storage quota exceeded"
+            await asyncio.to_thread(_discard, st.path)
+            staged[i] = None
+            continue
+        if budget is not None:
+            budget -= st.size
+        accepted.append(i)
+    if not accepted:
+        return {"uploaded": 0, "failed": len(files), "results": results}
+
+    try:
+        # one blob per distinct content, referenced by a ProjectFile and a version row per file
+        by_sha: dict[str, list[int]] = {}
+        for i in accepted:
+            by_sha.setdefault(staged[i].sha256, []).append(i)
+        dests: dict[str, str] = {}
+        for sha256, idx in by_sha.items():
+            first = staged[idx[0]]
+            for i in idx[1:]:
+                await asyncio.to_thread(_discard, staged[i].path)
+            dests[sha256] = await blobstore.put(db, first.path, sha256, first.size, refs=2 * len(idx), contract_id=project_id)
+
+        now = datetime.utcnow()
+        pf_rows = [{
+            "contract_id": project_id, "original_name": results[i]["name"], "stored_path": dests[staged[i].sha256],
+            "sha256": staged[i].sha256, "content_type": files[i].content_type or "application/octet-stream",
+            "size_bytes": staged[i].size, "folder": folder or None, "latest_revision_no": 1, "uploaded_at": now,
+        } for i in accepted]
+        # executemany RETURNING in parameter order: MariaDB >= 10.5 (see README)
+        res = await db.execute(insert(ProjectFile).returning(ProjectFile.id, sort_by_parameter_order=True), pf_rows)
+        file_ids = list(res.scalars().all())
+        v_rows = [{
+            "file_id": file_id, "revision_no": 1, "stored_path": row["stored_path"], "sha256": row["sha256"],
+            "content_type": row["content_type"], "size_bytes": row["size_bytes"], "uploaded_by": getattr(u, "id", None), "uploaded_at": now,
+        } for file_id, row in zip(file_ids, pf_rows)]
+        res = await db.execute(insert(ProjectFileVersion).returning(ProjectFileVersion.id, sort_by_parameter_order=True), v_rows)
+        version_ids = list(res.scalars().all())
+        await usage.add(db, project_id, fid, bytes_used=sum(r["size_bytes"] for r in pf_rows), files=len(pf_rows), versions=len(pf_rows))
         await db.commit()
-        return {"id": pf.id, "revision_no": next_rev, "name": pf.original_name, "size_bytes": pf.size_bytes, "folder": pf.folder or ""}
+    except Exception:
+        await db.rollback()
+        for i in accepted:
+            await asyncio.to_thread(_discard, staged[i].path)
+        raise
 
-    # New upload
-    new_basename = f"{uuid.uuid4().hex}-{safe_name}"
-    dest = os.path.join(_proj_dir(project_id), new_basename)
+    for i, file_id, version_id, row, v_row in zip(accepted, file_ids, version_ids, pf_rows, v_rows):
+        pf = ProjectFile(id=file_id, **row)
+        search_index.enqueue(search_index.file_doc(pf, fid))
+        search_index.enqueue(search_index.version_doc(ProjectFileVersion(id=version_id, **v_row), pf, fid))
+        results[i].update(ok=True, id=file_id, revision_no=1, size_bytes=row["size_bytes"], folder=folder or "", sha256=row["sha256"])
+    for sha256, idx in by_sha.items():
+        thumbnails.enqueue(dests[sha256], sha256, files[idx[0]].content_type or "application/octet-stream")
+    return {"uploaded": len(accepted), "failed": len(files) - len(accepted), "results": results}
+
+# ---------- Resumable uploads ----------
+# create a session, PUT chunks at any offset (in parallel, in any order), query received ranges, finalize.
+# Each chunk is stored as its own object on the storage backend (tmp/sessions/<session>/...), so chunks
+# and the finalize call may hit different nodes; with the local backend files_dir must then be shared.
+
+_SESSION_CHUNK_HINT = 8 * 1024 * 1024
+_SESSION_MAX_CHUNK = 256 * 1024 * 1024
+
+def _chunk_locator(session_id: str, offset: int) -> str:
+    # unique per PUT: a re-sent chunk never overwrites one a concurrent finalize may be reading
+    return storage.locator(f"tmp/sessions/{session_id}/{offset}-{uuid.uuid4().hex}")
+
+def _assemble(chunks: List[Tuple[int, int, str]], dest: str) -> Tuple[str, int]:
+    """
+        Concatenate (offset, length, locator) chunks that cover the file without gaps into `dest`,
+        hashing on the way (blocking). Bytes sent twice are taken from the chunk with the lower offset.
+    """
+    digest, pos = hashlib.sha256(), 0
     with open(dest, "wb") as out:
-        shutil.copyfileobj(file.file, out)
-    size = os.path.getsize(dest)
+        for offset, length, locator in sorted(chunks):
+            if offset + length <= pos:
+                continue
+            with storage.open_stream(locator) as src:
+                skip, remaining = pos - offset, offset + length - pos
+                while skip > 0:
+                    data = src.read(min(CHUNK_SIZE, skip))
+                    if not data:
+                        raise OSError(f"{locator}: chunk shorter than recorded")
+                    skip -= len(data)
+                while remaining > 0:
+                    data = src.read(min(CHUNK_SIZE, remaining))
+                    if not data:
+                        raise OSError(f"{locator}: chunk shorter than recorded")
+                    out.write(data)
+                    digest.update(data)
+                    pos += len(data)
+                    remaining -= len(data)
+    return digest.hexdigest(), pos
 
-    pf = ProjectFile(contract_id=project_id, original_name=safe_name, stored_path=dest, content_type=content_type, size_bytes=size, folder=(folder or None))
-    db.add(pf)
-    await db.flush()
-    # initial version 1
-    v = ProjectFileVersion(file_id=pf.id, revision_no=1, stored_path=dest, content_type=content_type, size_bytes=size, uploaded_by=getattr(u, "id", None))
-    db.add(v)
+async def _drop_chunks(locators: List[str]):
+    for locator in locators:
+        try:
+            await storage.delete(locator)
+        except Exception as e:  # left for the scrubber
+            log.warning("could not delete upload chunk %s: %s", locator, e)
+
+async def _session_chunks(db: AsyncSession, session_ids: List[str]) -> List[str]:
+    res = await db.execute(select(UploadSessionChunk.stored_path).where(UploadSessionChunk.session_id.in_(session_ids)))
+    return list(res.scalars().all())
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _merge_ranges(chunks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge (offset, length) chunks into sorted half-open [start, end) ranges."""
+    merged: List[Tuple[int, int]] = []
+    for start, length in sorted(chunks):
+        end = start + length
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+async def _received_ranges(db: AsyncSession, session_id: str) -> List[Tuple[int, int]]:
+    res = await db.execute(select(UploadSessionChunk.offset, UploadSessionChunk.length).where(UploadSessionChunk.session_id == session_id))
+    return _merge_ranges([(o, l) for o, l in res.all()])
+
+async def _get_session(db: AsyncSession, session_id: str, u: User, for_update: bool = False) -> UploadSession:
+    q = select(UploadSession).where(UploadSession.id == session_id)
+    if for_update:
+        q = q.with_for_update()
+    sess = (await db.execute(q)).scalar_one_or_none()
+    if not sess or sess.user_id != u.id:
+        raise HTTPException(404, "Upload session not found")
+    if sess.expires_at < datetime.utcnow():
+        raise HTTPException(410, "Upload session expired")
+    return sess
+
+@router.post("/projects/{project_id}/uploads")
+async def create_upload_session(project_id: int,
+                                filename: str = Form(...),
+                                size: int = Form(...),
+                                content_type: Optional[str] = Form(None),
+                                folder: Optional[str] = Form(None),
+                                replace_file_id: Optional[int] = Form(None),
+                                db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    if not await permissions.can_access(db, u, project_id):
+        raise HTTPException(403, "Not allowed")
+    fid = await permissions.folder_id_from_path(db, project_id, folder)
+    _, can_write = await permissions.effective_perm(db, project_id, u, fid)
+    if not can_write:
+        raise HTTPException(403, "No write access to this folder")
+    if size < 0:
+        raise HTTPException(400, "Invalid size")
+    limit = await _upload_cap(db, project_id)
+    if limit is not None and size > limit:
+        raise HTTPException(413, f"File exceeds the upload limit of {limit // (1024 * 1024)} MB")
+    if replace_file_id:
+        pf = await db.get(ProjectFile, replace_file_id)
+        if not pf or pf.contract_id != project_id:
+            raise HTTPException(404, "File to replace not found")
+    sess = UploadSession(id=uuid.uuid4().hex, contract_id=project_id, user_id=u.id, folder=folder or None,
+                         filename=_safe_filename(filename), content_type=content_type or "application/octet-stream",
+                         total_size=size, replace_file_id=replace_file_id,
+                         expires_at=datetime.utcnow() + timedelta(hours=config.storage.upload_session_hours))
+    db.add(sess)
     await db.commit()
-    await db.refresh(pf)
-    return {"id": pf.id, "name": pf.original_name, "size_bytes": pf.size_bytes, "folder": pf.folder or "", "revision_no": 1}
+    return {"id": sess.id, "total_size": size, "chunk_size": _SESSION_CHUNK_HINT, "expires_at": sess.expires_at}
+
+@router.put("/uploads/{session_id}/chunks")
+async def put_upload_chunk(session_id: str, request: Request, offset: int = Query(..., ge=0), db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    sess = await _get_session(db, session_id, u)
+    total = sess.total_size
+    tmp = blobstore.temp_path()
+    pos, buf = offset, bytearray()
+    try:
+        f = await asyncio.to_thread(open, tmp, "wb")
+        try:
+            async for piece in request.stream():
+                buf += piece
+                if pos + len(buf) > total:
+                    raise HTTPException(400, "Chunk exceeds the declared file size")
+                if pos + len(buf) - offset > _SESSION_MAX_CHUNK:
+                    raise HTTPException(413, "Chunk too large")
+                if len(buf) >= CHUNK_SIZE:
+                    await asyncio.to_thread(f.write, bytes(buf))
+                    pos += len(buf)
+                    buf.clear()
+            if buf:
+                await asyncio.to_thread(f.write, bytes(buf))
+                pos += len(buf)
+        finally:
+            await asyncio.to_thread(f.close)
+        if pos == offset:
+            raise HTTPException(400, "Empty chunk")
+        locator = await storage.put(tmp, _chunk_locator(session_id, offset))
+    except BaseException:
+        await asyncio.to_thread(_discard, tmp)
+        raise
+    # only fully stored chunks are recorded; an interrupted one is simply sent again
+    db.add(UploadSessionChunk(session_id=session_id, offset=offset, length=pos - offset, stored_path=locator))
+    sess.expires_at = datetime.utcnow() + timedelta(hours=config.storage.upload_session_hours)
+    await db.commit()
+    return {"offset": offset, "length": pos - offset}
+
+@router.get("/uploads/{session_id}")
+async def get_upload_session(session_id: str, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    sess = await _get_session(db, session_id, u)
+    ranges = await _received_ranges(db, session_id)
+    received = sum(end - start for start, end in ranges)
+    return {"id": sess.id, "total_size": sess.total_size, "received": [[start, end] for start, end in ranges],
+            "received_bytes": received, "complete": received == sess.total_size, "expires_at": sess.expires_at}
+
+@router.post("/uploads/{session_id}/finalize")
+async def finalize_upload_session(session_id: str, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    sess = await _get_session(db, session_id, u, for_update=True)
+    project_id = sess.contract_id
+    if not await permissions.can_access(db, u, project_id):
+        raise HTTPException(403, "Not allowed")
+    fid = await permissions.folder_id_from_path(db, project_id, sess.folder)
+    _, can_write = await permissions.effective_perm(db, project_id, u, fid)
+    if not can_write:
+        raise HTTPException(403, "No write access to this folder")
+    ranges = await _received_ranges(db, session_id)
+    if sess.total_size and ranges != [(0, sess.total_size)]:
+        raise HTTPException(409, "Upload incomplete")
+    pf = None
+    if sess.replace_file_id:
+        pf = await db.get(ProjectFile, sess.replace_file_id)
+        if not pf or pf.contract_id != project_id:
+            raise HTTPException(404, "File to replace not found")
+    limit = await _upload_cap(db, project_id)
+    if limit is not None and sess.total_size > limit:
+        raise HTTPException(413, "File exceeds the upload limit or remaining project quota")
+    res = await db.execute(select(UploadSessionChunk.offset, UploadSessionChunk.length, UploadSessionChunk.stored_path).where(UploadSessionChunk.session_id == session_id))
+    chunks = [tuple(r) for r in res.all()]
+    part = blobstore.temp_path()
+    try:
+        sha256, size = await asyncio.to_thread(_assemble, chunks, part)
+    except OSError:
+        await asyncio.to_thread(_discard, part)
+        raise HTTPException(409, "Upload chunks are missing; resend them")
+    stored = StoredUpload(path=part, size=size, sha256=sha256, content_type=sess.content_type or "application/octet-stream")
+    out, publish = await _store_upload(db, u, project_id, sess.folder, pf, sess.filename, stored.content_type, stored, folder_id=fid)
+    await db.execute(delete(UploadSessionChunk).where(UploadSessionChunk.session_id == session_id))
+    await db.delete(sess)
+    await db.commit()
+    publish()
+    await _drop_chunks([c[2] for c in chunks])
+    return out
+
+@router.delete("/uploads/{session_id}")
+async def abort_upload_session(session_id: str, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    sess = await _get_session(db, session_id, u)
+    locators = await _session_chunks(db, [session_id])
+    await db.execute(delete(UploadSessionChunk).where(UploadSessionChunk.session_id == session_id))
+    await db.delete(sess)
+    await db.commit()
+    await _drop_chunks(locators)
+    return {"ok": True}
+
+@jobs.every(900, name="upload_session_sweeper")
+async def _sweep_upload_sessions():
+    """Drop expired resumable upload sessions and their stored chunks."""
+    async with SessionLocal() as db:
+        res = await db.execute(select(UploadSession.id).where(UploadSession.expires_at < datetime.utcnow()))
+        ids = res.scalars().all()
+        if not ids:
+            return
+        locators = await _session_chunks(db, ids)
+        await db.execute(delete(UploadSessionChunk).where(UploadSessionChunk.session_id.in_(ids)))
+        await db.execute(delete(UploadSession).where(UploadSession.id.in_(ids)))
+        await db.commit()
+    await _drop_chunks(locators)
 
 @router.get("/items/{file_id}/versions")
 async def get_versions(file_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     pf = await db.get(ProjectFile, file_id)
     if not pf:
         raise HTTPException(404, "Not found")
-    if not await _can_access(db, u, pf.contract_id):
+    if not await permissions.can_access(db, u, pf.contract_id):
         raise HTTPException(403, "Not allowed")
     res = await db.execute(select(ProjectFileVersion).where(ProjectFileVersion.file_id == file_id).order_by(ProjectFileVersion.revision_no.asc()))
     out = [{"revision_no": v.revision_no, "size_bytes": v.size_bytes, "uploaded_at": v.uploaded_at} for v in res.scalars().all()]
     return out
 
+def _file_etag(sha256: Optional[str], fallback: str) -> str:
+    """Strong ETag: the blob hash when known, else a per-revision token."""
+    return f'"{sha256}"' if sha256 else f'"{fallback}"'
+
 @router.get("/items/{file_id}/download")
-async def download_latest(file_id: int, version: Optional[int] = None, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+async def download_latest(file_id: int, request: Request, version: Optional[int] = None, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     pf = await db.get(ProjectFile, file_id)
     if not pf:
         raise HTTPException(404, "Not found")
-    if not await _can_access(db, u, pf.contract_id):
+    if not await permissions.can_access(db, u, pf.contract_id):
         raise HTTPException(403, "Not allowed")
-    path = pf.stored_path
-    if version is not None:
-        res = await db.execute(select(ProjectFileVersion).where(ProjectFileVersion.file_id == file_id, ProjectFileVersion.revision_no == version))
+    path, sha256, size, media_type = pf.stored_path, pf.sha256, pf.size_bytes, pf.content_type
+    # the version row supplies a modification date that moves forward on every replace/restore
+    rev = version if version is not None else pf.latest_revision_no
+    v = None
+    if rev is not None:
+        res = await db.execute(select(ProjectFileVersion).where(ProjectFileVersion.file_id == file_id, ProjectFileVersion.revision_no == rev))
         v = res.scalar_one_or_none()
+    if version is not None:
         if not v:
             raise HTTPException(404, "Version not found")
-        path = v.stored_path
-    if not os.path.exists(path):
-        raise HTTPException(404, "File missing on disk")
-    fname = os.path.basename(path)
-    return FileResponse(path, media_type=pf.content_type or "application/octet-stream", filename=fname)
+        path, sha256, size, media_type = v.stored_path, v.sha256, v.size_bytes, v.content_type
+    if storage.is_remote(path):
+        if config.s3.presign_downloads:
+            return RedirectResponse(storage.presigned_url(path, pf.original_name), status_code=307)
+        # streamed through ranged GETs against the object store
+        source = {"size": size, "reader": storage.reader(path)}
+    else:
+        real, codec = await asyncio.to_thread(blobstore.locate, path)
+        if real is None:
+            raise HTTPException(404, "File missing on disk")
+        # cold revisions are decompressed on the fly
+        source = {} if codec is None else {"size": size, "reader": blobstore.cold_reader(path)}
+    etag = _file_etag(sha256, f"f{pf.id}-r{rev or 1}-{size}")
+    last_modified = v.uploaded_at if v else pf.uploaded_at
+    return await send_file(request, path, etag=etag, last_modified=last_modified, media_type=media_type or "application/octet-stream", filename=pf.original_name, **source)
 
 
 
+@router.get("/folders/{folder_id}/export")
+async def export_folder_zip(folder_id: int, rev: List[str] = Query([]), db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """
+        Stream a ZIP of the folder and its descendants. Folders the caller cannot read are skipped.
+        `rev=<file_id>:<revision_no>` (repeatable) picks a revision instead of the latest file.
+    """
+    folder = await db.get(ProjectFolder, folder_id)
+    if not folder:
+        raise HTTPException(404, "Folder not found")
+    if not await permissions.can_access(db, u, folder.contract_id):
+        raise HTTPException(403, "Not allowed")
+    wanted: dict[int, int] = {}
+    for item in rev:
+        fid_s, _, rev_s = item.partition(":")
+        try:
+            wanted[int(fid_s)] = int(rev_s)
+        except ValueError:
+            raise HTTPException(400, f"Invalid rev '{item}', expected <file_id>:<revision_no>")
+    await _ensure_closure(db, folder.contract_id)
+    res = await db.execute(select(ProjectFolder.id, ProjectFolder.path).join(ProjectFolderClosure, ProjectFolderClosure.descendant_id == ProjectFolder.id).where(ProjectFolderClosure.ancestor_id == folder.id))
+    matrix = await permissions.user_matrix(db, folder.contract_id, u)
+    readable = []
+    for fid, path in res.all():
+        can_read, _ = matrix.get(fid)
+        if can_read:
+            readable.append(path)
+    if not readable:
+        raise HTTPException(403, "No read access to this folder")
+    res = await db.execute(select(ProjectFile).where(ProjectFile.contract_id == folder.contract_id, ProjectFile.folder.in_(readable), ProjectFile.deleted_at.is_(None)).order_by(ProjectFile.folder.asc(), ProjectFile.original_name.asc()))
+    files = res.scalars().all()
+    versions: dict[int, ProjectFileVersion] = {}
+    if wanted:
+        pairs = [(f.id, wanted[f.id]) for f in files if f.id in wanted]
+        if pairs:
+            # only the requested (file_id, revision_no) rows
+            vres = await db.execute(select(ProjectFileVersion).where(tuple_(ProjectFileVersion.file_id, ProjectFileVersion.revision_no).in_(pairs)))
+            versions = {v.file_id: v for v in vres.scalars().all()}
+    # archive root is the exported folder itself
+    base = folder.path.rsplit("/", 1)[0] + "/" if "/" in folder.path else ""
+    entries, seen = [], set()
+    for f in files:
+        v = versions.get(f.id)
+        arcname = f"{(f.folder or '')[len(base):]}/{f.original_name}"
+        if v is not None:
+            stem, ext = os.path.splitext(arcname)
+            arcname = f"{stem} (rev {v.revision_no}){ext}"
+        stem, ext = os.path.splitext(arcname)
+        n = 2
+        while arcname in seen:
+            arcname = f"{stem} ({n}){ext}"
+            n += 1
+        seen.add(arcname)
+        entries.append(ZipEntry(arcname, v.stored_path if v else f.stored_path, v.uploaded_at if v else f.uploaded_at, v.size_bytes if v else f.size_bytes))
+    return StreamingResponse(stream_zip(entries, opener=blobstore.open_blob), media_type="application/zip", headers={"Content-Disposition": content_disposition(f"{folder.name}.zip")})
+
+
+@router.get("/items/{file_id}/thumbnail")
+async def file_thumbnail(file_id: int, size: int = Query(thumbnails.SIZES[0]), version: Optional[int] = None, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Redirect to the content-addressed (cacheable forever) thumbnail of the file or one of its revisions."""
+    pf = await db.get(ProjectFile, file_id)
+    if not pf:
+        raise HTTPException(404, "Not found")
+    if not await permissions.can_access(db, u, pf.contract_id):
+        raise HTTPException(403, "Not allowed")
+    sha256 = pf.sha256
+    if version is not None:
+        res = await db.execute(select(ProjectFileVersion.sha256).where(ProjectFileVersion.file_id == file_id, ProjectFileVersion.revision_no == version))
+        sha256 = res.scalar_one_or_none()
+    if not sha256:
+        raise HTTPException(404, "No preview available")
+    return RedirectResponse(f"{router.prefix}/thumbnails/{sha256}?size={size}", status_code=307)
+
+@router.get("/thumbnails/{sha256}")
+async def blob_thumbnail(sha256: str, request: Request, size: int = Query(thumbnails.SIZES[0]), db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    if size not in thumbnails.SIZES:
+        raise HTTPException(400, f"size must be one of {list(thumbnails.SIZES)}")
+    # readable if any project file (or revision) with this content is readable, or it is a library item
+    res = await db.execute(select(ProjectFile).where((ProjectFile.sha256 == sha256) | ProjectFile.id.in_(select(ProjectFileVersion.file_id).where(ProjectFileVersion.sha256 == sha256))).limit(20))
+    source, allowed = None, False
+    for f in res.scalars().all():
+        if not await permissions.can_access(db, u, f.contract_id):
+            continue
+        try:
+            fid = await permissions.folder_id_from_path(db, f.contract_id, f.folder)
+        except HTTPException:
+            continue
+        can_read, _ = await permissions.effective_perm(db, f.contract_id, u, fid)
+        if can_read:
+            source, allowed = f, True
+            break
+    if not allowed:
+        res = await db.execute(select(LibraryItem).where(LibraryItem.sha256 == sha256).limit(1))
+        lib = res.scalar_one_or_none()
+        if lib is None:
+            raise HTTPException(404, "Not found")
+        source, allowed = lib, True
+    etag = f'"{sha256}-{size}"'
+    path = thumbnails.thumb_path(sha256, size)
+    if await asyncio.to_thread(os.path.exists, path):
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type="image/jpeg", headers=headers)
+    # not rendered yet: queue it and let the client retry
+    if isinstance(source, LibraryItem):
+        src, content_type = source.path, mimetypes.guess_type(source.path)[0]
+    else:
+        src, content_type = source.stored_path, source.content_type
+        if source.sha256 != sha256:
+            blob = await db.get(StorageBlob, sha256)
+            src = blob.stored_path if blob else blobstore.blob_path(sha256)
+    if not thumbnails.can_preview(content_type):
+        raise HTTPException(404, "No preview available")
+    thumbnails.enqueue(src, sha256, content_type)
+    return Response(status_code=202, headers={"Retry-After": "2", "Cache-Control": "no-store"})
+
 @router.post("/items/{file_id}/restore")
 async def restore(file_id: int, version: int = Form(...), db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     pf = await db.get(ProjectFile, file_id)
     if not pf:
         raise HTTPException(404, "Not found")
-    if not await _can_access(db, u, pf.contract_id):
+    if not await permissions.can_access(db, u, pf.contract_id):
         raise HTTPException(403, "Not allowed")
     # find target version
     res = await db.execute(select(ProjectFileVersion).where(ProjectFileVersion.file_id == file_id, ProjectFileVersion.revision_no == version))
@@ -359,23 +1006,99 @@ async def restore(file_id: int, version: int = Form(...), db: AsyncSession = Dep
         raise HTTPException(404, "Version not found")
 
     # next revision number
-    res2 = await db.execute(select(func.coalesce(func.max(ProjectFileVersion.revision_no), 0)).where(ProjectFileVersion.file_id == file_id))
-    next_rev = (res2.scalar_one() or 0) + 1
+    curr_max = pf.latest_revision_no
+    if curr_max is None:
+        curr_max = (await _latest_revisions(db, [pf.id])).get(pf.id, 0)
+    next_rev = curr_max + 1
 
     # logically "restore" by pointing the latest to the chosen blob and recording a new revision
+    # (the ProjectFile row and the new version row both reference v's blob)
+    await blobstore.incref(db, v.sha256, 2)
+    await blobstore.decref(db, pf.sha256)
+    # the current file always lives on the hot tier
+    try:
+        await blobstore.thaw(db, v.sha256)
+    except FileNotFoundError:
+        await db.rollback()
+        raise HTTPException(404, "File missing on disk")
+    folder_id = await permissions.folder_id_from_path(db, pf.contract_id, pf.folder, strict=False)
+    await usage.add(db, pf.contract_id, folder_id, bytes_used=v.size_bytes or 0, versions=1)
     pf.stored_path = v.stored_path
+    pf.sha256 = v.sha256
     pf.content_type = v.content_type
     pf.size_bytes = v.size_bytes
+    pf.latest_revision_no = next_rev
     await db.flush()
 
-    db.add(ProjectFileVersion(file_id=pf.id, revision_no=next_rev, stored_path=v.stored_path, content_type=v.content_type, size_bytes=v.size_bytes, uploaded_by=getattr(u, "id", None)))
+    restored = ProjectFileVersion(file_id=pf.id, revision_no=next_rev, stored_path=v.stored_path, sha256=v.sha256, content_type=v.content_type, size_bytes=v.size_bytes, uploaded_by=getattr(u, "id", None))
+    db.add(restored)
     await db.commit()
+    if folder_id is None and pf.folder:
+        folder_id = search_index.UNKNOWN_FOLDER
+    search_index.enqueue(search_index.file_doc(pf, folder_id))
+    search_index.enqueue(search_index.version_doc(restored, pf, folder_id))
     return {"ok": True, "revision_no": next_rev}
 
 
+@router.get("/projects/{project_id}/usage")
+async def project_usage(project_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Storage usage of a project from the maintained counters, with per-folder direct and subtree totals."""
+    if not await permissions.can_access(db, u, project_id):
+        raise HTTPException(403, "Not allowed")
+    total = await db.get(ContractStorageUsage, project_id)
+    res = await db.execute(select(FolderStorageUsage.folder_id, FolderStorageUsage.bytes_used, FolderStorageUsage.file_count).where(FolderStorageUsage.contract_id == project_id))
+    direct = {fid: (b, n) for fid, b, n in res.all()}
+    await _ensure_closure(db, project_id)
+    res = await db.execute(select(ProjectFolderClosure.ancestor_id, func.sum(FolderStorageUsage.bytes_used), func.sum(FolderStorageUsage.file_count))
+                           .join(FolderStorageUsage, (FolderStorageUsage.folder_id == ProjectFolderClosure.descendant_id) & (FolderStorageUsage.contract_id == project_id))
+                           .group_by(ProjectFolderClosure.ancestor_id))
+    subtree = {fid: (int(b or 0), int(n or 0)) for fid, b, n in res.all()}
+    folders = []
+    for fid in sorted(set(direct) | set(subtree)):
+        b, n = direct.get(fid, (0, 0))
+        sb, sn = subtree.get(fid, (b, n))
+        folders.append({"folder_id": fid or None, "bytes_used": b, "file_count": n, "subtree_bytes": sb, "subtree_files": sn})
+    return {
+        "contract_id": project_id,
+        "bytes_used": total.bytes_used if total else 0,
+        "file_count": total.file_count if total else 0,
+        "version_count": total.version_count if total else 0,
+        "blob_bytes": total.blob_bytes if total else 0,
+        "quota_bytes": total.quota_bytes if total else None,
+        "folders": folders,
+    }
+
+@router.get("/projects/{project_id}/retention")
+async def get_retention(project_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    if not await permissions.can_access(db, u, project_id):
+        raise HTTPException(403, "Not allowed")
+    p = await db.get(RetentionPolicy, project_id)
+    if p is None:
+        return {"contract_id": project_id, "enabled": False, "keep_hot_revisions": None, "cold_after_days": None}
+    return {"contract_id": project_id, "enabled": bool(p.enabled), "keep_hot_revisions": p.keep_hot_revisions, "cold_after_days": p.cold_after_days}
+
+@router.put("/projects/{project_id}/retention")
+async def set_retention(project_id: int,
+                        enabled: bool = Form(True),
+                        keep_hot_revisions: int = Form(3),
+                        cold_after_days: int = Form(30),
+                        db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Retention policy: older revisions than the newest `keep_hot_revisions` move to cold storage after `cold_after_days`."""
+    if getattr(u, "role_id", None) != 1:
+        raise HTTPException(403, "Admin only")
+    if keep_hot_revisions < 1 or cold_after_days < 0:
+        raise HTTPException(400, "keep_hot_revisions must be >= 1 and cold_after_days >= 0")
+    p = await db.get(RetentionPolicy, project_id)
+    if p is None:
+        p = RetentionPolicy(contract_id=project_id)
+        db.add(p)
+    p.enabled, p.keep_hot_revisions, p.cold_after_days = enabled, keep_hot_revisions, cold_after_days
+    await db.commit()
+    return {"ok": True}
+
 @router.get("/projects/{project_id}/members")
 async def list_members(project_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    if not await _can_access(db, u, project_id):
+    if not await permissions.can_access(db, u, project_id):
         raise HTTPException(403, "Not allowed")
     res = await db.execute(select(ContractAccess.user_id).where(ContractAccess.contract_id == project_id))
     user_ids = [row[0] for row in res.all()]
@@ -389,7 +1112,7 @@ async def list_members(project_id: int, db: AsyncSession = Depends(get_db), u: U
 async def get_permissions(folder_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     folder = await db.get(ProjectFolder, folder_id)
     if not folder: raise HTTPException(404, "Folder not found")
-    if not await _can_access(db, u, folder.contract_id):
+    if not await permissions.can_access(db, u, folder.contract_id):
         raise HTTPException(403, "Not allowed")
     # list members and explicit perms (inherit handled on access check, but we return explicit entries here)
     res = await db.execute(select(ContractAccess.user_id).where(ContractAccess.contract_id == folder.contract_id))
@@ -411,7 +1134,7 @@ async def get_permissions(folder_id: int, db: AsyncSession = Depends(get_db), u:
 async def set_permission(folder_id: int, user_id: int = Form(...), can_read: int = Form(1), can_write: int = Form(0), db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     folder = await db.get(ProjectFolder, folder_id)
     if not folder: raise HTTPException(404, "Folder not found")
-    if not await _can_access(db, u, folder.contract_id):
+    if not await permissions.can_access(db, u, folder.contract_id):
         raise HTTPException(403, "Not allowed")
     # upsert
     res = await db.execute(select(ProjectFolderPermission).where(ProjectFolderPermission.contract_id == folder.contract_id, ProjectFolderPermission.folder_id == folder_id, ProjectFolderPermission.user_id == user_id))
@@ -419,14 +1142,18 @@ async def set_permission(folder_id: int, user_id: int = Form(...), can_read: int
     if (not can_read) and (not can_write):
         if row:
             await db.delete(row)
+            await permissions.bump(db, folder.contract_id)
             await db.commit()
         return {"ok": True, "deleted": True}
     if row:
         row.can_read = 1 if can_read else 0
         row.can_write = 1 if can_write else 0
+        await permissions.bump(db, folder.contract_id)
         await db.commit()
         return {"ok": True, "updated": True}
     else:
         newp = ProjectFolderPermission(contract_id=folder.contract_id, folder_id=folder_id, user_id=user_id, can_read=1 if can_read else 0, can_write=1 if can_write else 0)
-        db.add(newp); await db.commit()
+        db.add(newp)
+        await permissions.bump(db, folder.contract_id)
+        await db.commit()
         return {"ok": True, "created": True}
@@ -4,6 +4,7 @@ from sqlalchemy import select
 from ..security import get_db, get_current_user
 from ..models.models import LibraryItem, LibraryCategory, User
 from ..utils import save_upload
+from .. import search_index, thumbnails
 
 router = APIRouter(prefix="/api/library", tags=["library"])
 
@@ -14,7 +15,9 @@ async def list_categories(db: AsyncSession = Depends(get_db), u: User = Depends(
 
 @router.post("/upload")
 async def upload_library_file(category_id: int | None = None, file: UploadFile = None, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    stored_name, path, size, mime = await save_upload(file, subdir="library")
-    item = LibraryItem(category_id=category_id, title=file.filename, path=path, uploaded_by=u.id)
+    stored_name, path, size, mime, sha256 = await save_upload(file, subdir="library")
+    item = LibraryItem(category_id=category_id, title=file.filename, path=path, sha256=sha256, uploaded_by=u.id)
     db.add(item); await db.commit()
+    search_index.enqueue(search_index.library_doc(item))
+    thumbnails.enqueue(path, sha256, mime)
     return {"ok": True, "id": item.id}
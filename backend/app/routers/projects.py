@@ -3,10 +3,13 @@ import os
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from ..security import get_db, get_current_user
 from ..config import config
 from ..models.models import Contract, ContractAccess, ProjectMessage, ProjectFile, User
+from ..models.models_files import ProjectFileVersion
+from ..models.models_schedule import ProjectFolder
+from .. import blobstore, permissions, search_index, usage
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
@@ -70,9 +73,21 @@ async def update_file(file_id: int, folder: int | None = Form(None), description
     if not (u.role_id == 1 or row[1] is not None):
         raise HTTPException(status_code=403, detail='Not allowed')
     pf = row[0]
-    if folder is not None: pf.folder = folder
+    if folder is not None:
+        # `folder` is a folder id (0 = project root); files reference their folder by path
+        dst = None
+        if folder:
+            dst = await db.get(ProjectFolder, folder)
+            if not dst or dst.contract_id != pf.contract_id:
+                raise HTTPException(status_code=404, detail='Folder not found')
+        src_fid = await permissions.folder_id_from_path(db, pf.contract_id, pf.folder, strict=False)
+        footprint, _ = await usage.file_footprint(db, pf)
+        await usage.move(db, pf.contract_id, src_fid, dst.id if dst else None, footprint)
+        pf.folder = dst.path if dst else None
     if description is not None: pf.description = description
     await db.commit()
+    if folder is not None:
+        search_index.enqueue(search_index.file_doc(pf, dst.id if dst else None))
     return {"ok": True}
 
 @router.delete("/files/{file_id}", operation_id="delete_file_project")
@@ -84,6 +99,13 @@ async def delete_file(file_id: int, db: AsyncSession = Depends(get_db), u: User
     # (Rest of the code remains the same)
     if not (u.role_id == 1 or row[1] is not None):
         raise HTTPException(status_code=403, detail='Not allowed')
+    footprint, revisions = await usage.file_footprint(db, pf)
+    await usage.add(db, pf.contract_id, await permissions.folder_id_from_path(db, pf.contract_id, pf.folder, strict=False), bytes_used=-footprint, files=-1, versions=-revisions)
+    # release blob references held by the file row and its revisions (rows cascade with the file)
+    await blobstore.decref(db, pf.sha256)
+    vres = await db.execute(select(ProjectFileVersion.sha256, func.count()).where(ProjectFileVersion.file_id == pf.id, ProjectFileVersion.sha256.is_not(None)).group_by(ProjectFileVersion.sha256))
+    for sha256, n in vres.all():
+        await blobstore.decref(db, sha256, n)
     await db.delete(pf)
     await db.commit()
     return {"ok": True}
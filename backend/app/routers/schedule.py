@@ -1,16 +1,22 @@
 from __future__ import annotations
 
-from datetime import date
+import os, asyncio
+from dataclasses import asdict
+from datetime import date, datetime, timedelta
 from typing import Optional, List, Set
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy import select, func, case, delete
+from sqlalchemy import select, func, case, delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..security import get_current_user, get_db
 from ..models.models import User
-from ..models.models_schedule import ProjectScheduleItem
+from ..models.models_schedule import ProjectScheduleItem, ScheduleDependency, ScheduleBaseline, ScheduleBaselineItem
+from ..utils import stream_upload, upload_limit
+from ..file_responses import content_disposition
+from .. import schedule_tree, schedule_integrity, schedule_baseline, schedule_io, ranking, cpm, storage, gantt
 
 router = APIRouter(prefix="/api/schedule", tags=["schedule"])
 
@@ -26,6 +32,13 @@ class ItemOut(BaseModel):
     actual_end: Optional[date] = None
     progress: int = 0
     sort_index: int = 0
+    sort_key: Optional[str] = None
+    early_start: Optional[date] = None
+    early_finish: Optional[date] = None
+    late_start: Optional[date] = None
+    late_finish: Optional[date] = None
+    total_float: Optional[int] = None
+    critical: bool = False
 
     class Config:
         from_attributes = True
@@ -55,101 +68,118 @@ class ReorderPayload(BaseModel):
     item_ids_in_order: List[int]
 
 
+class MovePayload(BaseModel):
+    parent_id: Optional[int] = None
+    # the sibling to land after / before; neither = end of the list
+    after_id: Optional[int] = None
+    before_id: Optional[int] = None
+
+
+class MoveOp(MovePayload):
+    id: int
+
+
+class BulkMovePayload(BaseModel):
+    moves: List[MoveOp] = Field(..., max_length=1000)
+
+
+class DependencyIn(BaseModel):
+    predecessor_id: int
+    successor_id: int
+    type: str = Field("FS", pattern="^(FS|SS|FF|SF)$")
+    lag_days: int = Field(0, ge=-3650, le=3650)
+
+
+class BaselineIn(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+
+
+class BaselineOut(BaseModel):
+    id: int
+    contract_id: int
+    name: str
+    item_count: int
+    created_by: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class DependencyOut(DependencyIn):
+    id: int
+    contract_id: int
+
+    class Config:
+        from_attributes = True
+
+
 # ---------- Helpers ----------
 
-async def _heal_cycles_for_contract(db: AsyncSession, contract_id: int) -> int:
-    """     Auto-heal bad parent chains:
-        - Break self-parenting `parent_id = id`
-        - Break cycles (A->B->C->A) by setting the starting node's parent to NULL
-        - Break dangling parents (pointing to non-existent id)
-        Returns number of items modified.
+async def _collect_descendants(db: AsyncSession, contract_id: int, item_id: int) -> Set[int]:
+    """The item and all its descendant IDs (one recursive query)."""
+    return await schedule_tree.subtree_ids(db, contract_id, item_id)
+
+async def _would_create_cycle(db: AsyncSession, contract_id: int, item_id: int, new_parent_id: Optional[int]) -> bool:
+    """Check if setting new_parent_id would create a cycle (one recursive query over the new parent's ancestors)."""
+    return await schedule_tree.would_create_cycle(db, contract_id, item_id, new_parent_id)
+
+async def _last_key(db: AsyncSession, contract_id: int, parent_id: Optional[int]) -> str:
+    P = ProjectScheduleItem
+    parent = P.parent_id.is_(None) if parent_id is None else P.parent_id == parent_id
+    res = await db.execute(select(func.max(P.sort_key)).where(P.contract_id == contract_id, parent))
+    return ranking.last(res.scalar())
+
+async def _apply_moves(db: AsyncSession, contract_id: int, moves: List[MoveOp]) -> dict:
     """
-    # Load all ids and parents for this contract
-    res = await db.execute(select(ProjectScheduleItem.id, ProjectScheduleItem.parent_id).where(ProjectScheduleItem.contract_id == contract_id))
-    rows = res.all()
-    id_to_parent = {int(r[0]): (None if r[1] is None else int(r[1])) for r in rows}
-    modified = 0
-    to_nullify = {} # item_id -> old_parent
-    def mark_null(i):
-        nonlocal modified
-        if i in id_to_parent and id_to_parent[i] is not None:
-            to_nullify[i] = id_to_parent[i]
-            id_to_parent[i] = None
-            modified += 1
-    # Self-parenting
-    for i, p in list(id_to_parent.items()):
-        if p == i:
-            mark_null(i)
-    # Dangling parents
-    for i, p in list(id_to_parent.items()):
-        if p is not None and p not in id_to_parent:
-            mark_null(i)
-    # Cycles
-    for i in list(id_to_parent.keys()):
-        seen = set()
-        current = i
-        while current is not None:
-            if current in seen:
-                mark_null(i)
-                break
-            seen.add(current)
-            current = id_to_parent.get(current)
-    if modified > 0:
-        for i, p in to_nullify.items():
-            db.add(ProjectScheduleItem(id=i, parent_id=None, __is_modified__=True))
-    await db.commit()
-    return modified
-
-async def _recalc_parent_chain(db: AsyncSession, parent_id: Optional[int]):
-    """Walk up parent chain and update progress based on children."""
-    current_id = parent_id
-    while current_id is not None:
-        children_res = await db.execute(select(func.sum(ProjectScheduleItem.progress)).where(ProjectScheduleItem.parent_id == current_id))
-        total_progress = children_res.scalar_one_or_none() or 0
-        item = await db.get(ProjectScheduleItem, current_id)
-        if item:
-            item.progress = total_progress
-            await db.flush()
-        current_id = item.parent_id if item else None
-
-async def _collect_descendants(db: AsyncSession, item_id: int) -> Set[int]:
-    """Recursively collect all descendant item IDs."""
-    ids = {item_id}
-    q = [item_id]
-    while q:
-        parent_id = q.pop(0)
-        res = await db.execute(select(ProjectScheduleItem.id).where(ProjectScheduleItem.parent_id == parent_id))
-        children = res.scalars().all()
-        for child_id in children:
-            if child_id not in ids:
-                ids.add(child_id)
-                q.append(child_id)
-    return ids
-
-async def _would_create_cycle(db: AsyncSession, item_id: int, new_parent_id: Optional[int]) -> bool:
-    """Check if setting new_parent_id would create a cycle."""
-    if new_parent_id is None:
-        return False
-    # Walk up the parent chain from the new parent. If we encounter the item itself, it's a cycle.
-    current_id = new_parent_id
-    while current_id is not None:
-        if current_id == item_id:
-            return True
-        item = await db.get(ProjectScheduleItem, current_id)
-        if not item:
-            return False # Parent not found, not a cycle.
-        current_id = item.parent_id
-    return False
+        Apply moves in order against one load of the contract's (id, parent, key) rows, then write
+        every changed row with one executemany UPDATE. A plain move rewrites only the moved row.
+    """
+    P = ProjectScheduleItem
+    res = await db.execute(select(P.id, P.parent_id, P.sort_key).where(P.contract_id == contract_id)
+                           .order_by(P.sort_key, P.sort_index, P.id))
+    parents, groups = {}, {}
+    for i, p, k in res.all():
+        parents[i] = p
+        groups.setdefault(p, []).append([i, k])
+    old_parents = dict(parents)
+    changed, skipped = {}, []
+    for m in moves:
+        bad = m.id not in parents or (m.parent_id is not None and m.parent_id not in parents)
+        # walk up from the target parent: the item may not end up below itself
+        cur, seen = m.parent_id, set()
+        while not bad and cur is not None and cur not in seen:
+            bad = cur == m.id
+            seen.add(cur)
+            cur = parents.get(cur)
+        if bad:
+            skipped.append(m.id)
+            continue
+        parents[m.id] = m.parent_id
+        changed.update(ranking.apply_moves(groups, [(m.id, m.parent_id, m.after_id, m.before_id)]))
+    if changed:
+        now = datetime.utcnow()
+        await db.execute(update(P), [{"id": i, "parent_id": g, "sort_key": k, "updated_at": now} for i, (g, k) in changed.items()])
+        dirty = {p for i in changed for p in (old_parents[i], parents[i]) if p is not None}
+        await schedule_tree.rollup(db, contract_id, dirty)
+        if any(old_parents[i] != parents[i] for i in changed):
+            await cpm.recalc(db, contract_id)
+    return {"moved": sorted(changed), "skipped": skipped}
 
 @router.get("/projects/{contract_id}/items", operation_id="list_schedule_items")
 async def list_items(contract_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(ProjectScheduleItem).where(ProjectScheduleItem.contract_id == contract_id).order_by(ProjectScheduleItem.sort_index))
+    res = await db.execute(select(ProjectScheduleItem).where(ProjectScheduleItem.contract_id == contract_id).order_by(ProjectScheduleItem.sort_key, ProjectScheduleItem.sort_index, ProjectScheduleItem.id))
     return res.scalars().all()
 
 @router.post("/projects/{contract_id}/items", operation_id="create_schedule_item")
 async def create_item(contract_id: int, payload: ItemCreate, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     item = ProjectScheduleItem(contract_id=contract_id, **payload.dict())
+    item.sort_key = await _last_key(db, contract_id, item.parent_id)
     db.add(item)
+    await db.flush()
+    if item.parent_id is not None:
+        await schedule_tree.rollup(db, contract_id, [item.parent_id])
+    await cpm.recalc(db, contract_id)
     await db.commit()
     await db.refresh(item)
     return item
@@ -159,49 +189,279 @@ async def update_item(item_id: int, payload: ItemPatch, db: AsyncSession = Depen
     item = await db.get(ProjectScheduleItem, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Not found")
+    old_parent = item.parent_id
     data = payload.dict(exclude_unset=True)
+    if data.get("parent_id") is not None and data["parent_id"] != old_parent:
+        if await _would_create_cycle(db, item.contract_id, item.id, data["parent_id"]):
+            raise HTTPException(status_code=400, detail="Parent would create a cycle")
+    if "parent_id" in data and data["parent_id"] != old_parent:
+        item.sort_key = await _last_key(db, item.contract_id, data["parent_id"])
     for k, v in data.items():
         setattr(item, k, v)
+    await db.flush()
+    # the item's own rollup (if it has children), its ancestors, and the chain it left on a move
+    await schedule_tree.rollup(db, item.contract_id, [item.id] + ([old_parent] if old_parent is not None else []))
+    if item.parent_id != old_parent:
+        await cpm.recalc(db, item.contract_id)
+    elif "planned_start" in data or "planned_end" in data:
+        # same network, new duration / start: only this activity's cones are re-walked
+        await cpm.recalc(db, item.contract_id, [item.id])
     await db.commit()
     await db.refresh(item)
-    await _recalc_parent_chain(db, item.parent_id)
     return item
 
 @router.post("/items/reorder", operation_id="reorder_schedule_items")
 async def reorder_items(payload: ReorderPayload, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Place the listed items, in this order, as the children of parent_id (one executemany UPDATE)."""
     step = 10
-    for idx, item_id in enumerate(payload.item_ids_in_order):
-        item = await db.get(ProjectScheduleItem, item_id)
-        if not item or item.contract_id != payload.contract_id:
-            continue
-        # Validate cycle
-        if await _would_create_cycle(db, item.id, payload.parent_id):
-            continue
-        item.parent_id = payload.parent_id
-        item.sort_index = (idx + 1) * step
-        await db.flush()
+    dirty = [payload.parent_id] if payload.parent_id is not None else []
+    res = await db.execute(select(ProjectScheduleItem.id, ProjectScheduleItem.parent_id)
+                           .where(ProjectScheduleItem.id.in_(payload.item_ids_in_order),
+                                  ProjectScheduleItem.contract_id == payload.contract_id))
+    found = dict(res.all())
+    # an item may not move under itself: it must not be the new parent or one of its ancestors
+    above = set()
+    if payload.parent_id is not None:
+        above = await schedule_tree.ancestor_ids(db, payload.contract_id, payload.parent_id)
+    order = list(dict.fromkeys(i for i in payload.item_ids_in_order if i in found and i not in above))
+    dirty += [found[i] for i in order if found[i] is not None and found[i] != payload.parent_id]
+    now = datetime.utcnow()
+    rows = [{"id": i, "parent_id": payload.parent_id, "sort_key": k, "sort_index": (idx + 1) * step, "updated_at": now}
+            for idx, (i, k) in enumerate(zip(order, ranking.spread(len(order))))]
+    if rows:
+        await db.execute(update(ProjectScheduleItem), rows)
+    await schedule_tree.rollup(db, payload.contract_id, dirty)
+    if any(found[i] != payload.parent_id for i in order):
+        await cpm.recalc(db, payload.contract_id)
     await db.commit()
-    await _recalc_parent_chain(db, payload.parent_id)
     return {"ok": True}
 
+@router.post("/items/{item_id}/move", operation_id="move_schedule_item")
+async def move_item(item_id: int, payload: MovePayload, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Drag-and-drop move: a new key between the neighbours, so only this row is rewritten."""
+    item = await db.get(ProjectScheduleItem, item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Not found")
+    result = await _apply_moves(db, item.contract_id, [MoveOp(id=item_id, **payload.dict())])
+    if result["skipped"]:
+        raise HTTPException(status_code=400, detail="Parent would create a cycle")
+    await db.commit()
+    await db.refresh(item)
+    return item
+
+@router.post("/projects/{contract_id}/items/move", operation_id="bulk_move_schedule_items")
+async def bulk_move_items(contract_id: int, payload: BulkMovePayload, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Apply many moves in order and write them in a single statement; invalid moves are skipped."""
+    result = await _apply_moves(db, contract_id, payload.moves)
+    await db.commit()
+    return result
+
 @router.delete("/items/{item_id}", operation_id="delete_schedule_item")
 async def delete_item(item_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     item = await db.get(ProjectScheduleItem, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Not found")
-    parent = item.parent_id
-    ids = await _collect_descendants(db, item_id)
-    # delete children first to satisfy any FK constraints
-    for iid in sorted(ids, reverse=True):
-        obj = await db.get(ProjectScheduleItem, iid)
-        if obj:
-            await db.delete(obj)
+    parent, contract_id = item.parent_id, item.contract_id
+    ids = await _collect_descendants(db, contract_id, item_id)
+    # the whole subtree in one statement; parent_id is ON DELETE SET NULL, so row order does not matter
+    await db.execute(delete(ProjectScheduleItem).where(ProjectScheduleItem.id.in_(ids))
+                     .execution_options(synchronize_session=False))
+    db.expunge(item)
+    if parent is not None:
+        await schedule_tree.rollup(db, contract_id, [parent])
+    await cpm.recalc(db, contract_id)
+    await db.commit()
+    return {"ok": True}
+
+# ---------- Dependencies & critical path ----------
+
+@router.get("/projects/{contract_id}/dependencies", operation_id="list_schedule_dependencies")
+async def list_dependencies(contract_id: int, db: AsyncSession = Depends(get_db)):
+    res = await db.execute(select(ScheduleDependency).where(ScheduleDependency.contract_id == contract_id).order_by(ScheduleDependency.id))
+    return [DependencyOut.model_validate(d) for d in res.scalars().all()]
+
+@router.post("/projects/{contract_id}/dependencies", operation_id="create_schedule_dependency")
+async def create_dependency(contract_id: int, payload: DependencyIn, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    if payload.predecessor_id == payload.successor_id:
+        raise HTTPException(status_code=400, detail="An item cannot depend on itself")
+    res = await db.execute(select(func.count()).select_from(ProjectScheduleItem)
+                           .where(ProjectScheduleItem.id.in_([payload.predecessor_id, payload.successor_id]),
+                                  ProjectScheduleItem.contract_id == contract_id))
+    if res.scalar() != 2:
+        raise HTTPException(status_code=404, detail="Not found")
+    # summary items take their dates from the rollup, so the critical path would ignore the link
+    res = await db.execute(select(ProjectScheduleItem.id)
+                           .where(ProjectScheduleItem.parent_id.in_([payload.predecessor_id, payload.successor_id]),
+                                  ProjectScheduleItem.contract_id == contract_id).limit(1))
+    if res.first() is not None:
+        raise HTTPException(status_code=400, detail="Summary items cannot have dependencies")
+    res = await db.execute(select(ScheduleDependency.predecessor_id, ScheduleDependency.successor_id)
+                           .where(ScheduleDependency.contract_id == contract_id))
+    links = res.all()
+    if (payload.predecessor_id, payload.successor_id) in links:
+        raise HTTPException(status_code=409, detail="Dependency already exists")
+    if cpm.creates_loop(links, payload.predecessor_id, payload.successor_id):
+        raise HTTPException(status_code=400, detail="Dependency would create a loop")
+    dep = ScheduleDependency(contract_id=contract_id, **payload.dict())
+    db.add(dep)
+    await db.flush()
+    await cpm.recalc(db, contract_id)
+    await db.commit()
+    return DependencyOut.model_validate(dep)
+
+@router.delete("/dependencies/{dependency_id}", operation_id="delete_schedule_dependency")
+async def delete_dependency(dependency_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    dep = await db.get(ScheduleDependency, dependency_id)
+    if not dep:
+        raise HTTPException(status_code=404, detail="Not found")
+    contract_id = dep.contract_id
+    await db.delete(dep)
+    await db.flush()
+    await cpm.recalc(db, contract_id)
+    await db.commit()
+    return {"ok": True}
+
+@router.get("/projects/{contract_id}/critical-path", operation_id="schedule_critical_path")
+async def critical_path(contract_id: int, db: AsyncSession = Depends(get_db)):
+    """Fresh CPM pass over the contract (nothing is written): dates, floats and the zero-float chain."""
+    net = await cpm.Network.load(db, contract_id)
+    sched = net.compute()
+    activities = []
+    for k, i in enumerate(net.ids):
+        es, ef, ls, lf, tf, crit = net.values(sched, k)
+        activities.append({"id": i, "early_start": es, "early_finish": ef, "late_start": ls, "late_finish": lf,
+                           "total_float": tf, "critical": crit})
+    return {
+        "project_start": net.base,
+        "project_finish": net.base + timedelta(days=sched.finish - 1) if net.ids else None,
+        "critical_path": net.critical_path(sched),
+        "activities": activities,
+        "in_loops": [net.ids[k] for k in net.cyclic],
+        "ignored_dependencies": net.ignored,
+    }
+
+# ---------- Baselines ----------
+
+async def _baseline(db: AsyncSession, baseline_id: int) -> ScheduleBaseline:
+    baseline = await db.get(ScheduleBaseline, baseline_id)
+    if not baseline:
+        raise HTTPException(status_code=404, detail="Not found")
+    return baseline
+
+@router.get("/projects/{contract_id}/baselines", operation_id="list_schedule_baselines")
+async def list_baselines(contract_id: int, db: AsyncSession = Depends(get_db)):
+    res = await db.execute(select(ScheduleBaseline).where(ScheduleBaseline.contract_id == contract_id).order_by(ScheduleBaseline.id.desc()))
+    return [BaselineOut.model_validate(b) for b in res.scalars().all()]
+
+@router.post("/projects/{contract_id}/baselines", operation_id="create_schedule_baseline")
+async def create_baseline(contract_id: int, payload: BaselineIn, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Snapshot the contract's schedule as it stands now (one INSERT ... SELECT)."""
+    baseline = await schedule_baseline.snapshot(db, contract_id, payload.name, u.id)
+    await db.commit()
+    return BaselineOut.model_validate(baseline)
+
+@router.get("/baselines/{baseline_id}/items", operation_id="list_schedule_baseline_items")
+async def baseline_items(baseline_id: int, db: AsyncSession = Depends(get_db)):
+    await _baseline(db, baseline_id)
+    BI = ScheduleBaselineItem
+    res = await db.execute(select(BI.item_id, *(getattr(BI, f) for f in schedule_baseline.FIELDS))
+                           .where(BI.baseline_id == baseline_id).order_by(BI.item_id))
+    return [dict(r) for r in res.mappings()]
+
+@router.get("/baselines/{baseline_id}/diff", operation_id="diff_schedule_baseline")
+async def diff_baseline(baseline_id: int, against: Optional[int] = None, include_unchanged: bool = False, db: AsyncSession = Depends(get_db)):
+    """Slips, added / removed items and progress deltas against the live schedule or another baseline."""
+    baseline = await _baseline(db, baseline_id)
+    other = None
+    if against is not None:
+        other = await _baseline(db, against)
+        if other.contract_id != baseline.contract_id:
+            raise HTTPException(status_code=400, detail="Baselines belong to different contracts")
+    return await schedule_baseline.diff(db, baseline, other, include_unchanged)
+
+@router.delete("/baselines/{baseline_id}", operation_id="delete_schedule_baseline")
+async def delete_baseline(baseline_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Baselines are immutable; only an admin can drop one."""
+    if getattr(u, "role_id", None) != 1:
+        raise HTTPException(403, "Not allowed")
+    baseline = await _baseline(db, baseline_id)
+    await db.delete(baseline)
     await db.commit()
-    await _recalc_parent_chain(db, parent)
     return {"ok": True}
 
+# ---------- Gantt ----------
+
+@router.get("/projects/{contract_id}/gantt", operation_id="schedule_gantt")
+async def gantt_view(contract_id: int, depth: int = Query(2, ge=1, le=50), expand: Optional[str] = None,
+                     start: Optional[date] = None, end: Optional[date] = None, unit: str = Query("week", pattern="^(week|month)$"),
+                     offset: int = Query(0, ge=0), limit: int = Query(200, ge=1, le=1000), db: AsyncSession = Depends(get_db)):
+    """
+        One screen of the Gantt: the tree collapsed to `depth` (plus the comma-separated `expand` ids), rolled-up
+        envelopes and progress, and week / month bucket coverage over start..end (default: the whole project).
+    """
+    try:
+        expanded = {int(x) for x in (expand or "").split(",") if x.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="expand must be comma-separated item ids")
+    return await gantt.view(db, contract_id, depth, expanded, start, end, unit, offset, limit)
+
+# ---------- Import / export ----------
+
+@router.post("/projects/{contract_id}/import", operation_id="import_schedule")
+async def import_schedule(contract_id: int, file: UploadFile = File(...), format: Optional[str] = Form(None),
+                          mode: str = Form("append", pattern="^(append|replace)$"),
+                          db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Bulk import from CSV or MS Project XML in one transaction; `replace` drops the current items first."""
+    fmt = format or ("xml" if (file.filename or "").lower().endswith(".xml") else "csv")
+    if fmt not in ("csv", "xml"):
+        raise HTTPException(status_code=400, detail="format must be csv or xml")
+    stored = await stream_upload(file, storage.temp_path(), upload_limit(contract_id))
+    report = schedule_io.ImportReport()
+    try:
+        rows = await asyncio.to_thread(schedule_io.read_rows, stored.path, fmt, report)
+    except schedule_io.ScheduleImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await asyncio.to_thread(os.remove, stored.path)
+    if rows:
+        await schedule_io.import_rows(db, contract_id, rows, report, replace=(mode == "replace"))
+        await db.commit()
+    return asdict(report)
+
+@router.get("/projects/{contract_id}/export", operation_id="export_schedule")
+async def export_schedule(contract_id: int, format: str = Query("csv", pattern="^(csv|xml)$"), u: User = Depends(get_current_user)):
+    """Streamed in display order (CSV round-trips through the importer; XML is MS Project's format)."""
+    if format == "xml":
+        body, media, name = schedule_io.export_msp(contract_id, f"Contract {contract_id}"), "application/xml", f"schedule-{contract_id}.xml"
+    else:
+        body, media, name = schedule_io.export_csv(contract_id), "text/csv", f"schedule-{contract_id}.csv"
+    return StreamingResponse(body, media_type=media, headers={"Content-Disposition": content_disposition(name)})
+
+@router.post("/maintenance/{contract_id}/rollup", operation_id="maintenance_rollup_schedule")
+async def maintenance_rollup(contract_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Recompute every parent's progress and date envelope from its children."""
+    updated = await schedule_tree.rollup(db, contract_id)
+    await db.commit()
+    return {"updated_count": updated}
+
+@router.post("/maintenance/{contract_id}/cpm", operation_id="maintenance_cpm_schedule")
+async def maintenance_cpm(contract_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Full critical path recalculation; stores the results on the items."""
+    net, sched, written = await cpm.recalc(db, contract_id)
+    await db.commit()
+    return {"updated_count": written, "critical_path": net.critical_path(sched)}
+
 @router.post("/maintenance/{contract_id}/heal", operation_id="maintenance_heal_schedule")
 async def maintenance_heal(contract_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    """A helper endpoint for fixing bad parent chains/cycles."""
-    modified_count = await _heal_cycles_for_contract(db, contract_id)
-    return {"modified_count": modified_count}
+    """Detach self-parented, dangling and cyclic items to the root level; returns what changed."""
+    report = await schedule_integrity.heal(db, contract_id)
+    await db.commit()
+    return {"modified_count": report.modified, **asdict(report)}
+
+@router.post("/maintenance/heal-all", operation_id="maintenance_heal_all_schedules")
+async def maintenance_heal_all(u: User = Depends(get_current_user)):
+    """Run the healer over every contract (admin only); lists the contracts that needed repairs."""
+    if getattr(u, "role_id", None) != 1:
+        raise HTTPException(403, "Not allowed")
+    reports = await schedule_integrity.heal_all()
+    return {"contracts_repaired": len(reports), "reports": [asdict(r) for r in reports]}
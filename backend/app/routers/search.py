@@ -0,0 +1,77 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..security import get_db, get_current_user
+from ..models.models import ProjectFile, LibraryItem, User
+from ..models.models_schedule import ProjectFolder
+from .. import permissions, search_index
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+@router.get("")
+async def search_documents(q: str = Query(..., min_length=2),
+                           contract_id: Optional[int] = None,
+                           include_revisions: bool = False,
+                           include_library: bool = True,
+                           limit: int = Query(20, ge=1, le=100),
+                           db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Ranked full-text search over project files (optionally revisions) and library items the caller can read."""
+    if contract_id is not None and not await permissions.can_access(db, u, contract_id):
+        raise HTTPException(403, "Not allowed")
+    kinds = ("file",) + (("revision",) if include_revisions else ()) + (("library",) if include_library else ())
+    # contracts and folders the caller can read are filtered inside the ranked query; the small
+    # over-fetch covers hits dropped by the re-check below (files deleted or moved since indexing)
+    scope = await permissions.readable_scope(db, u, contract_id)
+    hits = await asyncio.to_thread(search_index.search, q, scope, kinds, limit + 20)
+
+    file_ids = {h["file_id"] for h in hits if h["kind"] in ("file", "revision")}
+    lib_ids = {h["file_id"] for h in hits if h["kind"] == "library"}
+    files = {}
+    if file_ids:
+        res = await db.execute(select(ProjectFile).where(ProjectFile.id.in_(file_ids), ProjectFile.deleted_at.is_(None)))
+        files = {f.id: f for f in res.scalars().all()}
+    libs = {}
+    if lib_ids:
+        res = await db.execute(select(LibraryItem).where(LibraryItem.id.in_(lib_ids)))
+        libs = {i.id: i for i in res.scalars().all()}
+
+    # readability per (contract, folder path), resolved once per contract
+    folder_ids: dict[int, dict[str, int]] = {}
+    readable: dict[tuple[int, str], bool] = {}
+    async def can_read(f: ProjectFile) -> bool:
+        key = (f.contract_id, f.folder or "")
+        if key not in readable:
+            if f.contract_id not in folder_ids:
+                if not await permissions.can_access(db, u, f.contract_id):
+                    folder_ids[f.contract_id] = None
+                else:
+                    res = await db.execute(select(ProjectFolder.id, ProjectFolder.path).where(ProjectFolder.contract_id == f.contract_id))
+                    folder_ids[f.contract_id] = {path: fid for fid, path in res.all()}
+            paths = folder_ids[f.contract_id]
+            if paths is None or (f.folder and f.folder not in paths):
+                readable[key] = False
+            else:
+                ok, _ = await permissions.effective_perm(db, f.contract_id, u, paths.get(f.folder) if f.folder else None)
+                readable[key] = ok
+        return readable[key]
+
+    out = []
+    for h in hits:
+        if h["kind"] == "library":
+            item = libs.get(h["file_id"])
+            if item is None:
+                continue
+            out.append({"kind": "library", "id": item.id, "title": item.title, "snippet": h["snippet"], "score": h["score"]})
+        else:
+            f = files.get(h["file_id"])
+            if f is None or not await can_read(f):
+                continue
+            out.append({"kind": h["kind"], "id": f.id, "contract_id": f.contract_id, "folder": f.folder or "", "name": f.original_name,
+                        "revision_no": h["revision_no"], "snippet": h["snippet"], "score": h["score"]})
+        if len(out) >= limit:
+            break
+    return out
@@ -0,0 +1,171 @@
+import os, hmac, time, uuid, asyncio, hashlib, logging, mimetypes, secrets
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Query
+from fastapi.responses import RedirectResponse, Response
+from sqlalchemy import select, update, insert, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..security import get_db, get_current_user
+from ..config import config
+from ..db import SessionLocal
+from ..utils import stream_upload, upload_limit
+from ..file_responses import SendfileResponse, content_disposition
+from ..models.models import FileShare, FileDownloadLog, User
+from .. import jobs, storage
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/files", tags=["shares"])
+
+def _share_locator(stored_name: str) -> str:
+    return storage.locator(f"shares/{stored_name}")
+
+# ---------- Signed links ----------
+# /api/files/s/<share_id>/<stored_name>?e=<expires>&n=<filename>&sig=<hmac>
+# Everything needed to serve the file is in the URL and covered by the signature, so a hit needs no DB
+# lookup. Deleting the share removes the file, which revokes every link minted for it.
+def _share_key() -> bytes:
+    secret = config.storage.share_secret or config.security.jwt_secret
+    return hashlib.sha256(b"file-share:" + secret.encode()).digest()
+
+def _sign(share_id: int, stored_name: str, filename: str, expires: int) -> str:
+    msg = f"{share_id}\n{stored_name}\n{filename}\n{expires}".encode()
+    return hmac.new(_share_key(), msg, hashlib.sha256).hexdigest()
+
+def signed_url(share: FileShare, hours: Optional[int] = None) -> str:
+    expires = int(time.time()) + 3600 * (hours or config.storage.share_link_hours)
+    sig = _sign(share.id, share.stored_name, share.original_name, expires)
+    return f"{router.prefix}/s/{share.id}/{quote(share.stored_name)}?e={expires}&n={quote(share.original_name)}&sig={sig}"
+
+# ---------- Write-behind download accounting ----------
+# hits are buffered in memory and written in batches; a crash loses at most one flush interval of counts
+_hits: dict[int, int] = defaultdict(int)
+_last_hit: dict[int, datetime] = {}
+_log_rows: list[dict] = []
+_MAX_BUFFERED_LOGS = 50_000
+
+def _record_hit(share_id: int, ip: Optional[str]):
+    now = datetime.utcnow()
+    _hits[share_id] += 1
+    _last_hit[share_id] = now
+    if len(_log_rows) < _MAX_BUFFERED_LOGS:
+        _log_rows.append({"file_id": share_id, "ip_address": (ip or "")[:45] or None, "downloaded_at": now})
+
+async def flush_downloads():
+    """Write buffered counters and log rows: one executemany UPDATE and one bulk INSERT."""
+    global _hits, _last_hit, _log_rows
+    if not _hits and not _log_rows:
+        return
+    hits, last_hit, rows = _hits, _last_hit, _log_rows
+    _hits, _last_hit, _log_rows = defaultdict(int), {}, []
+    t = FileShare.__table__
+    try:
+        async with SessionLocal() as db:
+            if hits:
+                await db.execute(
+                    update(t).where(t.c.id == bindparam("sid")).values(downloads=t.c.downloads + bindparam("n"), last_download_at=bindparam("ts")),
+                    [{"sid": sid, "n": n, "ts": last_hit[sid]} for sid, n in hits.items()])
+            if rows:
+                await db.execute(insert(FileDownloadLog.__table__), rows)
+            await db.commit()
+    except Exception:
+        log.exception("flushing %d share counters / %d download logs failed; retrying next round", len(hits), len(rows))
+        for sid, n in hits.items():
+            _hits[sid] += n
+            _last_hit[sid] = max(_last_hit.get(sid, last_hit[sid]), last_hit[sid])
+        _log_rows[:0] = rows[:max(_MAX_BUFFERED_LOGS - len(_log_rows), 0)]
+
+@jobs.every(10, name="share_download_flush")
+async def _flush_job():
+    await flush_downloads()
+
+jobs.at_shutdown(flush_downloads)
+
+def _serve(path: str, size: Optional[int], filename: str, media_type: Optional[str]) -> Response:
+    if storage.is_remote(path):
+        # object storage serves the bytes itself
+        return RedirectResponse(storage.presigned_url(path, filename), status_code=307)
+    media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {"Content-Disposition": content_disposition(filename), "Cache-Control": "private, no-store"}
+    if config.storage.share_offload == "accel":
+        # nginx streams the file with sendfile from an internal location mapped to files_dir
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(config.storage.files_dir))
+        headers["X-Accel-Redirect"] = config.storage.share_accel_prefix.rstrip("/") + "/" + quote(rel.replace(os.sep, "/"))
+        return Response(status_code=200, media_type=media_type, headers=headers)
+    return SendfileResponse(path, size, media_type, headers)
+
+# ---------- Endpoints ----------
+def _share_out(s: FileShare) -> dict:
+    return {"id": s.id, "original_name": s.original_name, "size_bytes": s.size_bytes, "mime_type": s.mime_type,
+            "token": s.token, "downloads": s.downloads, "last_download_at": s.last_download_at, "url": signed_url(s)}
+
+@router.post("/share")
+async def create_share(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    original = os.path.basename(file.filename or "file").strip() or "file"
+    stored_name = f"{uuid.uuid4().hex}{os.path.splitext(original)[1].lower()}"
+    stored = await stream_upload(file, storage.temp_path(), upload_limit())
+    path = await storage.put(stored.path, _share_locator(stored_name), file.content_type)
+    share = FileShare(owner_id=u.id, original_name=original, stored_name=stored_name, stored_path=path,
+                      size_bytes=stored.size, mime_type=file.content_type, token=secrets.token_urlsafe(24), downloads=0)
+    db.add(share)
+    await db.commit()
+    return _share_out(share)
+
+@router.get("/mine")
+async def my_shares(db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    res = await db.execute(select(FileShare).where(FileShare.owner_id == u.id).order_by(FileShare.id.desc()))
+    return [_share_out(s) for s in res.scalars().all()]
+
+@router.get("/shares/{share_id}/link")
+async def share_link(share_id: int, hours: Optional[int] = Query(None, ge=1, le=24 * 90), db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Mint a signed download URL with a custom lifetime."""
+    share = await db.get(FileShare, share_id)
+    if not share or (share.owner_id != u.id and u.role_id != 1):
+        raise HTTPException(404, "Not found")
+    return {"url": signed_url(share, hours)}
+
+@router.delete("/shares/{share_id}")
+async def delete_share(share_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    share = await db.get(FileShare, share_id)
+    if not share or (share.owner_id != u.id and u.role_id != 1):
+        raise HTTPException(404, "Not found")
+    path = share.stored_path
+    await db.delete(share)
+    await db.commit()
+    await storage.delete(path)
+    return {"ok": True}
+
+@router.get("/s/{share_id}/{stored_name}")
+async def signed_download(share_id: int, stored_name: str, request: Request,
+                          e: int = Query(...), n: str = Query(...), sig: str = Query(...)):
+    """Public download through a signed link; validated and served without touching the database."""
+    if e < time.time():
+        raise HTTPException(410, "Link expired")
+    if not hmac.compare_digest(sig, _sign(share_id, stored_name, n, e)):
+        raise HTTPException(403, "Invalid signature")
+    if os.path.basename(stored_name) != stored_name:
+        raise HTTPException(404, "Not found")
+    # shares stored before a switch to object storage stay on local disk
+    path, size = os.path.join(config.storage.files_dir, "shares", stored_name), None
+    try:
+        size = (await asyncio.to_thread(os.stat, path)).st_size
+    except FileNotFoundError:
+        path = _share_locator(stored_name)
+        if not storage.is_remote(path):
+            raise HTTPException(404, "Not found")
+    _record_hit(share_id, request.client.host if request.client else None)
+    return _serve(path, size, n, None)
+
+@router.get("/public/{token}")
+async def token_download(token: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Permanent token links (one indexed lookup); counted through the same write-behind buffer."""
+    res = await db.execute(select(FileShare).where(FileShare.token == token))
+    share = res.scalar_one_or_none()
+    if not share or not (storage.is_remote(share.stored_path) or await asyncio.to_thread(os.path.exists, share.stored_path)):
+        raise HTTPException(404, "Not found")
+    _record_hit(share.id, request.client.host if request.client else None)
+    return _serve(share.stored_path, share.size_bytes, share.original_name, share.mime_type)
@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import select, update, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import date, datetime
 
 from ..db import SessionLocal
 from ..models.models import Task, User
 from ..security import get_current_user
+from .. import ranking
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
 
@@ -23,6 +24,18 @@ class TaskIn(BaseModel):
     order_index: Optional[int] = 0
     deadline: Optional[date] = None
 
+class TaskMove(BaseModel):
+    status: str
+    # the card to land after / before in the target column; neither = bottom of the column
+    after_id: Optional[int] = None
+    before_id: Optional[int] = None
+
+class TaskMoveOp(TaskMove):
+    id: int
+
+class TaskBulkMove(BaseModel):
+    moves: List[TaskMoveOp] = Field(..., max_length=1000)
+
 def task_to_dict(t: Task):
     return {
         "id": t.id,
@@ -31,6 +44,7 @@ def task_to_dict(t: Task):
         "description": t.description,
         "status": t.status or "todo",
         "order_index": t.order_index or 0,
+        "sort_key": t.sort_key,
         "color": t.color,
         "deadline": t.deadline.isoformat() if t.deadline else None,
         "created_at": t.created_at.isoformat() if t.created_at else None,
@@ -39,12 +53,30 @@ def task_to_dict(t: Task):
 
 @router.get("/my", operation_id="my_tasks")
 async def my_tasks(db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
-    res = await db.execute(select(Task).where(Task.user_id == u.id).order_by(Task.status, Task.order_index, Task.id))
+    res = await db.execute(select(Task).where(Task.user_id == u.id).order_by(Task.status, Task.sort_key, Task.order_index, Task.id))
     return [task_to_dict(t) for t in res.scalars().all()]
 
+async def _last_key(db: AsyncSession, user_id: int, status: str) -> str:
+    res = await db.execute(select(func.max(Task.sort_key)).where(Task.user_id == user_id, Task.status == status))
+    return ranking.last(res.scalar())
+
+async def _apply_moves(db: AsyncSession, user_id: int, moves: List[TaskMoveOp]) -> List[int]:
+    """Apply moves in order over one load of the user's board; changed rows go out in one executemany UPDATE."""
+    res = await db.execute(select(Task.id, Task.status, Task.sort_key).where(Task.user_id == user_id)
+                           .order_by(Task.status, Task.sort_key, Task.order_index, Task.id))
+    columns = {}
+    for i, status, k in res.all():
+        columns.setdefault(status or "todo", []).append([i, k])
+    changed = ranking.apply_moves(columns, [(m.id, m.status, m.after_id, m.before_id) for m in moves])
+    if changed:
+        now = datetime.utcnow()
+        await db.execute(update(Task), [{"id": i, "status": s, "sort_key": k, "updated_at": now} for i, (s, k) in changed.items()])
+    return sorted(changed)
+
 @router.post("", operation_id="create_task")
 async def create_task(body: TaskIn, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     t = Task(user_id=u.id, **body.dict())
+    t.sort_key = await _last_key(db, u.id, t.status or "todo")
     db.add(t); await db.commit(); await db.refresh(t)
     return task_to_dict(t)
 
@@ -54,6 +86,8 @@ async def update_task(task_id: int, body: TaskIn, db: AsyncSession = Depends(get
     t = res.scalar_one_or_none()
     if not t: raise HTTPException(status_code=404, detail="Not found")
     data = body.dict()
+    if data.get("status") != t.status:
+        t.sort_key = await _last_key(db, u.id, data.get("status") or "todo")
     for k,v in data.items():
         setattr(t, k, v)
     t.updated_at = datetime.utcnow()
@@ -61,6 +95,24 @@ async def update_task(task_id: int, body: TaskIn, db: AsyncSession = Depends(get
     await db.refresh(t)
     return task_to_dict(t)
 
+@router.post("/move", operation_id="bulk_move_tasks")
+async def bulk_move_tasks(body: TaskBulkMove, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Apply many kanban moves in order, written in a single statement; unknown ids are ignored."""
+    moved = await _apply_moves(db, u.id, body.moves)
+    await db.commit()
+    return {"moved": moved}
+
+@router.post("/{task_id}/move", operation_id="move_task")
+async def move_task(task_id: int, body: TaskMove, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
+    """Drag-and-drop move: the card gets a key between its new neighbours, so only its row changes."""
+    res = await db.execute(select(Task).where(Task.id == task_id, Task.user_id == u.id))
+    t = res.scalar_one_or_none()
+    if not t: raise HTTPException(status_code=404, detail="Not found")
+    await _apply_moves(db, u.id, [TaskMoveOp(id=task_id, **body.dict())])
+    await db.commit()
+    await db.refresh(t)
+    return task_to_dict(t)
+
 @router.delete("/{task_id}", operation_id="delete_task")
 async def delete_task(task_id: int, db: AsyncSession = Depends(get_db), u: User = Depends(get_current_user)):
     res = await db.execute(select(Task).where(Task.id == task_id, Task.user_id == u.id))
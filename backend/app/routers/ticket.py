@@ -1,11 +1,12 @@
 import os
-import shutil
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.db import get_db
 from app.models.models import Ticket  # Adjust if path is different
 from app.schemas import TicketResponse  # Assuming you have a schema
+from app.utils import stream_upload, upload_limit
+from app import storage
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -33,10 +34,10 @@ async def create_ticket(
 ):
     filename = None
     if boq:
-        filename = f"{int.from_bytes(os.urandom(4), 'big')}_{boq.filename}"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(boq.file, buffer)
+        filename = f"{int.from_bytes(os.urandom(4), 'big')}_{os.path.basename(boq.filename)}"
+        stored = await stream_upload(boq, storage.temp_path(), upload_limit())
+        # the local driver keeps BOQs in UPLOAD_DIR; object stores use tickets/<filename>
+        await storage.put(stored.path, storage.locator(f"tickets/{filename}", local_path=os.path.join(UPLOAD_DIR, filename)), stored.content_type)
 
     ticket = Ticket(
         title=title,
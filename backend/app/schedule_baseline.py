@@ -0,0 +1,91 @@
+"""
+    Schedule baselines: an immutable copy of a contract's items, one schedule_baseline_items row per item,
+    written by a single INSERT ... SELECT. Diffs compare a baseline with the live schedule (or with another
+    baseline) in one statement: the outer join from the baseline side plus the anti-join for items added
+    since, combined with UNION ALL (MariaDB has no FULL OUTER JOIN). Slips and deltas are derived from
+    those rows in one pass.
+"""
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import select, insert, literal, null, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models.models_schedule import ProjectScheduleItem, ScheduleBaseline, ScheduleBaselineItem
+
+FIELDS = ("parent_id", "title", "planned_start", "planned_end", "actual_start", "actual_end", "progress")
+
+async def snapshot(db: AsyncSession, contract_id: int, name: str, user_id: Optional[int]) -> ScheduleBaseline:
+    """Create a baseline of the contract's current items; the caller commits."""
+    P, BI = ProjectScheduleItem, ScheduleBaselineItem
+    baseline = ScheduleBaseline(contract_id=contract_id, name=name, created_by=user_id)
+    db.add(baseline)
+    await db.flush()
+    res = await db.execute(insert(BI).from_select(
+        ["baseline_id", "item_id", *FIELDS],
+        select(literal(baseline.id), P.id, *(getattr(P, f) for f in FIELDS)).where(P.contract_id == contract_id)))
+    baseline.item_count = max(res.rowcount or 0, 0)
+    return baseline
+
+def _side(contract_id: int, baseline_id: Optional[int], name: str):
+    """(item_id, *FIELDS) rows of a baseline, or of the live schedule when baseline_id is None."""
+    if baseline_id is None:
+        P = ProjectScheduleItem
+        q = select(P.id.label("item_id"), *(getattr(P, f) for f in FIELDS)).where(P.contract_id == contract_id)
+    else:
+        BI = ScheduleBaselineItem
+        q = select(BI.item_id, *(getattr(BI, f) for f in FIELDS)).where(BI.baseline_id == baseline_id)
+    return q.subquery(name)
+
+def _days(a: Optional[date], b: Optional[date]) -> Optional[int]:
+    return (a - b).days if a is not None and b is not None else None
+
+async def diff(db: AsyncSession, baseline: ScheduleBaseline, against: Optional[ScheduleBaseline] = None,
+               include_unchanged: bool = False) -> dict:
+    """Compare `baseline` with `against` (default: the live schedule)."""
+    old = _side(baseline.contract_id, baseline.id, "old")
+    new = _side(baseline.contract_id, against.id if against else None, "new")
+    cols = lambda side, prefix: [side.c[f].label(f"{prefix}{f}") for f in FIELDS]
+    nulls = [null().label(f"o_{f}") for f in FIELDS]
+    matched = (select(old.c.item_id, literal(True).label("in_old"), new.c.item_id.is_not(None).label("in_new"),
+                      *cols(old, "o_"), *cols(new, "n_"))
+               .select_from(old.outerjoin(new, new.c.item_id == old.c.item_id)))
+    added = (select(new.c.item_id, literal(False).label("in_old"), literal(True).label("in_new"), *nulls, *cols(new, "n_"))
+             .select_from(new.outerjoin(old, old.c.item_id == new.c.item_id)).where(old.c.item_id.is_(None)))
+    res = await db.execute(union_all(matched, added).order_by("item_id"))
+
+    items, counts = [], {"added": 0, "removed": 0, "changed": 0, "unchanged": 0, "slipped": 0}
+    old_finish = new_finish = None
+    max_slip = 0
+    for r in res.mappings():
+        o = {f: r[f"o_{f}"] for f in FIELDS} if r["in_old"] else None
+        n = {f: r[f"n_{f}"] for f in FIELDS} if r["in_new"] else None
+        if o and o["planned_end"] and (old_finish is None or o["planned_end"] > old_finish):
+            old_finish = o["planned_end"]
+        if n and n["planned_end"] and (new_finish is None or n["planned_end"] > new_finish):
+            new_finish = n["planned_end"]
+        entry = {"item_id": r["item_id"], "title": (n or o)["title"]}
+        if o is None:
+            status = "added"
+        elif n is None:
+            status = "removed"
+        else:
+            changed = [f for f in FIELDS if o[f] != n[f]]
+            status = "changed" if changed else "unchanged"
+            finish_slip = _days(n["planned_end"], o["planned_end"])
+            entry.update(changed_fields=changed, start_slip_days=_days(n["planned_start"], o["planned_start"]),
+                         finish_slip_days=finish_slip, progress_delta=(n["progress"] or 0) - (o["progress"] or 0))
+            if finish_slip and finish_slip > 0:
+                counts["slipped"] += 1
+                max_slip = max(max_slip, finish_slip)
+        counts[status] += 1
+        if status != "unchanged" or include_unchanged:
+            entry.update(status=status, baseline=o, current=n)
+            items.append(entry)
+    return {
+        "baseline_id": baseline.id,
+        "against": against.id if against else "current",
+        "summary": {**counts, "max_finish_slip_days": max_slip, "baseline_finish": old_finish,
+                    "current_finish": new_finish, "finish_slip_days": _days(new_finish, old_finish)},
+        "items": items,
+    }
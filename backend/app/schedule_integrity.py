@@ -0,0 +1,111 @@
+"""
+    Parent-chain integrity for schedule items. One pass over a contract's (id, parent_id) pairs finds
+    self-parents, dangling parents (missing or in another contract) and cycles in O(n): each node is
+    walked up at most once, coloured white -> grey (on the current path) -> black (known to reach a root).
+    Every offending item is detached to the root level, written back with one bulk UPDATE, and the
+    rollups and critical path are recomputed. Runs on demand per contract and as a nightly batch over
+    all contracts.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update, func
+
+from .db import SessionLocal
+from .models.models_schedule import ProjectScheduleItem
+from . import cpm, jobs, ranking, schedule_tree
+
+log = logging.getLogger(__name__)
+
+_WHITE, _GREY, _BLACK = 0, 1, 2
+
+@dataclass
+class HealReport:
+    contract_id: int
+    items: int = 0
+    self_parents: list[int] = field(default_factory=list)
+    dangling: list[int] = field(default_factory=list)
+    cycles: list[list[int]] = field(default_factory=list)
+    # {"id", "old_parent_id", "reason"} per detached item
+    changes: list[dict] = field(default_factory=list)
+    rollups_updated: int = 0
+
+    @property
+    def modified(self) -> int:
+        return len(self.changes)
+
+def find_problems(parents: dict[int, Optional[int]], report: HealReport) -> dict[int, str]:
+    """Items to detach -> reason. Cycles are broken at their lowest id."""
+    fix: dict[int, str] = {}
+    for i, p in parents.items():
+        if p == i:
+            report.self_parents.append(i)
+            fix[i] = "self_parent"
+        elif p is not None and p not in parents:
+            report.dangling.append(i)
+            fix[i] = "dangling_parent"
+    colour = {i: _WHITE for i in parents}
+    for start in parents:
+        if colour[start] != _WHITE:
+            continue
+        path, cur = [], start
+        while cur is not None and cur not in fix and colour[cur] == _WHITE:
+            colour[cur] = _GREY
+            path.append(cur)
+            cur = parents[cur]
+        if cur is not None and cur not in fix and colour[cur] == _GREY:
+            # the walk came back onto its own path: cur .. path[-1] is a cycle
+            cycle = path[path.index(cur):]
+            report.cycles.append(cycle)
+            fix[min(cycle)] = "cycle"
+        for n in path:
+            colour[n] = _BLACK
+    return fix
+
+async def heal(db, contract_id: int) -> HealReport:
+    """Detect and repair one contract's parent chains; the caller commits."""
+    P = ProjectScheduleItem
+    report = HealReport(contract_id)
+    res = await db.execute(select(P.id, P.parent_id).where(P.contract_id == contract_id))
+    parents = dict(res.all())
+    report.items = len(parents)
+    fix = find_problems(parents, report)
+    if not fix:
+        return report
+    # detached items go to the end of the root list, in id order
+    res = await db.execute(select(func.max(P.sort_key)).where(P.contract_id == contract_id, P.parent_id.is_(None)))
+    detached = sorted(fix)
+    now, rows = datetime.utcnow(), []
+    for i, key in zip(detached, ranking.append(res.scalar(), len(detached))):
+        rows.append({"id": i, "parent_id": None, "sort_key": key, "updated_at": now})
+        report.changes.append({"id": i, "old_parent_id": parents[i], "reason": fix[i]})
+    await db.execute(update(P), rows)
+    report.rollups_updated = await schedule_tree.rollup(db, contract_id)
+    await cpm.recalc(db, contract_id)
+    return report
+
+async def heal_all() -> list[HealReport]:
+    """Heal every contract that has schedule items, one transaction per contract; returns the repaired ones."""
+    async with SessionLocal() as db:
+        res = await db.execute(select(ProjectScheduleItem.contract_id).distinct())
+        contract_ids = res.scalars().all()
+        repaired = []
+        for cid in contract_ids:
+            try:
+                report = await heal(db, cid)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                log.exception("schedule heal failed for contract %s", cid)
+                continue
+            if report.modified:
+                repaired.append(report)
+    return repaired
+
+@jobs.every(24 * 3600, name="schedule_heal")
+async def _heal_job():
+    for report in await heal_all():
+        log.warning("schedule heal: contract %s detached %d items (%d self, %d dangling, %d cycles)",
+                    report.contract_id, report.modified, len(report.self_parents), len(report.dangling), len(report.cycles))
@@ -0,0 +1,365 @@
+"""
+    Schedule import / export in CSV and MS Project XML.
+
+    Import parses the staged upload incrementally (csv.reader; ElementTree.iterparse, clearing each Task
+    element once read), resolves the hierarchy from parent ids or outline levels in memory, and writes in
+    one transaction: items in batched INSERT ... RETURNING statements without parents, then one
+    executemany UPDATE for parent links and sort keys, then the dependencies. Rollups and the critical
+    path are recomputed once at the end.
+
+    Export loads only the (id, parent, key) skeleton to fix display order and outline levels, then streams
+    full rows in id batches, so the first rows go out before the rest are read.
+
+    CSV columns (header names, case-insensitive; only title is required):
+        id, parent_id, outline_level, title|name, planned_start|start, planned_end|finish,
+        actual_start, actual_end|actual_finish, progress|percent_complete, predecessors
+    predecessors is a ';'-separated list such as "12; 13FS+2; 14SS-1" (type defaults to FS; a lag in days
+    needs an explicit type, so ids like "T-1" read as ids). Files that are not UTF-8 are read as cp1252.
+"""
+import csv, io, re, codecs, logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import AsyncIterator, Iterator, Optional
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from sqlalchemy import select, insert, update, delete, func
+
+from .db import SessionLocal
+from .models.models_schedule import ProjectScheduleItem, ScheduleDependency
+from . import cpm, ranking, schedule_integrity, schedule_tree
+
+log = logging.getLogger(__name__)
+
+BATCH = 1000
+MSP_NS = "http://schemas.microsoft.com/project"
+# MS Project link types and lag units (tenths of a minute; an 8 hour day)
+_MSP_TYPES = {"0": "FF", "1": "FS", "2": "SF", "3": "SS"}
+_MSP_CODES = {v: k for k, v in _MSP_TYPES.items()}
+_MSP_DAY = 8 * 60 * 10
+_PRED_RE = re.compile(r"^\s*(\S+?)\s*(?:(FS|SS|FF|SF)\s*([+-]\s*\d+)?\s*d?)?\s*$", re.I)
+
+class ScheduleImportError(ValueError):
+    """Unreadable upload (bad header, malformed XML)."""
+
+@dataclass
+class Row:
+    key: str
+    title: str
+    parent_key: Optional[str] = None
+    level: Optional[int] = None
+    planned_start: Optional[date] = None
+    planned_end: Optional[date] = None
+    actual_start: Optional[date] = None
+    actual_end: Optional[date] = None
+    progress: int = 0
+    # (predecessor key, type, lag days)
+    preds: list[tuple[str, str, int]] = field(default_factory=list)
+
+@dataclass
+class ImportReport:
+    items: int = 0
+    dependencies: int = 0
+    skipped_rows: int = 0
+    detached: int = 0
+    ignored_dependencies: int = 0
+    errors: list[str] = field(default_factory=list)
+
+def _date(v: Optional[str]) -> Optional[date]:
+    v = (v or "").strip()
+    if not v:
+        return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(v[:10], fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"bad date {v!r}")
+
+def _progress(v: Optional[str]) -> int:
+    v = (v or "").strip().rstrip("%")
+    return max(0, min(100, round(float(v)))) if v else 0
+
+# ---------- parsers (blocking; run in a worker thread) ----------
+
+_CSV_ALIASES = {
+    "id": "id", "uid": "id", "parent_id": "parent_id", "parent": "parent_id", "outline_level": "outline_level",
+    "level": "outline_level", "title": "title", "name": "title", "planned_start": "planned_start", "start": "planned_start",
+    "planned_end": "planned_end", "finish": "planned_end", "end": "planned_end", "actual_start": "actual_start",
+    "actual_end": "actual_end", "actual_finish": "actual_end", "progress": "progress", "percent_complete": "progress",
+    "predecessors": "predecessors",
+}
+
+def _preds(text: str) -> list[tuple[str, str, int]]:
+    out = []
+    for part in filter(None, (p.strip() for p in re.split(r"[;,]", text or ""))):
+        m = _PRED_RE.match(part)
+        if not m:
+            raise ValueError(f"bad predecessor {part!r}")
+        out.append((m.group(1), (m.group(2) or "FS").upper(), int((m.group(3) or "0").replace(" ", ""))))
+    return out
+
+def _csv_encoding(path: str) -> str:
+    """utf-8-sig when the whole file decodes as UTF-8, else cp1252 (spreadsheet exports on Windows)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as fh:
+        try:
+            while chunk := fh.read(1 << 16):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "cp1252"
+    return "utf-8-sig"
+
+def parse_csv(path: str, report: ImportReport) -> Iterator[Row]:
+    with open(path, newline="", encoding=_csv_encoding(path)) as fh:
+        reader = None
+        try:
+            first = fh.readline()
+            fh.seek(0)
+            # spreadsheet exports use ',' ';' or tab depending on locale: take whichever the header uses most
+            delimiter = max(",;\t", key=first.count)
+            reader = csv.reader(fh, delimiter=delimiter)
+            header = next(reader, None)
+            cols = {_CSV_ALIASES[h.strip().lower()]: i for i, h in enumerate(header or []) if h.strip().lower() in _CSV_ALIASES}
+            if "title" not in cols:
+                raise ScheduleImportError("CSV needs a title (or name) column")
+            get = lambda rec, name: rec[cols[name]].strip() if name in cols and cols[name] < len(rec) else ""
+            for n, rec in enumerate(reader, start=2):
+                if not any(c.strip() for c in rec):
+                    continue
+                try:
+                    title = get(rec, "title")
+                    if not title:
+                        raise ValueError("empty title")
+                    level = get(rec, "outline_level")
+                    yield Row(key=get(rec, "id") or f"#{n}", title=title[:255], parent_key=get(rec, "parent_id") or None,
+                              level=int(level) if level else None,
+                              planned_start=_date(get(rec, "planned_start")), planned_end=_date(get(rec, "planned_end")),
+                              actual_start=_date(get(rec, "actual_start")), actual_end=_date(get(rec, "actual_end")),
+                              progress=_progress(get(rec, "progress")), preds=_preds(get(rec, "predecessors")))
+                except ValueError as e:
+                    report.skipped_rows += 1
+                    report.errors.append(f"line {n}: {e}")
+        except (UnicodeDecodeError, csv.Error) as e:
+            line = f"line {reader.line_num}: " if reader is not None and reader.line_num else ""
+            raise ScheduleImportError(f"unreadable CSV ({line}{e})")
+
+def parse_msp(path: str, report: ImportReport) -> Iterator[Row]:
+    ns = "{%s}" % MSP_NS
+    tag = lambda el, name: (el.findtext(ns + name) or el.findtext(name) or "").strip()
+    try:
+        for _, el in ET.iterparse(path, events=("end",)):
+            if el.tag not in (ns + "Task", "Task"):
+                continue
+            try:
+                level = int(tag(el, "OutlineLevel") or 1)
+                if level == 0 or tag(el, "IsNull") == "1":
+                    continue  # the project summary task / blank lines
+                preds = []
+                for link in el.iter(ns + "PredecessorLink"):
+                    lag = int(tag(link, "LinkLag") or 0)
+                    preds.append((tag(link, "PredecessorUID"), _MSP_TYPES.get(tag(link, "Type"), "FS"), round(lag / _MSP_DAY)))
+                yield Row(key=tag(el, "UID") or tag(el, "ID"), title=(tag(el, "Name") or "(untitled)")[:255], level=level,
+                          planned_start=_date(tag(el, "Start")), planned_end=_date(tag(el, "Finish")),
+                          actual_start=_date(tag(el, "ActualStart")), actual_end=_date(tag(el, "ActualFinish")),
+                          progress=_progress(tag(el, "PercentComplete")), preds=preds)
+            except ValueError as e:
+                report.skipped_rows += 1
+                report.errors.append(f"task {tag(el, 'UID')}: {e}")
+            finally:
+                el.clear()
+    except ET.ParseError as e:
+        raise ScheduleImportError(f"malformed XML: {e}")
+
+def read_rows(path: str, fmt: str, report: ImportReport) -> list[Row]:
+    rows = list((parse_msp if fmt == "xml" else parse_csv)(path, report))
+    del report.errors[50:]
+    return rows
+
+# ---------- import ----------
+
+def _resolve_parents(rows: list[Row]) -> dict[int, Optional[int]]:
+    """Row index -> parent row index, from parent ids when given, else from outline levels."""
+    index = {}
+    for k, r in enumerate(rows):
+        index.setdefault(r.key, k)
+    parents: dict[int, Optional[int]] = {}
+    stack: list[tuple[int, int]] = []  # (level, row index) of the open outline path
+    for k, r in enumerate(rows):
+        if r.parent_key is not None:
+            parents[k] = index.get(r.parent_key, -1)  # -1 = dangling, detached below
+        elif r.level is not None:
+            while stack and stack[-1][0] >= r.level:
+                stack.pop()
+            parents[k] = stack[-1][1] if stack else None
+            stack.append((r.level, k))
+        else:
+            parents[k] = None
+    return parents
+
+def _looped(deps: list[dict]) -> set[int]:
+    """Items left over by a topological sort of the links: every loop lies inside this set."""
+    out: dict[int, list[int]] = {}
+    indeg: dict[int, int] = {}
+    for d in deps:
+        a, b = d["predecessor_id"], d["successor_id"]
+        out.setdefault(a, []).append(b)
+        indeg[b] = indeg.get(b, 0) + 1
+        indeg.setdefault(a, 0)
+    ready = [n for n, c in indeg.items() if c == 0]
+    for n in ready:  # grows while we walk it
+        for m in out.get(n, ()):
+            indeg[m] -= 1
+            if indeg[m] == 0:
+                ready.append(m)
+    return set(indeg) - set(ready)
+
+async def import_rows(db, contract_id: int, rows: list[Row], report: ImportReport, replace: bool = False):
+    """Write parsed rows into the contract in the caller's transaction (the caller commits)."""
+    P, D = ProjectScheduleItem, ScheduleDependency
+    parents = _resolve_parents(rows)
+    bad = schedule_integrity.find_problems(parents, schedule_integrity.HealReport(contract_id))
+    for k in bad:
+        parents[k] = None
+    report.detached = len(bad)
+    if replace:
+        await db.execute(delete(P).where(P.contract_id == contract_id))
+    res = await db.execute(select(func.max(P.sort_key)).where(P.contract_id == contract_id, P.parent_id.is_(None)))
+    root_key = res.scalar()
+
+    now, ids = datetime.utcnow(), []
+    for i in range(0, len(rows), BATCH):
+        chunk = [{"contract_id": contract_id, "title": r.title, "planned_start": r.planned_start, "planned_end": r.planned_end,
+                  "actual_start": r.actual_start, "actual_end": r.actual_end, "progress": r.progress,
+                  "created_at": now, "updated_at": now} for r in rows[i:i + BATCH]]
+        # executemany RETURNING in parameter order: MariaDB >= 10.5 (see README)
+        res = await db.execute(insert(P).returning(P.id, sort_by_parameter_order=True), chunk)
+        ids.extend(res.scalars().all())
+
+    # parent links and sibling keys in file order
+    groups: dict[Optional[int], list[int]] = {}
+    for k in range(len(rows)):
+        groups.setdefault(parents[k], []).append(k)
+    links = []
+    for parent, members in groups.items():
+        keys = ranking.append(root_key, len(members)) if parent is None else ranking.spread(len(members))
+        for idx, (k, key) in enumerate(zip(members, keys)):
+            links.append({"id": ids[k], "parent_id": None if parent is None else ids[parent], "sort_key": key,
+                          "sort_index": (idx + 1) * 10})
+    for i in range(0, len(links), BATCH):
+        await db.execute(update(P), links[i:i + BATCH])
+
+    by_key = {}
+    for k, r in enumerate(rows):
+        by_key.setdefault(r.key, ids[k])
+    # summary rows take their dates from the rollup: links on them are refused, as in create_dependency
+    summaries = {ids[p] for p in parents.values() if p is not None}
+    deps, seen = [], set()
+    for k, r in enumerate(rows):
+        for pred_key, kind, lag in r.preds:
+            pred = by_key.get(pred_key)
+            pair = (pred, ids[k])
+            if pred is None or pred == ids[k] or pair in seen or pred in summaries or ids[k] in summaries:
+                report.ignored_dependencies += 1
+                continue
+            seen.add(pair)
+            deps.append({"contract_id": contract_id, "predecessor_id": pred, "successor_id": ids[k],
+                         "type": kind, "lag_days": lag, "created_at": now})
+    looped = _looped(deps)
+    if looped:
+        kept = [d for d in deps if not (d["predecessor_id"] in looped and d["successor_id"] in looped)]
+        report.ignored_dependencies += len(deps) - len(kept)
+        deps = kept
+    for i in range(0, len(deps), BATCH):
+        await db.execute(insert(D), deps[i:i + BATCH])
+    report.items, report.dependencies = len(ids), len(deps)
+    await schedule_tree.rollup(db, contract_id)
+    await cpm.recalc(db, contract_id)
+
+# ---------- export ----------
+
+async def _skeleton(db, contract_id: int) -> list[tuple[int, int]]:
+    """(item id, outline level) in display order; items stuck in a parent loop go last at level 1."""
+    P = ProjectScheduleItem
+    res = await db.execute(select(P.id, P.parent_id).where(P.contract_id == contract_id)
+                           .order_by(P.sort_key, P.sort_index, P.id))
+    rows = res.all()
+    known = {i for i, _ in rows}
+    children: dict[Optional[int], list[int]] = {}
+    for i, p in rows:
+        children.setdefault(p if p in known and p != i else None, []).append(i)
+    out, seen, stack = [], set(), [(i, 1) for i in reversed(children.get(None, []))]
+    while stack:
+        i, level = stack.pop()
+        if i in seen:
+            continue
+        seen.add(i)
+        out.append((i, level))
+        stack.extend((c, level + 1) for c in reversed(children.get(i, [])))
+    out.extend((i, 1) for i, _ in rows if i not in seen)
+    return out
+
+_EXPORT_COLS = ("id", "parent_id", "outline_level", "title", "planned_start", "planned_end", "actual_start",
+                "actual_end", "progress", "predecessors")
+
+def _lag(days: int) -> str:
+    return f"{days:+d}" if days else ""
+
+async def _batches(contract_id: int) -> AsyncIterator[tuple[list, dict, dict]]:
+    """Yields ([(item, level)], predecessors by successor, summary ids) per id batch, in display order."""
+    P, D = ProjectScheduleItem, ScheduleDependency
+    async with SessionLocal() as db:
+        order = await _skeleton(db, contract_id)
+        res = await db.execute(select(D.successor_id, D.predecessor_id, D.type, D.lag_days).where(D.contract_id == contract_id))
+        preds: dict[int, list] = {}
+        for succ, pred, kind, lag in res.all():
+            preds.setdefault(succ, []).append((pred, kind, lag or 0))
+        res = await db.execute(select(P.parent_id).distinct().where(P.contract_id == contract_id, P.parent_id.is_not(None)))
+        summaries = set(res.scalars().all())
+        for i in range(0, len(order), BATCH):
+            chunk = order[i:i + BATCH]
+            res = await db.execute(select(P).where(P.id.in_([k for k, _ in chunk])))
+            items = {it.id: it for it in res.scalars().all()}
+            yield [(items[k], lvl) for k, lvl in chunk if k in items], preds, summaries
+
+async def export_csv(contract_id: int) -> AsyncIterator[str]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(_EXPORT_COLS)
+    async for chunk, preds, _ in _batches(contract_id):
+        for it, level in chunk:
+            links = "; ".join(f"{p}{'' if t == 'FS' and not lag else t}{_lag(lag)}" for p, t, lag in preds.get(it.id, ()))
+            w.writerow([it.id, it.parent_id or "", level, it.title, it.planned_start or "", it.planned_end or "",
+                        it.actual_start or "", it.actual_end or "", it.progress or 0, links])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+async def export_msp(contract_id: int, name: str) -> AsyncIterator[str]:
+    yield f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Project xmlns="{MSP_NS}">\n<Name>{escape(name)}</Name>\n<Tasks>\n'
+    n = 0
+    async for chunk, preds, summaries in _batches(contract_id):
+        parts = []
+        for it, level in chunk:
+            n += 1
+            x = [f"<Task><UID>{it.id}</UID><ID>{n}</ID><Name>{escape(it.title)}</Name><OutlineLevel>{level}</OutlineLevel>",
+                 f"<Summary>{1 if it.id in summaries else 0}</Summary><PercentComplete>{it.progress or 0}</PercentComplete>"]
+            if it.planned_start:
+                x.append(f"<Start>{it.planned_start.isoformat()}T08:00:00</Start>")
+            if it.planned_end:
+                x.append(f"<Finish>{it.planned_end.isoformat()}T17:00:00</Finish>")
+            if it.planned_start and it.planned_end:
+                x.append(f"<Duration>PT{8 * max((it.planned_end - it.planned_start).days + 1, 1)}H0M0S</Duration>")
+            if it.actual_start:
+                x.append(f"<ActualStart>{it.actual_start.isoformat()}T08:00:00</ActualStart>")
+            if it.actual_end:
+                x.append(f"<ActualFinish>{it.actual_end.isoformat()}T17:00:00</ActualFinish>")
+            for p, t, lag in preds.get(it.id, ()):
+                x.append(f"<PredecessorLink><PredecessorUID>{p}</PredecessorUID><Type>{_MSP_CODES.get(t, '1')}</Type>"
+                         f"<LinkLag>{lag * _MSP_DAY}</LinkLag><LagFormat>7</LagFormat></PredecessorLink>")
+            x.append("</Task>\n")
+            parts.append("".join(x))
+        yield "".join(parts)
+    yield "</Tasks>\n</Project>\n"
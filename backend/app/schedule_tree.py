@@ -0,0 +1,268 @@
+"""
+    In-memory schedule tree for one contract's ProjectScheduleItem rows: loaded with one query,
+    rolled up bottom-up without further round trips, and written back as one bulk UPDATE of the
+    rows that actually changed.
+
+    Rollup rules for items with children:
+      - progress is the duration-weighted mean of the children (weight = planned days, at least 1)
+      - planned_start / planned_end are the envelope of the children's planned dates
+      - actual_start is the earliest child start; actual_end is the latest child finish, once every
+        child has finished
+    Leaves keep their own values. Items caught in a parent cycle are left untouched (see the healer).
+
+    Subtree and ancestor queries use recursive CTEs (UNION, so bad data with cycles still terminates),
+    falling back to one full load of the contract's (id, parent_id) pairs where CTEs are unavailable.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models.models_schedule import ProjectScheduleItem
+
+log = logging.getLogger(__name__)
+
+_ROLLUP_FIELDS = ("progress", "planned_start", "planned_end", "actual_start", "actual_end")
+
+class Node:
+    __slots__ = ("id", "parent_id", "title", "planned_start", "planned_end", "actual_start", "actual_end",
+                 "progress", "sort_index", "sort_key", "children", "depth")
+
+    def __init__(self, id, parent_id, title, planned_start, planned_end, actual_start, actual_end, progress, sort_index, sort_key=None):
+        self.id = id
+        self.parent_id = parent_id
+        self.title = title
+        self.planned_start = planned_start
+        self.planned_end = planned_end
+        self.actual_start = actual_start
+        self.actual_end = actual_end
+        self.progress = progress or 0
+        self.sort_index = sort_index
+        self.sort_key = sort_key
+        self.children: list[Node] = []
+        self.depth = -1  # -1 = not reachable from a root (cycle member)
+
+    @property
+    def duration_days(self) -> int:
+        if self.planned_start and self.planned_end:
+            return max((self.planned_end - self.planned_start).days + 1, 1)
+        return 1
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, f) for f in _ROLLUP_FIELDS)
+
+def _min(values: Iterable[Optional[date]]) -> Optional[date]:
+    vs = [v for v in values if v is not None]
+    return min(vs) if vs else None
+
+def _max(values: Iterable[Optional[date]]) -> Optional[date]:
+    vs = [v for v in values if v is not None]
+    return max(vs) if vs else None
+
+class ScheduleTree:
+    def __init__(self, contract_id: int, rows: Iterable[tuple]):
+        self.contract_id = contract_id
+        self.nodes: dict[int, Node] = {}
+        for row in rows:
+            n = Node(*row)
+            self.nodes[n.id] = n
+        self.roots: list[Node] = []
+        for n in self.nodes.values():
+            parent = self.nodes.get(n.parent_id) if n.parent_id is not None else None
+            if parent is None or parent is n:
+                self.roots.append(n)
+            else:
+                parent.children.append(n)
+        key = lambda n: (n.sort_key or "", n.sort_index or 0, n.id)
+        self.roots.sort(key=key)
+        for n in self.nodes.values():
+            n.children.sort(key=key)
+        self._original = {i: n.values() for i, n in self.nodes.items()}
+        # depths by BFS from the roots; nodes never reached sit in a cycle
+        frontier = self.roots
+        for n in frontier:
+            n.depth = 0
+        while frontier:
+            nxt = []
+            for n in frontier:
+                for c in n.children:
+                    if c.depth < 0:
+                        c.depth = n.depth + 1
+                        nxt.append(c)
+            frontier = nxt
+
+    @classmethod
+    async def load(cls, db: AsyncSession, contract_id: int) -> "ScheduleTree":
+        P = ProjectScheduleItem
+        res = await db.execute(select(P.id, P.parent_id, P.title, P.planned_start, P.planned_end, P.actual_start, P.actual_end, P.progress, P.sort_index, P.sort_key)
+                               .where(P.contract_id == contract_id))
+        return cls(contract_id, res.all())
+
+    def ancestors(self, item_id: int) -> list[Node]:
+        """Parents of `item_id` up to its root (nearest first)."""
+        out, n = [], self.nodes.get(item_id)
+        while n is not None and n.depth > 0:
+            n = self.nodes.get(n.parent_id)
+            if n is not None:
+                out.append(n)
+        return out
+
+    def preorder(self, roots: Optional[list[Node]] = None):
+        """Depth-first walk in display order (iterative)."""
+        stack = list(reversed(roots if roots is not None else self.roots))
+        while stack:
+            n = stack.pop()
+            yield n
+            stack.extend(reversed(n.children))
+
+    @staticmethod
+    def _roll(n: Node):
+        kids = n.children
+        if not kids:
+            return
+        weights = [c.duration_days for c in kids]
+        total = sum(weights)
+        n.progress = max(0, min(100, round(sum(c.progress * w for c, w in zip(kids, weights)) / total)))
+        start, end = _min(c.planned_start for c in kids), _max(c.planned_end for c in kids)
+        if start is not None:
+            n.planned_start = start
+        if end is not None:
+            n.planned_end = end
+        n.actual_start = _min(c.actual_start for c in kids)
+        n.actual_end = _max(c.actual_end for c in kids) if all(c.actual_end for c in kids) else None
+
+    def recompute(self, dirty: Optional[Iterable[int]] = None):
+        """
+            Roll values up bottom-up. With `dirty` item ids, only those items and their ancestors are
+            recomputed; otherwise the whole tree is.
+        """
+        if dirty is None:
+            targets = [n for n in self.nodes.values() if n.depth >= 0 and n.children]
+        else:
+            seen: dict[int, Node] = {}
+            for i in dirty:
+                n = self.nodes.get(i)
+                if n is None or n.depth < 0:
+                    continue
+                seen[n.id] = n
+                for a in self.ancestors(i):
+                    seen[a.id] = a
+            targets = [n for n in seen.values() if n.children]
+        for n in sorted(targets, key=lambda n: n.depth, reverse=True):
+            self._roll(n)
+
+    def changes(self) -> list[dict]:
+        """Rows whose rolled-up values differ from what was loaded (bulk UPDATE parameters)."""
+        now = datetime.utcnow()
+        out = []
+        for i, n in self.nodes.items():
+            vals = n.values()
+            if vals != self._original[i]:
+                row = dict(zip(_ROLLUP_FIELDS, vals))
+                row["id"] = i
+                row["updated_at"] = now
+                out.append(row)
+        return out
+
+    async def save(self, db: AsyncSession) -> int:
+        """Write changed rows with one executemany UPDATE; the caller commits."""
+        rows = self.changes()
+        if rows:
+            await db.execute(update(ProjectScheduleItem), rows)
+            self._original.update({r["id"]: self.nodes[r["id"]].values() for r in rows})
+        return len(rows)
+
+async def rollup(db: AsyncSession, contract_id: int, dirty: Optional[Iterable[int]] = None) -> int:
+    """Load, recompute and save a contract's schedule rollups; returns the number of rows written."""
+    tree = await ScheduleTree.load(db, contract_id)
+    tree.recompute(dirty)
+    return await tree.save(db)
+
+# ---------- set-based hierarchy queries ----------
+
+_cte_supported: Optional[bool] = None
+# MySQL/MariaDB errors that mean "no WITH RECURSIVE here": parse error, syntax error, not supported yet
+_CTE_UNSUPPORTED_CODES = {1064, 1149, 1235}
+
+def _cte_unsupported(e: DBAPIError) -> bool:
+    """True for syntax / unsupported-feature errors; lock timeouts, deadlocks and lost connections are not."""
+    args = getattr(e.orig, "args", ())
+    if args and isinstance(args[0], int):
+        return args[0] in _CTE_UNSUPPORTED_CODES
+    return "syntax error" in str(e.orig).lower()
+
+async def _parents(db: AsyncSession, contract_id: int) -> dict[int, Optional[int]]:
+    P = ProjectScheduleItem
+    res = await db.execute(select(P.id, P.parent_id).where(P.contract_id == contract_id))
+    return {i: p for i, p in res.all()}
+
+async def _run_cte(db: AsyncSession, stmt) -> Optional[set[int]]:
+    """Result ids of a recursive CTE query, or None when the backend cannot run it."""
+    global _cte_supported
+    if _cte_supported is False:
+        return None
+    if _cte_supported:
+        res = await db.execute(stmt)
+        return set(res.scalars().all())
+    # first use: probe inside a savepoint so a backend without WITH RECURSIVE does not abort the transaction
+    try:
+        async with db.begin_nested():
+            res = await db.execute(stmt)
+            ids = set(res.scalars().all())
+    except DBAPIError as e:
+        if not _cte_unsupported(e):
+            raise
+        log.warning("recursive CTEs unavailable; schedule hierarchy queries load the tree instead")
+        _cte_supported = False
+        return None
+    _cte_supported = True
+    return ids
+
+async def subtree_ids(db: AsyncSession, contract_id: int, item_id: int) -> set[int]:
+    """`item_id` and all its descendants: one recursive query."""
+    P = ProjectScheduleItem
+    tree = select(P.id).where(P.id == item_id, P.contract_id == contract_id).cte("subtree", recursive=True)
+    tree = tree.union(select(P.id).join(tree, P.parent_id == tree.c.id).where(P.contract_id == contract_id))
+    ids = await _run_cte(db, select(tree.c.id))
+    if ids is not None:
+        return ids
+    children: dict[int, list[int]] = {}
+    parents = await _parents(db, contract_id)
+    for i, p in parents.items():
+        if p is not None:
+            children.setdefault(p, []).append(i)
+    if item_id not in parents:
+        return set()
+    ids, stack = {item_id}, [item_id]
+    while stack:
+        for c in children.get(stack.pop(), ()):
+            if c not in ids:
+                ids.add(c)
+                stack.append(c)
+    return ids
+
+async def ancestor_ids(db: AsyncSession, contract_id: int, item_id: int) -> set[int]:
+    """`item_id` and every item above it: one recursive query."""
+    P = ProjectScheduleItem
+    up = select(P.id, P.parent_id).where(P.id == item_id, P.contract_id == contract_id).cte("ancestors", recursive=True)
+    up = up.union(select(P.id, P.parent_id).join(up, P.id == up.c.parent_id).where(P.contract_id == contract_id))
+    ids = await _run_cte(db, select(up.c.id))
+    if ids is not None:
+        return ids
+    parents = await _parents(db, contract_id)
+    ids, cur = set(), item_id
+    while cur is not None and cur in parents and cur not in ids:
+        ids.add(cur)
+        cur = parents[cur]
+    return ids
+
+async def would_create_cycle(db: AsyncSession, contract_id: int, item_id: int, new_parent_id: Optional[int]) -> bool:
+    """True if making `new_parent_id` the parent of `item_id` would put the item under itself."""
+    if new_parent_id is None:
+        return False
+    return item_id in await ancestor_ids(db, contract_id, new_parent_id)
@@ -0,0 +1,206 @@
+"""
+    Storage reconciliation: walk the storage tree with bounded I/O concurrency, diff it against every
+    DB reference in batched queries, verify blob checksums and quarantine or delete orphans.
+    mode="report" is a dry run that only describes what would change.
+"""
+import os, asyncio, logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Literal
+
+from sqlalchemy import select
+
+from .config import config
+from .db import SessionLocal
+from .models.models import ProjectFile, LibraryItem, FileShare, Ticket
+from .models.models_files import ProjectFileVersion, StorageBlob, UploadSession
+from .utils import file_sha256
+from . import blobstore, jobs, storage
+
+log = logging.getLogger(__name__)
+
+Mode = Literal["report", "quarantine", "delete"]
+
+# derived data and working areas that are not referenced from the DB
+_SKIP_DIRS = {"thumbs", "quarantine"}
+_SKIP_FILES = {"search.sqlite", "search.sqlite-wal", "search.sqlite-shm"}
+_BATCH = 500
+_SAMPLE = 100
+
+@dataclass
+class ScrubReport:
+    mode: str
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    scanned_files: int = 0
+    scanned_bytes: int = 0
+    orphan_files: int = 0
+    orphan_bytes: int = 0
+    orphans: list[str] = field(default_factory=list)
+    missing_files: int = 0
+    missing: list[str] = field(default_factory=list)
+    checksum_mismatches: list[str] = field(default_factory=list)
+    quarantined: int = 0
+    removed: int = 0
+    errors: list[str] = field(default_factory=list)
+
+def _ticket_upload_dir() -> str:
+    from .routers.ticket import UPLOAD_DIR
+    return UPLOAD_DIR
+
+def _scan_dir(path: str) -> tuple[list[str], list[tuple[str, int, float]]]:
+    dirs, files = [], []
+    with os.scandir(path) as it:
+        for e in it:
+            if e.is_dir(follow_symlinks=False):
+                dirs.append(e.path)
+            elif e.is_file(follow_symlinks=False):
+                st = e.stat(follow_symlinks=False)
+                files.append((e.path, st.st_size, st.st_mtime))
+    return dirs, files
+
+async def _walk(root: str, sem: asyncio.Semaphore, top_skip: set[str]) -> list[tuple[str, int, float]]:
+    """All files under root; directory listings run in threads, at most `sem` at a time."""
+    out: list[tuple[str, int, float]] = []
+    if not os.path.isdir(root):
+        return out
+
+    async def visit(path: str, top: bool):
+        async with sem:
+            try:
+                dirs, files = await asyncio.to_thread(_scan_dir, path)
+            except OSError as e:
+                log.warning("scrub: cannot list %s: %s", path, e)
+                return
+        out.extend(f for f in files if not (top and os.path.basename(f[0]) in _SKIP_FILES))
+        await asyncio.gather(*(visit(d, False) for d in dirs if not (top and os.path.basename(d) in top_skip)))
+
+    await visit(root, True)
+    return out
+
+async def _referenced(db, paths: list[str]) -> set[str]:
+    """Subset of `paths` referenced by any DB row, one query per reference column per batch."""
+    found: set[str] = set()
+    for i in range(0, len(paths), _BATCH):
+        batch = paths[i:i + _BATCH]
+        # stored paths may or may not be normalised; match both spellings
+        variants = {p: {p, os.path.normpath(p), os.path.abspath(p)} for p in batch}
+        lookup = {v: p for p, vs in variants.items() for v in vs}
+        keys = list(lookup)
+        for col in (ProjectFile.stored_path, ProjectFileVersion.stored_path, StorageBlob.stored_path, StorageBlob.cold_path, LibraryItem.path, FileShare.stored_path):
+            res = await db.execute(select(col).where(col.in_(keys)))
+            found.update(lookup[v] for v in res.scalars().all() if v in lookup)
+    return found
+
+async def _referenced_tickets(db, paths: list[str]) -> set[str]:
+    by_name = {os.path.basename(p): p for p in paths}
+    found: set[str] = set()
+    names = list(by_name)
+    for i in range(0, len(names), _BATCH):
+        res = await db.execute(select(Ticket.boq).where(Ticket.boq.in_(names[i:i + _BATCH])))
+        found.update(by_name[n] for n in res.scalars().all() if n in by_name)
+    return found
+
+async def _live_sessions(db) -> set[str]:
+    """Ids of open upload sessions; their chunks live in tmp/sessions/<id>/."""
+    res = await db.execute(select(UploadSession.id))
+    return set(res.scalars().all())
+
+async def _missing_references(db, on_disk: set[str]) -> tuple[int, list[str]]:
+    """References to files that are not on disk, streamed through keyset-paginated batches."""
+    count, sample = 0, []
+    for model, col in ((ProjectFile, ProjectFile.stored_path), (ProjectFileVersion, ProjectFileVersion.stored_path)):
+        last_id = 0
+        while True:
+            res = await db.execute(select(model.id, col).where(model.id > last_id).order_by(model.id.asc()).limit(_BATCH * 4))
+            rows = res.all()
+            if not rows:
+                break
+            for _, path in rows:
+                # object-store locators are not probed here (one HEAD per row)
+                if path and not storage.is_remote(path) and path not in on_disk and os.path.normpath(path) not in on_disk and not await asyncio.to_thread(blobstore.exists, path):
+                    count += 1
+                    if len(sample) < _SAMPLE:
+                        sample.append(path)
+            last_id = rows[-1][0]
+    return count, sample
+
+def _quarantine_target(path: str, stamp: str) -> str:
+    base = os.path.abspath(config.storage.files_dir)
+    ap = os.path.abspath(path)
+    rel = os.path.relpath(ap, base) if ap.startswith(base + os.sep) else ap.lstrip(os.sep)
+    return os.path.join(base, "quarantine", stamp, rel)
+
+def _move(src: str, dest: str):
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(src, dest)
+
+async def scrub(mode: Mode = "report", verify_checksums: bool = False, min_age_minutes: int = 60, concurrency: int = 8) -> ScrubReport:
+    """
+        Reconcile storage with the DB. Files younger than `min_age_minutes` are never touched
+        (uploads in flight). Blob checksum mismatches are reported; orphaned ones are handled like any orphan.
+    """
+    report = ScrubReport(mode=mode)
+    sem = asyncio.Semaphore(max(1, concurrency))
+    files_dir = config.storage.files_dir
+    storage_files = await _walk(files_dir, sem, _SKIP_DIRS)
+    ticket_files = await _walk(_ticket_upload_dir(), sem, set())
+    report.scanned_files = len(storage_files) + len(ticket_files)
+    report.scanned_bytes = sum(f[1] for f in storage_files) + sum(f[1] for f in ticket_files)
+    cutoff = datetime.utcnow().timestamp() - min_age_minutes * 60
+    sessions_dir = os.path.normpath(os.path.join(files_dir, "tmp", "sessions"))
+    blobs_dir = os.path.normpath(os.path.join(files_dir, "blobs"))
+
+    async with SessionLocal() as db:
+        referenced = await _referenced(db, [f[0] for f in storage_files])
+        referenced |= await _referenced_tickets(db, [f[0] for f in ticket_files])
+        live_sessions = await _live_sessions(db)
+        report.missing_files, report.missing = await _missing_references(db, {f[0] for f in storage_files})
+
+    orphans = []
+    for path, size, mtime in storage_files + ticket_files:
+        if path in referenced or mtime > cutoff:
+            continue
+        session_dir = os.path.dirname(os.path.normpath(path))
+        if os.path.dirname(session_dir) == sessions_dir and os.path.basename(session_dir) in live_sessions:
+            continue
+        orphans.append((path, size))
+    report.orphan_files = len(orphans)
+    report.orphan_bytes = sum(s for _, s in orphans)
+    report.orphans = [p for p, _ in orphans[:_SAMPLE]]
+
+    if verify_checksums:
+        blobs = [p for p, _, _ in storage_files if os.path.normpath(p).startswith(blobs_dir + os.sep)]
+
+        async def check(path: str):
+            async with sem:
+                try:
+                    digest, _ = await asyncio.to_thread(file_sha256, path)
+                except OSError as e:
+                    report.errors.append(f"{path}: {e}")
+                    return
+            if digest != os.path.basename(path):
+                report.checksum_mismatches.append(path)
+
+        await asyncio.gather(*(check(p) for p in blobs))
+
+    if mode != "report":
+        stamp = report.started_at.strftime("%Y%m%d-%H%M%S")
+        for path, _ in orphans:
+            try:
+                if mode == "quarantine":
+                    await asyncio.to_thread(_move, path, _quarantine_target(path, stamp))
+                    report.quarantined += 1
+                else:
+                    await asyncio.to_thread(os.remove, path)
+                    report.removed += 1
+            except OSError as e:
+                report.errors.append(f"{path}: {e}")
+    report.finished_at = datetime.utcnow()
+    return report
+
+@jobs.every(24 * 3600, name="storage_scrub")
+async def _scrub_job():
+    report = await scrub(config.storage.scrub_mode)
+    log.info("storage scrub (%s): %d files scanned, %d orphans (%d bytes), %d missing, %d quarantined, %d removed",
+             report.mode, report.scanned_files, report.orphan_files, report.orphan_bytes, report.missing_files, report.quarantined, report.removed)
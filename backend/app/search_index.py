@@ -0,0 +1,286 @@
+"""
+    Local full-text index over project files, their revisions and library items:
+    SQLite FTS5 in <files_dir>/search.sqlite, beside the main DB.
+    Text extraction runs in a background worker after upload; a periodic sweep catches up
+    on anything missed (other app nodes, crashes) and drops deleted documents.
+    Documents carry their contract and folder id (stable across folder renames and moves), so a
+    caller's read permissions are applied inside the ranked query rather than to its results.
+"""
+import os, re, json, asyncio, sqlite3, threading, zipfile, logging
+from datetime import datetime
+
+try:
+    import fitz  # PyMuPDF, optional: PDF text
+except Exception:
+    fitz = None
+
+from sqlalchemy import select, literal
+
+from .config import config
+from .db import SessionLocal
+from .models.models import ProjectFile, LibraryItem
+from .models.models_files import ProjectFileVersion
+from .models.models_schedule import ProjectFolder
+from .usage import ROOT_FOLDER
+from . import blobstore, jobs
+
+log = logging.getLogger(__name__)
+
+MAX_CHARS = 2_000_000
+_TEXT_EXT = {".txt", ".csv", ".tsv", ".md", ".json", ".xml", ".ifc", ".ifcxml", ".dxf", ".log", ".html", ".htm", ".sql", ".ini", ".yaml", ".yml"}
+_OOXML_PARTS = {".docx": ("word/document.xml",), ".xlsx": ("xl/sharedStrings.xml",), ".pptx": ("ppt/slides/",)}
+_TAG_RE = re.compile(r"<[^>]+>")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# folder_id of documents whose folder path names no folder (and of rows indexed before folder ids):
+# only readable where the caller can read every folder of the contract
+UNKNOWN_FOLDER = -1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS doc_meta (
+    rowid INTEGER PRIMARY KEY,
+    doc_key TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    contract_id INTEGER,
+    file_id INTEGER,
+    revision_no INTEGER,
+    sha256 TEXT,
+    indexed_at TEXT,
+    folder_id INTEGER NOT NULL DEFAULT -1
+);
+CREATE INDEX IF NOT EXISTS ix_doc_meta_contract ON doc_meta(contract_id, kind);
+CREATE INDEX IF NOT EXISTS ix_doc_meta_sha ON doc_meta(sha256);
+CREATE INDEX IF NOT EXISTS ix_doc_meta_kind_file ON doc_meta(kind, file_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(title, body, tokenize='unicode61 remove_diacritics 2');
+"""
+
+_write_lock = threading.Lock()
+_local = threading.local()
+
+def _db_path() -> str:
+    return config.storage.search_db or os.path.join(config.storage.files_dir, "search.sqlite")
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(_db_path(), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        if "folder_id" not in {r[1] for r in conn.execute("PRAGMA table_info(doc_meta)")}:
+            try:
+                # indexes built before folder scoping; the sweep fills the ids in
+                conn.execute("ALTER TABLE doc_meta ADD COLUMN folder_id INTEGER NOT NULL DEFAULT -1")
+            except sqlite3.OperationalError:
+                pass  # added by another thread
+        _local.conn = conn
+    return conn
+
+# ---------- extraction ----------
+
+def extract_text(path: str, name: str, content_type: str | None) -> str:
+    """Best-effort plain text of a document (blocking)."""
+    ext = os.path.splitext(name)[1].lower()
+    try:
+        if ext in _TEXT_EXT or (content_type or "").startswith("text/"):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read(MAX_CHARS)
+            return _TAG_RE.sub(" ", text) if ext in {".xml", ".html", ".htm", ".ifcxml"} else text
+        if ext in _OOXML_PARTS:
+            parts = []
+            with zipfile.ZipFile(path) as zf:
+                for member in zf.namelist():
+                    if any(member.startswith(p) for p in _OOXML_PARTS[ext]) and member.endswith(".xml"):
+                        parts.append(_TAG_RE.sub(" ", zf.read(member).decode("utf-8", "ignore")))
+            return " ".join(parts)[:MAX_CHARS]
+        if (ext == ".pdf" or content_type == "application/pdf") and fitz is not None:
+            out, total = [], 0
+            with fitz.open(path) as doc:
+                for page in doc:
+                    t = page.get_text()
+                    out.append(t)
+                    total += len(t)
+                    if total >= MAX_CHARS:
+                        break
+            return "".join(out)[:MAX_CHARS]
+    except (OSError, zipfile.BadZipFile, RuntimeError, ValueError) as e:
+        log.warning("text extraction failed for %s: %s", path, e)
+    return ""
+
+# ---------- index writes ----------
+
+def index_document(doc: dict):
+    """
+        Upsert one document (blocking). `doc`: key, kind, contract_id, file_id, revision_no, sha256, title,
+        path, content_type, folder_id. Unchanged content (same sha256) is not re-extracted; identical
+        blobs share extracted text. A file document also moves its revisions to its folder.
+    """
+    conn = _connect()
+    folder_id = doc.get("folder_id", UNKNOWN_FOLDER)
+    with _write_lock:
+        row = conn.execute("SELECT rowid, sha256 FROM doc_meta WHERE doc_key = ?", (doc["key"],)).fetchone()
+        if row and row[1] == doc["sha256"] and doc["sha256"]:
+            conn.execute("UPDATE docs SET title = ? WHERE rowid = ?", (doc["title"], row[0]))
+            conn.execute("UPDATE doc_meta SET folder_id = ? WHERE rowid = ?", (folder_id, row[0]))
+            _move_revisions(conn, doc, folder_id)
+            conn.commit()
+            return
+        body = None
+        if doc["sha256"]:
+            same = conn.execute("SELECT docs.body FROM doc_meta JOIN docs ON docs.rowid = doc_meta.rowid WHERE doc_meta.sha256 = ? LIMIT 1", (doc["sha256"],)).fetchone()
+            body = same[0] if same else None
+    if body is None:
+        try:
+            with blobstore.local_copy(doc["path"]) as local:
+                body = extract_text(local, doc["title"], doc.get("content_type"))
+        except Exception as e:  # remote object missing or unreachable
+            log.warning("text extraction failed for %s: %s", doc["path"], e)
+            body = ""
+    with _write_lock:
+        conn.execute("DELETE FROM docs WHERE rowid IN (SELECT rowid FROM doc_meta WHERE doc_key = ?)", (doc["key"],))
+        conn.execute("DELETE FROM doc_meta WHERE doc_key = ?", (doc["key"],))
+        cur = conn.execute("INSERT INTO doc_meta (doc_key, kind, contract_id, file_id, revision_no, sha256, indexed_at, folder_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (doc["key"], doc["kind"], doc.get("contract_id"), doc.get("file_id"), doc.get("revision_no"), doc["sha256"], datetime.utcnow().isoformat(), folder_id))
+        conn.execute("INSERT INTO docs (rowid, title, body) VALUES (?, ?, ?)", (cur.lastrowid, doc["title"], body))
+        _move_revisions(conn, doc, folder_id)
+        conn.commit()
+
+def _move_revisions(conn: sqlite3.Connection, doc: dict, folder_id: int):
+    if doc["kind"] == "file":
+        conn.execute("UPDATE doc_meta SET folder_id = ? WHERE kind = 'revision' AND file_id = ?", (folder_id, doc["file_id"]))
+
+def remove_documents(keys: list[str]):
+    if not keys:
+        return
+    conn = _connect()
+    with _write_lock:
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            conn.execute(f"DELETE FROM docs WHERE rowid IN (SELECT rowid FROM doc_meta WHERE doc_key IN ({marks}))", batch)
+            conn.execute(f"DELETE FROM doc_meta WHERE doc_key IN ({marks})", batch)
+        conn.commit()
+
+async def _handle(doc):
+    await asyncio.to_thread(index_document, doc)
+
+_queue = jobs.WorkQueue("search_index", _handle, workers=1, maxsize=10000)
+
+def file_doc(pf: ProjectFile, folder_id: int | None) -> dict:
+    """`folder_id`: the id of the file's folder, None at the project root (or UNKNOWN_FOLDER)."""
+    return {"key": f"pf:{pf.id}", "kind": "file", "contract_id": pf.contract_id, "file_id": pf.id, "revision_no": pf.latest_revision_no,
+            "sha256": pf.sha256, "title": pf.original_name, "path": pf.stored_path, "content_type": pf.content_type,
+            "folder_id": ROOT_FOLDER if folder_id is None else folder_id}
+
+def version_doc(v: ProjectFileVersion, pf: ProjectFile, folder_id: int | None) -> dict:
+    return {"key": f"pfv:{v.id}", "kind": "revision", "contract_id": pf.contract_id, "file_id": pf.id, "revision_no": v.revision_no,
+            "sha256": v.sha256, "title": pf.original_name, "path": v.stored_path, "content_type": v.content_type,
+            "folder_id": ROOT_FOLDER if folder_id is None else folder_id}
+
+def library_doc(item: LibraryItem) -> dict:
+    return {"key": f"lib:{item.id}", "kind": "library", "contract_id": None, "file_id": item.id, "revision_no": None,
+            "sha256": item.sha256, "title": item.title, "path": item.path, "content_type": None, "folder_id": UNKNOWN_FOLDER}
+
+def enqueue(doc: dict) -> bool:
+    return _queue.submit(doc)
+
+# ---------- queries ----------
+
+def fts_query(text: str) -> str | None:
+    """User text -> FTS5 query: every word must match, the last one as a prefix."""
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    quoted = [f'"{t}"' for t in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def search(query: str, scope: dict[int, list[int] | None] | None, kinds: tuple[str, ...], limit: int) -> list[dict]:
+    """
+        Ranked documents (blocking) within `scope`, as built by permissions.readable_scope:
+        {contract_id: None (every folder) or [readable folder ids]}, None = everything. Library items
+        are readable by everyone. The caller re-checks hits against the main DB (index lag).
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    conn = _connect()
+    kind_marks = ",".join("?" * len(kinds))
+    params: list = [match, *kinds]
+    where = ""
+    if scope is not None:
+        open_ids = [cid for cid, folders in scope.items() if folders is None]
+        folder_keys = [f"{cid}:{fid}" for cid, folders in scope.items() if folders for fid in folders]
+        where = """AND (m.kind = 'library'
+                        OR m.contract_id IN (SELECT value FROM json_each(?))
+                        OR m.contract_id || ':' || m.folder_id IN (SELECT value FROM json_each(?)))"""
+        params += [json.dumps(open_ids), json.dumps(folder_keys)]
+    params.append(limit)
+    rows = conn.execute(f"""
+        SELECT m.doc_key, m.kind, m.contract_id, m.file_id, m.revision_no, docs.title,
+               snippet(docs, 1, '<mark>', '</mark>', '…', 12), bm25(docs, 5.0, 1.0) AS score
+        FROM docs JOIN doc_meta m ON m.rowid = docs.rowid
+        WHERE docs MATCH ? AND m.kind IN ({kind_marks}) {where}
+        ORDER BY score LIMIT ?""", params).fetchall()
+    return [{"key": r[0], "kind": r[1], "contract_id": r[2], "file_id": r[3], "revision_no": r[4], "title": r[5], "snippet": r[6], "score": -r[7]} for r in rows]
+
+def indexed_state(kind: str, start_id: int, end_id: int) -> dict[int, tuple[str | None, int]]:
+    conn = _connect()
+    rows = conn.execute("SELECT file_id, sha256, folder_id FROM doc_meta WHERE kind = ? AND file_id BETWEEN ? AND ?", (kind, start_id, end_id)).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+def revision_keys(after_rowid: int, limit: int) -> list[tuple[int, str]]:
+    conn = _connect()
+    return conn.execute("SELECT rowid, doc_key FROM doc_meta WHERE kind = 'revision' AND rowid > ? ORDER BY rowid LIMIT ?", (after_rowid, limit)).fetchall()
+
+# ---------- catch-up sweep ----------
+
+async def _sweep_kind(db, kind: str, model, batch: int = 1000):
+    last_id = 0
+    while True:
+        if kind == "file":
+            # the folder id as the folder path resolves under the column collation
+            q = select(model, ProjectFolder.id).outerjoin(ProjectFolder, (ProjectFolder.contract_id == model.contract_id) & (ProjectFolder.path == model.folder))
+        else:
+            q = select(model, literal(None))
+        res = await db.execute(q.where(model.id > last_id).order_by(model.id.asc()).limit(batch))
+        rows = res.all()
+        if not rows:
+            break
+        lo, hi = rows[0][0].id, rows[-1][0].id
+        indexed = await asyncio.to_thread(indexed_state, kind, lo, hi)
+        live = set()
+        for r, folder_id in rows:
+            if getattr(r, "deleted_at", None) is not None:
+                continue
+            live.add(r.id)
+            sha256, indexed_folder = indexed.get(r.id, ("", None))
+            if kind == "file":
+                folder_id = ROOT_FOLDER if not r.folder else folder_id if folder_id is not None else UNKNOWN_FOLDER
+                if sha256 != r.sha256 or indexed_folder != folder_id:
+                    enqueue(file_doc(r, folder_id))
+            elif sha256 != r.sha256:
+                enqueue(library_doc(r))
+        prefix = "pf" if kind == "file" else "lib"
+        await asyncio.to_thread(remove_documents, [f"{prefix}:{i}" for i in indexed if i not in live])
+        last_id = hi
+
+async def _sweep_revisions(db, batch: int = 1000):
+    """Drop revision documents whose version row is gone or whose file is deleted."""
+    last_rowid = 0
+    while True:
+        rows = await asyncio.to_thread(revision_keys, last_rowid, batch)
+        if not rows:
+            break
+        keys = {int(key.split(":", 1)[1]): key for _, key in rows}
+        res = await db.execute(select(ProjectFileVersion.id).join(ProjectFile, ProjectFile.id == ProjectFileVersion.file_id)
+                               .where(ProjectFileVersion.id.in_(keys), ProjectFile.deleted_at.is_(None)))
+        live = set(res.scalars().all())
+        await asyncio.to_thread(remove_documents, [key for vid, key in keys.items() if vid not in live])
+        last_rowid = rows[-1][0]
+
+@jobs.every(600, name="search_index_sweep")
+async def _sweep():
+    async with SessionLocal() as db:
+        await _sweep_kind(db, "file", ProjectFile)
+        await _sweep_kind(db, "library", LibraryItem)
+        await _sweep_revisions(db)
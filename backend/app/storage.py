@@ -0,0 +1,263 @@
+"""
+    Storage backends for stored file content. A locator is what the DB keeps in stored_path / path:
+    a filesystem path for the local driver (every row written before the switch) or s3://bucket/key
+    for the S3-compatible driver. Reads dispatch on the locator, so both kinds work side by side;
+    new content goes to the backend selected by storage.backend. Staging always happens on local disk.
+"""
+import os, abc, uuid, shutil, asyncio, logging, tempfile, contextlib
+from typing import BinaryIO, Iterator, Optional
+
+from .config import config
+from .file_responses import Reader, local_reader, content_disposition
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # optional; only needed for storage.backend = "s3"
+    boto3 = None
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+_S3 = "s3://"
+
+def temp_path() -> str:
+    """Local staging path under <files_dir>/tmp (same filesystem as local blobs, so a local put is a rename)."""
+    d = os.path.join(config.storage.files_dir, "tmp")
+    os.makedirs(d, exist_ok=True)
+    return os.path.join(d, f"{uuid.uuid4().hex}.part")
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class StorageBackend(abc.ABC):
+    """Driver interface. `tmp` arguments are local staged files, which `put` consumes."""
+    @abc.abstractmethod
+    def locator(self, key: str, local_path: Optional[str] = None) -> str:
+        ...
+
+    @abc.abstractmethod
+    async def put(self, tmp: str, locator: str, content_type: Optional[str] = None) -> str:
+        ...
+
+    @abc.abstractmethod
+    def exists_sync(self, locator: str) -> bool:
+        ...
+
+    async def exists(self, locator: str) -> bool:
+        return await asyncio.to_thread(self.exists_sync, locator)
+
+    @abc.abstractmethod
+    async def delete(self, locator: str):
+        ...
+
+    @abc.abstractmethod
+    def reader(self, locator: str) -> Reader:
+        """reader(start, length) over the stored bytes (file_responses.Reader)."""
+
+    @abc.abstractmethod
+    def open(self, locator: str) -> BinaryIO:
+        """Blocking sequential binary stream."""
+
+    @abc.abstractmethod
+    @contextlib.contextmanager
+    def local_copy(self, locator: str) -> Iterator[str]:
+        """A local filesystem path holding the content for the duration of the block (blocking)."""
+
+    def presigned_url(self, locator: str, filename: Optional[str] = None, expires: Optional[int] = None) -> Optional[str]:
+        """Direct download URL, or None when the backend cannot hand out one."""
+        return None
+
+class LocalBackend(StorageBackend):
+    def locator(self, key: str, local_path: Optional[str] = None) -> str:
+        return local_path or os.path.join(config.storage.files_dir, *key.split("/"))
+
+    @staticmethod
+    def _move(tmp: str, dest: str):
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        shutil.move(tmp, dest)  # a rename on the same filesystem
+
+    async def put(self, tmp: str, locator: str, content_type: Optional[str] = None) -> str:
+        await asyncio.to_thread(self._move, tmp, locator)
+        return locator
+
+    def exists_sync(self, locator: str) -> bool:
+        return os.path.exists(locator)
+
+    async def delete(self, locator: str):
+        await asyncio.to_thread(_discard, locator)
+
+    def reader(self, locator: str) -> Reader:
+        return local_reader(locator)
+
+    def open(self, locator: str) -> BinaryIO:
+        return open(locator, "rb")
+
+    @contextlib.contextmanager
+    def local_copy(self, locator: str) -> Iterator[str]:
+        yield locator
+
+class _Body:
+    """File-like wrapper over a botocore StreamingBody (read/close/context manager)."""
+    def __init__(self, body):
+        self._body = body
+
+    def read(self, n: int = -1) -> bytes:
+        return self._body.read(None if n is None or n < 0 else n)
+
+    def close(self):
+        self._body.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class S3Backend(StorageBackend):
+    """
+        S3-compatible object storage (AWS, MinIO, Ceph RGW). Uploads use boto3's threaded multipart
+        transfer; reads are ranged GETs streamed in chunks; downloads can be handed out as presigned URLs.
+    """
+    def __init__(self):
+        if boto3 is None:
+            raise RuntimeError("storage.backend = 's3' needs the boto3 package")
+        s3 = config.s3
+        self.bucket = s3.bucket
+        self.prefix = s3.prefix.strip("/") + "/" if s3.prefix.strip("/") else ""
+        self.client = boto3.client(
+            "s3", endpoint_url=s3.endpoint_url or None, region_name=s3.region or None,
+            aws_access_key_id=s3.access_key or None, aws_secret_access_key=s3.secret_key or None,
+            config=BotoConfig(s3={"addressing_style": s3.addressing_style}, signature_version="s3v4",
+                              max_pool_connections=max(10, s3.max_concurrency * 2)))
+        self.transfer = TransferConfig(multipart_threshold=s3.multipart_mb * 1024 * 1024,
+                                       multipart_chunksize=s3.multipart_mb * 1024 * 1024,
+                                       max_concurrency=s3.max_concurrency, use_threads=True)
+
+    @staticmethod
+    def _split(locator: str) -> tuple[str, str]:
+        bucket, _, key = locator[len(_S3):].partition("/")
+        return bucket, key
+
+    def locator(self, key: str, local_path: Optional[str] = None) -> str:
+        return f"{_S3}{self.bucket}/{self.prefix}{key}"
+
+    def _upload(self, tmp: str, locator: str, content_type: Optional[str]):
+        bucket, key = self._split(locator)
+        extra = {"ContentType": content_type} if content_type else None
+        self.client.upload_file(tmp, bucket, key, ExtraArgs=extra, Config=self.transfer)
+
+    async def put(self, tmp: str, locator: str, content_type: Optional[str] = None) -> str:
+        await asyncio.to_thread(self._upload, tmp, locator, content_type)
+        await asyncio.to_thread(_discard, tmp)
+        return locator
+
+    def exists_sync(self, locator: str) -> bool:
+        bucket, key = self._split(locator)
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def delete(self, locator: str):
+        bucket, key = self._split(locator)
+        await asyncio.to_thread(self.client.delete_object, Bucket=bucket, Key=key)
+
+    def _get(self, locator: str, start: Optional[int] = None, length: Optional[int] = None):
+        bucket, key = self._split(locator)
+        kwargs = {"Bucket": bucket, "Key": key}
+        if start is not None:
+            kwargs["Range"] = f"bytes={start}-{start + length - 1}"
+        return self.client.get_object(**kwargs)["Body"]
+
+    def reader(self, locator: str) -> Reader:
+        async def read(start: int, length: int):
+            if length <= 0:
+                return
+            body = await asyncio.to_thread(self._get, locator, start, length)
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(body.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                await asyncio.to_thread(body.close)
+        return read
+
+    def open(self, locator: str) -> BinaryIO:
+        return _Body(self._get(locator))
+
+    @contextlib.contextmanager
+    def local_copy(self, locator: str) -> Iterator[str]:
+        bucket, key = self._split(locator)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(temp_path()), suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(bucket, key, tmp, Config=self.transfer)
+            yield tmp
+        finally:
+            _discard(tmp)
+
+    def presigned_url(self, locator: str, filename: Optional[str] = None, expires: Optional[int] = None) -> Optional[str]:
+        bucket, key = self._split(locator)
+        params = {"Bucket": bucket, "Key": key}
+        if filename:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires or config.s3.presign_seconds)
+
+_local = LocalBackend()
+_s3: Optional[S3Backend] = None
+
+def _s3_backend() -> S3Backend:
+    global _s3
+    if _s3 is None:
+        _s3 = S3Backend()
+    return _s3
+
+def is_remote(locator: Optional[str]) -> bool:
+    return bool(locator) and locator.startswith(_S3)
+
+def default() -> StorageBackend:
+    return _s3_backend() if config.storage.backend == "s3" else _local
+
+def backend_for(locator: str) -> StorageBackend:
+    return _s3_backend() if is_remote(locator) else _local
+
+# ---------- locator-dispatching shortcuts ----------
+
+def locator(key: str, local_path: Optional[str] = None) -> str:
+    """Where new content under `key` goes on the configured backend (`local_path` overrides the local layout)."""
+    return default().locator(key, local_path)
+
+async def put(tmp: str, locator: str, content_type: Optional[str] = None) -> str:
+    return await backend_for(locator).put(tmp, locator, content_type)
+
+async def exists(locator: str) -> bool:
+    return await backend_for(locator).exists(locator)
+
+def exists_sync(locator: str) -> bool:
+    return backend_for(locator).exists_sync(locator)
+
+async def delete(locator: str):
+    await backend_for(locator).delete(locator)
+
+def reader(locator: str) -> Reader:
+    return backend_for(locator).reader(locator)
+
+def open_stream(locator: str) -> BinaryIO:
+    return backend_for(locator).open(locator)
+
+def local_copy(locator: str):
+    return backend_for(locator).local_copy(locator)
+
+def presigned_url(locator: str, filename: Optional[str] = None, expires: Optional[int] = None) -> Optional[str]:
+    return backend_for(locator).presigned_url(locator, filename, expires)
@@ -0,0 +1,79 @@
+"""
+    Preview thumbnails for uploaded files, rendered by a background worker pool into
+    <files_dir>/thumbs/ab/<sha256>-<size>.jpg. Keyed by blob hash, so a rendered preview never changes.
+    Pillow renders images and PyMuPDF the first page of PDFs; both are optional.
+"""
+import os, uuid, asyncio, logging
+
+try:
+    from PIL import Image, ImageOps
+except Exception:  # Pillow not installed: no previews
+    Image = None
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+from .config import config
+from . import blobstore, jobs
+
+log = logging.getLogger(__name__)
+
+SIZES = (256, 1024)
+_IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/bmp", "image/tiff"}
+
+def thumb_path(sha256: str, size: int) -> str:
+    return os.path.join(config.storage.files_dir, "thumbs", sha256[:2], f"{sha256}-{size}.jpg")
+
+def can_preview(content_type: str | None) -> bool:
+    if content_type in _IMAGE_TYPES:
+        return Image is not None
+    if content_type == "application/pdf":
+        return Image is not None and fitz is not None
+    return False
+
+def _load(src: str, content_type: str):
+    if content_type == "application/pdf":
+        with fitz.open(src) as doc:
+            if doc.page_count == 0:
+                return None
+            page = doc[0]
+            zoom = max(SIZES) / max(page.rect.width, page.rect.height, 1)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    img = Image.open(src)
+    img.draft("RGB", (max(SIZES), max(SIZES)))  # JPEG: decode at reduced scale
+    img = ImageOps.exif_transpose(img)
+    return img.convert("RGB")
+
+def render(src: str, sha256: str, content_type: str):
+    """Write every missing size for one blob (blocking; runs in a worker thread)."""
+    missing = [s for s in SIZES if not os.path.exists(thumb_path(sha256, s))]
+    if not missing:
+        return
+    with blobstore.local_copy(src) as local:
+        img = _load(local, content_type)
+    if img is None:
+        return
+    for size in sorted(missing, reverse=True):
+        img.thumbnail((size, size))
+        dest = thumb_path(sha256, size)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        img.save(tmp, "JPEG", quality=82, optimize=True)
+        os.replace(tmp, dest)
+
+async def _handle(item):
+    src, sha256, content_type = item
+    await asyncio.to_thread(render, src, sha256, content_type)
+
+_queue = jobs.WorkQueue("thumbnails", _handle, workers=config.storage.thumbnail_workers)
+
+def enqueue(src: str, sha256: str | None, content_type: str | None) -> bool:
+    """
+        Queue preview rendering for a stored blob; no-op when it cannot be previewed. Does no I/O: the
+        worker skips sizes that are already rendered. Call it after the blob's row is committed.
+    """
+    if not sha256 or not can_preview(content_type):
+        return False
+    return _queue.submit((src, sha256, content_type))
@@ -0,0 +1,95 @@
+"""
+    Incrementally maintained storage usage per contract and per folder.
+    bytes_used counts every stored revision (files without version rows count once);
+    blob_bytes is the physical size of the blobs a contract stored first.
+    Callers apply deltas inside their own transaction.
+"""
+from typing import Optional
+
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models.models import ProjectFile
+from .models.models_files import ContractStorageUsage, FolderStorageUsage, ProjectFileVersion
+from .models.models_schedule import ProjectFolder
+
+ROOT_FOLDER = 0  # folder_id used for files at the project root
+
+async def _upsert(db: AsyncSession, model, key: dict, deltas: dict):
+    conds = [getattr(model, k) == v for k, v in key.items()]
+    values = {k: getattr(model, k) + v for k, v in deltas.items() if v}
+    if not values:
+        return
+    for _ in range(2):
+        res = await db.execute(update(model).where(*conds).values(**values))
+        if res.rowcount:
+            return
+        try:
+            async with db.begin_nested():
+                db.add(model(**key, **{k: v for k, v in deltas.items()}))
+            return
+        except IntegrityError:
+            continue
+
+async def add(db: AsyncSession, contract_id: int, folder_id: Optional[int], bytes_used: int = 0, files: int = 0, versions: int = 0):
+    """Apply a logical usage delta to the contract and to the folder holding the file."""
+    deltas = {"bytes_used": bytes_used, "file_count": files, "version_count": versions}
+    await _upsert(db, ContractStorageUsage, {"contract_id": contract_id}, deltas)
+    await _upsert(db, FolderStorageUsage, {"contract_id": contract_id, "folder_id": folder_id or ROOT_FOLDER},
+                  {"bytes_used": bytes_used, "file_count": files})
+
+async def move(db: AsyncSession, contract_id: int, src_folder_id: Optional[int], dst_folder_id: Optional[int], bytes_used: int, files: int = 1):
+    """Shift a file's usage between folders (contract totals are unchanged)."""
+    if (src_folder_id or ROOT_FOLDER) == (dst_folder_id or ROOT_FOLDER):
+        return
+    await _upsert(db, FolderStorageUsage, {"contract_id": contract_id, "folder_id": src_folder_id or ROOT_FOLDER}, {"bytes_used": -bytes_used, "file_count": -files})
+    await _upsert(db, FolderStorageUsage, {"contract_id": contract_id, "folder_id": dst_folder_id or ROOT_FOLDER}, {"bytes_used": bytes_used, "file_count": files})
+
+async def add_blob_bytes(db: AsyncSession, contract_id: Optional[int], delta: int):
+    if contract_id is None or not delta:
+        return
+    await _upsert(db, ContractStorageUsage, {"contract_id": contract_id}, {"blob_bytes": delta})
+
+async def file_footprint(db: AsyncSession, pf: ProjectFile) -> tuple[int, int]:
+    """(bytes, revisions) a file contributes to bytes_used / version_count."""
+    res = await db.execute(select(func.coalesce(func.sum(ProjectFileVersion.size_bytes), 0), func.count(ProjectFileVersion.id)).where(ProjectFileVersion.file_id == pf.id))
+    total, n = res.one()
+    return (int(total), int(n)) if n else (pf.size_bytes or 0, 0)
+
+async def remaining_quota(db: AsyncSession, contract_id: int) -> Optional[int]:
+    """Bytes left under the contract's quota, None when it has none."""
+    res = await db.execute(select(ContractStorageUsage.quota_bytes, ContractStorageUsage.bytes_used).where(ContractStorageUsage.contract_id == contract_id))
+    row = res.first()
+    if not row or row[0] is None:
+        return None
+    return max(int(row[0]) - int(row[1] or 0), 0)
+
+async def recount(db: AsyncSession, contract_id: int):
+    """Rebuild a contract's counters from the file tables (repairs drift; full scan of one contract)."""
+    per_file = select(ProjectFile.id, ProjectFile.folder, ProjectFile.size_bytes,
+                      select(func.coalesce(func.sum(ProjectFileVersion.size_bytes), 0)).where(ProjectFileVersion.file_id == ProjectFile.id).scalar_subquery(),
+                      select(func.count(ProjectFileVersion.id)).where(ProjectFileVersion.file_id == ProjectFile.id).scalar_subquery(),
+                      ).where(ProjectFile.contract_id == contract_id, ProjectFile.deleted_at.is_(None))
+    res = await db.execute(per_file)
+    rows = res.all()
+    fres = await db.execute(select(ProjectFolder.id, ProjectFolder.path).where(ProjectFolder.contract_id == contract_id))
+    folder_ids = {path: fid for fid, path in fres.all()}
+    total_bytes = total_versions = 0
+    folders: dict[int, list[int]] = {}
+    for _, folder, size, vbytes, vcount in rows:
+        b = int(vbytes) if vcount else int(size or 0)
+        total_bytes += b
+        total_versions += int(vcount)
+        acc = folders.setdefault(folder_ids.get(folder, ROOT_FOLDER) if folder else ROOT_FOLDER, [0, 0])
+        acc[0] += b
+        acc[1] += 1
+    usage = await db.get(ContractStorageUsage, contract_id)
+    if usage is None:
+        usage = ContractStorageUsage(contract_id=contract_id)
+        db.add(usage)
+    usage.bytes_used, usage.file_count, usage.version_count = total_bytes, len(rows), total_versions
+    await db.execute(FolderStorageUsage.__table__.delete().where(FolderStorageUsage.contract_id == contract_id))
+    for fid, (b, n) in folders.items():
+        db.add(FolderStorageUsage(contract_id=contract_id, folder_id=fid, bytes_used=b, file_count=n))
+    await db.flush()
@@ -1,20 +1,71 @@
-import os, uuid, aiofiles
-from fastapi import UploadFile
+import os, uuid, hashlib, asyncio, aiofiles
+from dataclasses import dataclass
+from fastapi import UploadFile, HTTPException
 from .config import config
+from . import storage
 
-async def save_upload(file: UploadFile, subdir: str = "") -> tuple[str, str, int, str]:
-    os.makedirs(config.storage.files_dir, exist_ok=True)
-    dir_path = os.path.join(config.storage.files_dir, subdir) if subdir else config.storage.files_dir
-    os.makedirs(dir_path, exist_ok=True)
-    suffix = os.path.splitext(file.filename)[1]
-    stored_name = f"{uuid.uuid4().hex}{suffix}"
-    path = os.path.join(dir_path, stored_name)
+CHUNK_SIZE = 1024 * 1024
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+    content_type: str
+
+def upload_limit(contract_id: int | None = None) -> int | None:
+    """Max upload size in bytes for a project (per-project override, then global); None = unlimited."""
+    per_project = getattr(config.storage, "project_max_upload_mb", {}) or {}
+    mb = per_project.get(str(contract_id)) if contract_id is not None else None
+    if mb is None:
+        mb = getattr(config.storage, "max_upload_mb", 0)
+    return int(mb) * 1024 * 1024 if mb else None
+
+async def stream_upload(file: UploadFile, path: str, max_bytes: int | None = None) -> StoredUpload:
+    """
+        Write an upload to `path` chunk by chunk without blocking the event loop,
+        computing size and SHA-256 on the way. Past `max_bytes` the partial file is removed and 413 raised.
+    """
+    digest = hashlib.sha256()
     size = 0
-    async with aiofiles.open(path, "wb") as f:
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise HTTPException(413, f"File exceeds the upload limit of {max_bytes // (1024 * 1024)} MB")
+                # hashlib releases the GIL on large buffers
+                await asyncio.to_thread(digest.update, chunk)
+                await f.write(chunk)
+    except BaseException:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        raise
+    return StoredUpload(path=path, size=size, sha256=digest.hexdigest(), content_type=file.content_type or "application/octet-stream")
+
+def file_sha256(path: str) -> tuple[str, int]:
+    """(sha256 hex, size) of a file on disk; blocking, run it in a thread."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
         while True:
-            chunk = await file.read(1024*1024)
+            chunk = f.read(CHUNK_SIZE)
             if not chunk:
                 break
             size += len(chunk)
-            await f.write(chunk)
-    return stored_name, path, size, file.content_type or "application/octet-stream"
+            digest.update(chunk)
+    return digest.hexdigest(), size
+
+async def save_upload(file: UploadFile, subdir: str = "", max_bytes: int | None = None) -> tuple[str, str, int, str, str]:
+    """(stored name, locator, size, content type, sha256). Queue previews (thumbnails.enqueue) after the caller commits."""
+    suffix = os.path.splitext(file.filename)[1]
+    stored_name = f"{uuid.uuid4().hex}{suffix}"
+    # staged locally, then handed to the configured storage backend; `path` is the returned locator
+    stored = await stream_upload(file, storage.temp_path(), max_bytes if max_bytes is not None else upload_limit())
+    path = await storage.put(stored.path, storage.locator(f"{subdir}/{stored_name}" if subdir else stored_name), stored.content_type)
+    return stored_name, path, stored.size, stored.content_type, stored.sha256
@@ -0,0 +1,54 @@
+import os, sys
+
+import pytest
+
+# run from anywhere: the tests import the backend as the `app` package, like uvicorn does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import config
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def files_dir(tmp_path, monkeypatch):
+    """Point the local storage driver, cold tier and search index at a temporary directory."""
+    root = tmp_path / "files"
+    root.mkdir()
+    monkeypatch.setattr(config.storage, "files_dir", str(root))
+    monkeypatch.setattr(config.storage, "cold_dir", "")
+    monkeypatch.setattr(config.storage, "search_db", "")
+    monkeypatch.setattr(config.storage, "backend", "local")
+    return str(root)
+
+def _sqlite_metadata():
+    """A copy of every table that SQLite accepts: no MariaDB collations, nullable legacy upload dates."""
+    from sqlalchemy import MetaData
+    from app.db import Base
+    from app.models import models, models_files, models_schedule  # noqa: F401 (registers the tables)
+
+    md = MetaData()
+    for table in Base.metadata.tables.values():
+        table.to_metadata(md)
+    for table in md.tables.values():
+        for column in table.columns:
+            if getattr(column.type, "collation", None):
+                column.type = column.type.copy()  # shared with the model's column
+                column.type.collation = None
+    md.tables["project_files"].c.uploaded_at.nullable = True
+    return md
+
+@pytest.fixture
+async def db():
+    """AsyncSession on an in-memory SQLite database with every table (needs aiosqlite)."""
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import StaticPool
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(_sqlite_metadata().create_all)
+    async with AsyncSession(engine, expire_on_commit=False, autoflush=False) as session:
+        yield session
+    await engine.dispose()
@@ -0,0 +1,79 @@
+import io, os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import select
+from starlette.datastructures import Headers
+
+from app.config import config
+from app.models.models import ProjectFile
+from app.models.models_files import ContractStorageUsage, ProjectFileVersion, StorageBlob
+from app.routers import files_ext
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = SimpleNamespace(id=1, role_id=1)
+
+@pytest.fixture(autouse=True)
+def queued(monkeypatch):
+    out = {"thumbs": [], "docs": []}
+    monkeypatch.setattr(files_ext.thumbnails, "enqueue", lambda path, sha, ct: out["thumbs"].append(sha) or True)
+    monkeypatch.setattr(files_ext.search_index, "enqueue", lambda doc: out["docs"].append(doc["key"]) or True)
+    monkeypatch.setattr(config.storage, "max_upload_mb", 0)
+    monkeypatch.setattr(config.storage, "project_max_upload_mb", {})
+    return out
+
+def upload(name: str, data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=name, headers=Headers({"content-type": "image/png"}))
+
+async def batch(db, *files, folder=None):
+    return await files_ext.upload_batch(7, files=[upload(n, d) for n, d in files], folder=folder, db=db, u=ADMIN)
+
+async def test_batch_writes_every_file_and_shares_identical_content(db, files_dir, queued):
+    out = await batch(db, ("a.png", b"aaaa"), ("b.png", b"bb"), ("c.png", b"aaaa"), ("../d.png", b"d"))
+    assert (out["uploaded"], out["failed"]) == (4, 0)
+    assert [r["name"] for r in out["results"]] == ["a.png", "b.png", "c.png", "d.png"]
+    rows = {f.id: f for f in (await db.execute(select(ProjectFile))).scalars().all()}
+    for r in out["results"]:
+        assert rows[r["id"]].original_name == r["name"] and rows[r["id"]].latest_revision_no == 1
+    versions = (await db.execute(select(ProjectFileVersion.file_id, ProjectFileVersion.revision_no))).all()
+    assert sorted(versions) == sorted((r["id"], 1) for r in out["results"])
+
+    a = out["results"][0]["sha256"]
+    assert out["results"][2]["sha256"] == a and rows[out["results"][0]["id"]].stored_path == rows[out["results"][2]["id"]].stored_path
+    assert (await db.get(StorageBlob, a)).ref_count == 4
+    assert len((await db.execute(select(StorageBlob))).all()) == 3
+    assert os.listdir(os.path.join(files_dir, "tmp")) == []
+
+    usage = await db.get(ContractStorageUsage, 7)
+    assert (usage.bytes_used, usage.file_count, usage.version_count, usage.blob_bytes) == (11, 4, 4, 7)
+    assert sorted(queued["thumbs"]) == sorted({r["sha256"] for r in out["results"]})
+    assert len(queued["docs"]) == 8
+
+async def test_quota_applies_to_the_batch_in_upload_order(db, files_dir):
+    db.add(ContractStorageUsage(contract_id=7, quota_bytes=10))
+    await db.commit()
+    out = await batch(db, ("a.png", b"a" * 6), ("b.png", b"b" * 6), ("c.png", b"c" * 4))
+    assert [r["ok"] for r in out["results"]] == [True, False, True]
+    assert out["results"][1]["error"] == "Project storage quota exceeded"
+    assert os.listdir(os.path.join(files_dir, "tmp")) == []
+
+async def test_files_over_the_size_limit_fail_alone(db, files_dir, monkeypatch):
+    monkeypatch.setattr(config.storage, "max_upload_mb", 1)
+    out = await batch(db, ("big.png", b"x" * (1024 * 1024 + 1)), ("small.png", b"x"))
+    assert [r["ok"] for r in out["results"]] == [False, True]
+    assert "upload limit" in out["results"][0]["error"]
+
+async def test_nothing_accepted_writes_nothing(db, files_dir):
+    db.add(ContractStorageUsage(contract_id=7, quota_bytes=3))
+    await db.commit()
+    out = await batch(db, ("a.png", b"aaaa"))
+    assert (out["uploaded"], out["failed"]) == (0, 1)
+    assert (await db.execute(select(ProjectFile))).first() is None
+
+async def test_batches_are_bounded(db, files_dir, monkeypatch):
+    monkeypatch.setattr(files_ext, "_BATCH_MAX_FILES", 2)
+    with pytest.raises(HTTPException) as e:
+        await batch(db, ("a", b"a"), ("b", b"b"), ("c", b"c"))
+    assert e.value.status_code == 400
@@ -0,0 +1,77 @@
+import hashlib, os
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import blobstore, storage
+from app.models.models_files import ContractStorageUsage, StorageBlob
+
+pytestmark = pytest.mark.anyio
+
+def staged(data: bytes) -> tuple[str, str]:
+    path = storage.temp_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    return path, hashlib.sha256(data).hexdigest()
+
+async def test_put_stores_by_hash_and_dedupes(db, files_dir):
+    tmp, sha = staged(b"content")
+    dest = await blobstore.put(db, tmp, sha, 7, refs=2, contract_id=1)
+    assert dest == blobstore.blob_path(sha) == os.path.join(files_dir, "blobs", sha[:2], sha[2:4], sha)
+    assert os.path.exists(dest) and not os.path.exists(tmp)
+    tmp2, _ = staged(b"content")
+    assert await blobstore.put(db, tmp2, sha, 7, refs=1, contract_id=2) == dest
+    assert not os.path.exists(tmp2)
+    await db.commit()
+    blob = await db.get(StorageBlob, sha)
+    assert blob.ref_count == 3 and blob.contract_id == 1
+    # physical bytes are charged once, to the contract that stored the blob first
+    assert (await db.get(ContractStorageUsage, 1)).blob_bytes == 7
+    assert await db.get(ContractStorageUsage, 2) is None
+
+async def test_put_heals_a_lost_file(db, files_dir):
+    tmp, sha = staged(b"content")
+    dest = await blobstore.put(db, tmp, sha, 7)
+    os.remove(dest)
+    tmp, _ = staged(b"content")
+    await blobstore.put(db, tmp, sha, 7)
+    with open(dest, "rb") as f:
+        assert f.read() == b"content"
+
+async def test_refcounts_and_garbage_collection(db, files_dir, monkeypatch):
+    monkeypatch.setattr(blobstore, "SessionLocal", lambda: AsyncSession(db.bind, expire_on_commit=False))
+    tmp, kept = staged(b"kept")
+    await blobstore.put(db, tmp, kept, 4, contract_id=1)
+    tmp, dropped = staged(b"dropped")
+    dest = await blobstore.put(db, tmp, dropped, 7, refs=2, contract_id=1)
+    await blobstore.decref(db, dropped)
+    await db.commit()
+    assert (await db.get(StorageBlob, dropped)).unreferenced_at is None
+    await blobstore.decref(db, dropped)
+    await blobstore.decref(db, None)
+    await db.commit()
+    blob = await db.get(StorageBlob, dropped, populate_existing=True)
+    assert blob.ref_count == 0 and blob.unreferenced_at is not None
+
+    assert await blobstore.collect_garbage(grace=timedelta(hours=1)) == 0
+    assert await blobstore.collect_garbage(grace=timedelta(seconds=-1)) == 1
+    db.expunge_all()
+    assert await db.get(StorageBlob, dropped) is None and not os.path.exists(dest)
+    assert await db.get(StorageBlob, kept) is not None
+    assert (await db.get(ContractStorageUsage, 1)).blob_bytes == 4
+
+async def test_incref_revives_an_unreferenced_blob(db, files_dir):
+    tmp, sha = staged(b"x")
+    await blobstore.put(db, tmp, sha, 1)
+    await blobstore.decref(db, sha)
+    await blobstore.incref(db, sha)
+    await db.commit()
+    blob = await db.get(StorageBlob, sha, populate_existing=True)
+    assert blob.ref_count == 1 and blob.unreferenced_at is None
+
+def test_blob_sha_only_for_blob_paths(files_dir):
+    sha = "ab" * 32
+    assert blobstore._blob_sha(blobstore.blob_path(sha)) == sha
+    assert blobstore._blob_sha(os.path.join(files_dir, "projects", "7", sha)) is None
+    assert blobstore._blob_sha(os.path.join(files_dir, "projects", "7", "a.pdf")) is None
@@ -0,0 +1,116 @@
+import hashlib, os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import blobstore, retention, storage
+from app.models.models import ProjectFile
+from app.models.models_files import ContractStorageUsage, ProjectFileVersion, RetentionPolicy, StorageBlob
+from app.routers import files_ext
+from app.utils import StoredUpload
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 10, 1)
+CODECS = ["gzip"] + (["zstd"] if blobstore.zstandard is not None else [])
+
+def content(n: int) -> bytes:
+    return f"revision {n} ".encode() * 5000
+
+@pytest.fixture(autouse=True)
+def no_publish(monkeypatch):
+    monkeypatch.setattr(files_ext, "_publish_upload", lambda *a: None)
+
+async def upload(db, data: bytes, pf=None):
+    path = storage.temp_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    stored = StoredUpload(path=path, size=len(data), sha256=hashlib.sha256(data).hexdigest(), content_type="text/plain")
+    out, _ = await files_ext._store_upload(db, SimpleNamespace(id=1), 7, None, pf, "a.txt", "text/plain", stored)
+    await db.commit()
+    return await db.get(ProjectFile, out["id"])
+
+async def history(db, revisions: int, age_days: int = 60) -> ProjectFile:
+    pf = await upload(db, content(1))
+    for n in range(2, revisions + 1):
+        await upload(db, content(n), pf)
+    await db.execute(update(ProjectFileVersion).values(uploaded_at=NOW - timedelta(days=age_days)))
+    await db.commit()
+    return pf
+
+def sha(n: int) -> str:
+    return hashlib.sha256(content(n)).hexdigest()
+
+def test_is_old():
+    policy = RetentionPolicy(contract_id=7, enabled=True, keep_hot_revisions=2, cold_after_days=30)
+    old, recent = NOW - timedelta(days=31), NOW - timedelta(days=29)
+    assert retention._is_old(policy, 3, 5, old, NOW)
+    assert not retention._is_old(policy, 4, 5, old, NOW)
+    assert not retention._is_old(policy, 3, 5, recent, NOW)
+    assert retention._is_old(policy, 3, 5, None, NOW)
+    assert not retention._is_old(policy, 3, None, old, NOW)
+    assert not retention._is_old(None, 1, 5, old, NOW)
+    policy.enabled = False
+    assert not retention._is_old(policy, 1, 5, old, NOW)
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_compress_round_trip(tmp_path, codec):
+    src, packed, out = tmp_path / "a", tmp_path / "a.packed", tmp_path / "a.out"
+    src.write_bytes(content(1))
+    size = blobstore._compress(str(src), str(packed), codec)
+    assert size == os.path.getsize(packed) < len(content(1))
+    assert blobstore._digest(str(packed), codec) == sha(1)
+    blobstore._decompress(str(packed), codec, str(out))
+    assert out.read_bytes() == content(1)
+
+async def test_candidates_keep_recent_current_and_shared_revisions(db, files_dir):
+    await history(db, 5)
+    # another file whose current content is revision 1: it has to stay hot
+    other = await upload(db, content(1))
+    assert other.sha256 == sha(1)
+    db.add(RetentionPolicy(contract_id=7, enabled=True, keep_hot_revisions=2, cold_after_days=30))
+    await db.commit()
+    policies = {7: await db.get(RetentionPolicy, 7)}
+    assert sorted(await retention._candidates(db, policies, NOW)) == sorted([sha(2), sha(3)])
+    assert await retention._candidates(db, policies, NOW - timedelta(days=45)) == []
+
+@pytest.mark.parametrize("codec", CODECS)
+async def test_frozen_blobs_read_back_and_thaw(db, files_dir, monkeypatch, codec):
+    monkeypatch.setattr(blobstore.config.storage, "cold_codec", codec)
+    monkeypatch.setattr(retention, "SessionLocal", lambda: AsyncSession(db.bind, expire_on_commit=False))
+    await history(db, 3)
+    db.add(RetentionPolicy(contract_id=7, enabled=True, keep_hot_revisions=1, cold_after_days=0))
+    await db.commit()
+    report = await retention.compact()
+    assert (report.candidates, report.frozen, report.errors) == (2, 2, [])
+    hot = blobstore.blob_path(sha(1))
+    blob = await db.get(StorageBlob, sha(1), populate_existing=True)
+    assert (blob.tier, blob.codec) == ("cold", codec) and not os.path.exists(hot)
+    assert blobstore.locate(hot) == (blobstore.cold_path(sha(1), codec), codec)
+    usage = await db.get(ContractStorageUsage, 7, populate_existing=True)
+    assert usage.blob_bytes == len(content(3)) + 2 * blob.cold_size_bytes
+    assert report.bytes_saved == 2 * (len(content(1)) - blob.cold_size_bytes)
+
+    with blobstore.open_blob(hot) as f:
+        assert f.read() == content(1)
+    with blobstore.local_copy(hot) as local:
+        with open(local, "rb") as f:
+            assert f.read() == content(1)
+    assert not os.path.exists(local)
+    read = blobstore.cold_reader(hot)
+    assert b"".join([c async for c in read(20_000, 100)]) == content(1)[20_000:20_100]
+
+    await blobstore.thaw(db, sha(1))
+    await db.commit()
+    with open(hot, "rb") as f:
+        assert f.read() == content(1)
+    assert not os.path.exists(blobstore.cold_path(sha(1), codec))
+    assert (await db.get(StorageBlob, sha(1))).tier == "hot"
+
+async def test_current_content_is_never_frozen(db, files_dir):
+    await history(db, 1)
+    assert await blobstore.freeze(db, sha(1)) is None
+    assert os.path.exists(blobstore.blob_path(sha(1)))
@@ -0,0 +1,98 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from app import cpm
+
+D0 = date(2026, 1, 5)
+
+def item(i, start, days, parent=None, stored=(None,) * 6):
+    """(id, parent_id, planned_start, planned_end, *stored results) like Network.load rows."""
+    s = D0 + timedelta(days=start) if start is not None else None
+    e = s + timedelta(days=days - 1) if s is not None else None
+    return (i, parent, s, e, *stored)
+
+def schedule(net, sched):
+    return {i: net.values(sched, k) for k, i in enumerate(net.ids)}
+
+def test_finish_to_start_with_lag():
+    net = cpm.Network([item(1, 0, 3), item(2, 0, 2), item(3, 0, 1)], [(1, 2, "FS", 1)])
+    sched = net.compute()
+    got = schedule(net, sched)
+    assert got[2][0] == D0 + timedelta(days=4)
+    assert got[2][1] == D0 + timedelta(days=5)
+    assert sched.finish == 6
+    assert net.critical_path(sched) == [1, 2]
+    assert got[3][4] == 5 and got[3][5] is False
+
+@pytest.mark.parametrize("kind, es", [("SS", 2), ("FF", 3), ("SF", 0)])
+def test_link_types(kind, es):
+    # predecessor 4 days, successor 3 days, lag 2
+    net = cpm.Network([item(1, 0, 4), item(2, 0, 3)], [(1, 2, kind, 2)])
+    sched = net.compute()
+    assert sched.es[net.index[2]] == es
+
+def test_planned_start_is_a_lower_bound():
+    net = cpm.Network([item(1, 0, 2), item(2, 10, 2)], [(1, 2, "FS", 0)])
+    sched = net.compute()
+    assert sched.es[net.index[2]] == 10
+    assert net.values(sched, net.index[1])[4] == 8
+
+def test_summary_links_are_ignored():
+    items = [item(10, 0, 5), item(1, 0, 2, parent=10), item(2, 0, 2)]
+    net = cpm.Network(items, [(10, 2, "FS", 0), (1, 2, "FS", 0)])
+    assert net.summary_ids == [10]
+    assert net.ignored == 1
+    rows = {r["id"]: r for r in net.changes(net.compute())}
+    assert rows[10]["early_start"] is None and rows[10]["critical"] is False
+
+def test_loop_members_have_no_dates():
+    net = cpm.Network([item(1, 0, 1), item(2, 0, 1), item(3, 0, 1), item(4, 0, 1)],
+                      [(1, 2, "FS", 0), (2, 3, "FS", 0), (3, 2, "FS", 0), (3, 4, "FS", 0)])
+    sched = net.compute()
+    assert sorted(net.ids[k] for k in net.cyclic) == [2, 3, 4]
+    assert sched.es[net.index[1]] == 0
+    assert all(sched.es[k] is None for k in net.cyclic)
+
+def test_creates_loop():
+    links = [(1, 2), (2, 3)]
+    assert cpm.creates_loop(links, 3, 1)
+    assert not cpm.creates_loop(links, 1, 3)
+    assert not cpm.creates_loop(links, 4, 1)
+
+def random_network(seed, n=400, links=1200):
+    rng = random.Random(seed)
+    items = [item(i, rng.randint(0, 60), rng.randint(1, 15)) for i in range(1, n + 1)]
+    deps = set()
+    while len(deps) < links:
+        a, b = sorted(rng.sample(range(1, n + 1), 2))
+        deps.add((a, b, rng.choice(cpm.TYPES), rng.randint(-2, 5)))
+    return items, sorted(deps)
+
+@pytest.mark.skipif(cpm.np is None, reason="numpy not installed")
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_numpy_matches_python(seed):
+    net = cpm.Network(*random_network(seed))
+    a, b = net._compute_numpy(), net._compute_python()
+    assert (a.es, a.ef, a.ls, a.lf) == (b.es, b.ef, b.ls, b.lf)
+
+@pytest.mark.parametrize("seed", [4, 5, 6])
+def test_incremental_matches_full(seed):
+    items, deps = random_network(seed)
+    net = cpm.Network(items, deps)
+    sched = net.compute()
+    stored = [(*r[:4], *net.values(sched, net.index[r[0]])) for r in items]
+    rng = random.Random(seed)
+    earliest = min(r[2] for r in items)
+    changed = [i for i in rng.sample(range(1, len(items) + 1), 5) if items[i - 1][2] != earliest]
+    for i in changed:
+        r = stored[i - 1]
+        shift = timedelta(days=rng.randint(1, 4))
+        stored[i - 1] = (r[0], r[1], r[2] + shift, r[3] + shift * 2, *r[4:])
+    edited = cpm.Network(stored, deps)
+    prev = edited.previous()
+    assert prev is not None
+    inc = edited.update(prev, [edited.index[i] for i in changed])
+    full = edited.compute()
+    assert (inc.es, inc.ef, inc.ls, inc.lf) == (full.es, full.ef, full.ls, full.lf)
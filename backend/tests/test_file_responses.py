@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Request
+
+from app import file_responses as fr
+
+pytestmark = pytest.mark.anyio
+
+DATA = bytes(range(256)) * 40
+ETAG = '"abc"'
+MODIFIED = datetime(2026, 3, 1, 12, 0, 0, 500)
+
+def request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+async def serve(path, **headers):
+    resp = await fr.send_file(request(**headers), str(path), etag=ETAG, media_type="application/pdf",
+                              filename="plan.pdf", last_modified=MODIFIED)
+    body = b""
+    if hasattr(resp, "body_iterator"):
+        async for chunk in resp.body_iterator:
+            body += chunk
+    return resp, body
+
+@pytest.fixture
+def path(tmp_path):
+    p = tmp_path / "plan.pdf"
+    p.write_bytes(DATA)
+    return p
+
+@pytest.mark.parametrize("header, ranges", [
+    ("bytes=0-9", [(0, 9)]),
+    ("bytes=10-", [(10, 99)]),
+    ("bytes=-5", [(95, 99)]),
+    ("bytes=-500", [(0, 99)]),
+    ("bytes=90-200", [(90, 99)]),
+    ("bytes=0-4, 5-9,20-29", [(0, 9), (20, 29)]),
+    ("bytes=20-29,0-4", [(0, 4), (20, 29)]),
+    ("bytes=100-", []),
+    ("bytes=-0", []),
+    ("bytes=9-3", None),
+    ("bytes=a-3", None),
+    ("bytes=5", None),
+    ("items=0-9", None),
+    ("bytes=" + ",".join(f"{i * 2}-{i * 2}" for i in range(fr.MAX_RANGES + 1)), None),
+])
+def test_parse_range(header, ranges):
+    assert fr.parse_range(header, 100) == ranges
+
+def test_weak_match():
+    assert fr._weak_match('"abc"', 'W/"abc"')
+    assert fr._weak_match('"abc"', '"x", "abc"')
+    assert fr._weak_match('"abc"', "*")
+    assert not fr._weak_match('"abc"', '"abcd"')
+
+def test_content_disposition_keeps_unicode_names():
+    value = fr.content_disposition('plan "é".pdf')
+    assert value.startswith('attachment; filename="plan _?_.pdf"')
+    assert value.endswith("filename*=UTF-8''plan%20%22%C3%A9%22.pdf")
+
+async def test_full_response(path):
+    resp, body = await serve(path)
+    assert resp.status_code == 200 and body == DATA
+    assert resp.headers["etag"] == ETAG and resp.headers["accept-ranges"] == "bytes"
+    assert resp.headers["last-modified"] == "Sun, 01 Mar 2026 12:00:00 GMT"
+
+async def test_not_modified(path):
+    assert (await serve(path, if_none_match='W/"abc"'))[0].status_code == 304
+    assert (await serve(path, if_none_match='"other"'))[0].status_code == 200
+    assert (await serve(path, if_modified_since="Sun, 01 Mar 2026 12:00:00 GMT"))[0].status_code == 304
+    assert (await serve(path, if_modified_since="Sun, 01 Mar 2026 11:59:59 GMT"))[0].status_code == 200
+    # If-None-Match wins over If-Modified-Since
+    assert (await serve(path, if_none_match='"other"', if_modified_since="Sun, 01 Mar 2026 12:00:00 GMT"))[0].status_code == 200
+
+async def test_single_range(path):
+    resp, body = await serve(path, range="bytes=100-199")
+    assert resp.status_code == 206 and body == DATA[100:200]
+    assert resp.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+    assert resp.headers["content-length"] == "100"
+
+async def test_unsatisfiable_range(path):
+    resp, _ = await serve(path, range=f"bytes={len(DATA)}-")
+    assert resp.status_code == 416 and resp.headers["content-range"] == f"bytes */{len(DATA)}"
+
+async def test_multiple_ranges(path):
+    resp, body = await serve(path, range="bytes=0-9,-10")
+    assert resp.status_code == 206
+    boundary = resp.media_type.split("boundary=")[1]
+    assert int(resp.headers["content-length"]) == len(body)
+    parts = body.split(f"--{boundary}".encode())
+    assert parts[-1] == b"--\r\n"
+    assert parts[1].endswith(b"\r\n\r\n" + DATA[:10] + b"\r\n")
+    assert f"Content-Range: bytes {len(DATA) - 10}-{len(DATA) - 1}/{len(DATA)}".encode() in parts[2]
+    assert parts[2].endswith(DATA[-10:] + b"\r\n")
+
+async def test_if_range(path):
+    resp, _ = await serve(path, range="bytes=0-9", if_range=ETAG)
+    assert resp.status_code == 206
+    # a weak or stale validator sends the whole file
+    assert (await serve(path, range="bytes=0-9", if_range='W/"abc"'))[0].status_code == 200
+    assert (await serve(path, range="bytes=0-9", if_range='"old"'))[0].status_code == 200
+    stale = fr._http_date(MODIFIED - timedelta(days=1))
+    assert (await serve(path, range="bytes=0-9", if_range=stale))[0].status_code == 200
+    assert (await serve(path, range="bytes=0-9", if_range=fr._http_date(MODIFIED)))[0].status_code == 206
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app import permissions
+from app.models.models import ProjectFile
+from app.models.models_schedule import ProjectFolder, ProjectFolderClosure, ProjectFolderClosureReady
+from app.routers import files_ext
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = SimpleNamespace(id=1, role_id=1)
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(files_ext, "_CLOSURE_READY", set())
+    monkeypatch.setattr(permissions, "_PERM_CACHE", type(permissions._PERM_CACHE)())
+
+async def mkdir(db, name, parent=None):
+    return (await files_ext.create_folder(7, name=name, parent_id=parent, db=db, u=ADMIN))["id"]
+
+async def closure(db):
+    res = await db.execute(select(ProjectFolderClosure.ancestor_id, ProjectFolderClosure.descendant_id, ProjectFolderClosure.depth))
+    return set(res.all())
+
+async def expected(db):
+    """Closure rows computed from parent_id alone."""
+    res = await db.execute(select(ProjectFolder.id, ProjectFolder.parent_id))
+    parents = dict(res.all())
+    rows = set()
+    for fid in parents:
+        current, depth = fid, 0
+        while current is not None:
+            rows.add((current, fid, depth))
+            current, depth = parents[current], depth + 1
+    return rows
+
+async def paths(db):
+    db.expire_all()
+    res = await db.execute(select(ProjectFolder.id, ProjectFolder.path))
+    return dict(res.all())
+
+async def test_create_and_move_keep_paths_and_closure(db):
+    a = await mkdir(db, "A")
+    b = await mkdir(db, "B", a)
+    c = await mkdir(db, "C", b)
+    d = await mkdir(db, "D")
+    assert await closure(db) == await expected(db)
+    assert (a, c, 2) in await closure(db)
+
+    db.add(ProjectFile(contract_id=7, original_name="f", stored_path="f", folder="A/B/C"))
+    await db.commit()
+    assert await files_ext.rename_or_move_folder(b, name=None, parent_id=d, db=db, u=ADMIN) == {"ok": True, "path": "D/B"}
+    assert await paths(db) == {a: "A", b: "D/B", c: "D/B/C", d: "D"}
+    assert await closure(db) == await expected(db)
+    res = await db.execute(select(ProjectFile.folder))
+    assert res.scalar_one() == "D/B/C"
+
+async def test_moving_under_a_descendant_is_refused(db):
+    a = await mkdir(db, "A")
+    c = await mkdir(db, "C", await mkdir(db, "B", a))
+    with pytest.raises(HTTPException) as e:
+        await files_ext.rename_or_move_folder(a, name=None, parent_id=c, db=db, u=ADMIN)
+    assert e.value.status_code == 400
+
+async def test_rename_treats_like_wildcards_literally(db):
+    x = await mkdir(db, "x_y")
+    await mkdir(db, "sub", x)
+    z = await mkdir(db, "xzy")
+    await mkdir(db, "sub", z)
+    db.add_all([ProjectFile(contract_id=7, original_name="1", stored_path="1", folder="x_y/sub"),
+                ProjectFile(contract_id=7, original_name="2", stored_path="2", folder="xzy/sub")])
+    await db.commit()
+    await files_ext.rename_or_move_folder(x, name="renamed", parent_id=None, db=db, u=ADMIN)
+    assert sorted((await paths(db)).values()) == ["renamed", "renamed/sub", "xzy", "xzy/sub"]
+    res = await db.execute(select(ProjectFile.folder).order_by(ProjectFile.original_name))
+    assert res.scalars().all() == ["renamed/sub", "xzy/sub"]
+
+async def test_missing_closure_rows_are_built_once(db):
+    a = ProjectFolder(contract_id=7, name="A", path="A")
+    db.add(a)
+    await db.flush()
+    b = ProjectFolder(contract_id=7, parent_id=a.id, name="B", path="A/B")
+    db.add(b)
+    await db.commit()
+    await files_ext._ensure_closure(db, 7)
+    assert await closure(db) == {(a.id, a.id, 0), (b.id, b.id, 0), (a.id, b.id, 1)}
+    assert await db.get(ProjectFolderClosureReady, 7) is not None
+    assert 7 in files_ext._CLOSURE_READY
+
+async def test_delete_removes_the_subtree_unless_it_holds_files(db):
+    a = await mkdir(db, "A")
+    b = await mkdir(db, "B", a)
+    keep = await mkdir(db, "K")
+    db.add(ProjectFile(contract_id=7, original_name="f", stored_path="f", folder="A/B"))
+    await db.commit()
+    with pytest.raises(HTTPException) as e:
+        await files_ext.delete_folder(a, db=db, u=ADMIN)
+    assert e.value.status_code == 409
+    pf = (await db.execute(select(ProjectFile))).scalar_one()
+    await db.delete(pf)
+    await db.commit()
+    assert await files_ext.delete_folder(a, db=db, u=ADMIN) == {"ok": True, "deleted": 2}
+    assert list(await paths(db)) == [keep]
+    assert await closure(db) == {(keep, keep, 0)}
+    assert b not in await paths(db)
+
+async def test_folder_paths_fail_closed(db):
+    a = await mkdir(db, "A")
+    assert await permissions.folder_id_from_path(db, 7, "A") == a
+    assert await permissions.folder_id_from_path(db, 7, "") is None
+    with pytest.raises(HTTPException) as e:
+        await permissions.folder_id_from_path(db, 7, "Missing")
+    assert e.value.status_code == 404
+    assert await permissions.folder_id_from_path(db, 7, "Missing", strict=False) is None
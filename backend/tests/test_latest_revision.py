@@ -0,0 +1,62 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from app import storage
+from app.models.models import ProjectFile
+from app.models.models_files import ProjectFileVersion, StorageBlob
+from app.routers import files_ext
+from app.utils import StoredUpload
+
+pytestmark = pytest.mark.anyio
+
+USER = SimpleNamespace(id=3, role_id=2)
+
+def staged(data: bytes) -> StoredUpload:
+    path = storage.temp_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    return StoredUpload(path=path, size=len(data), sha256=hashlib.sha256(data).hexdigest(), content_type="text/plain")
+
+async def upload(db, data: bytes, pf=None):
+    out, _ = await files_ext._store_upload(db, USER, 7, None, pf, "a.txt", "text/plain", staged(data))
+    await db.commit()
+    return out
+
+async def revisions(db, file_id):
+    res = await db.execute(select(ProjectFileVersion.revision_no, ProjectFileVersion.sha256).where(ProjectFileVersion.file_id == file_id).order_by(ProjectFileVersion.revision_no))
+    return res.all()
+
+async def test_upload_and_replace_keep_the_counter(db, files_dir):
+    out = await upload(db, b"one")
+    pf = await db.get(ProjectFile, out["id"])
+    assert out["revision_no"] == 1 and pf.latest_revision_no == 1
+    out = await upload(db, b"two", pf)
+    assert out["revision_no"] == 2 and pf.latest_revision_no == 2
+    assert [r for r, _ in await revisions(db, pf.id)] == [1, 2]
+
+async def test_legacy_file_keeps_its_content_as_revision_one(db, files_dir):
+    old = staged(b"legacy")
+    dest = await files_ext.blobstore.put(db, old.path, old.sha256, old.size, refs=1)
+    pf = ProjectFile(contract_id=7, original_name="a.txt", stored_path=dest, sha256=old.sha256, size_bytes=old.size)
+    db.add(pf)
+    await db.commit()
+    assert pf.latest_revision_no is None
+    out = await upload(db, b"new", pf)
+    assert out["revision_no"] == 2
+    assert await revisions(db, pf.id) == [(1, old.sha256), (2, hashlib.sha256(b"new").hexdigest())]
+    # the version row now holds the reference the file row gave up
+    blob = await db.get(StorageBlob, old.sha256)
+    assert blob.ref_count == 1 and blob.unreferenced_at is None
+
+async def test_file_items_resolve_missing_counters_in_one_query(db, files_dir):
+    files = [ProjectFile(contract_id=7, original_name=n, stored_path=n, size_bytes=1, latest_revision_no=rev)
+             for n, rev in [("backfilled", 4), ("versions", None), ("bare", None)]]
+    db.add_all(files)
+    await db.flush()
+    db.add_all([ProjectFileVersion(file_id=files[1].id, revision_no=r, stored_path="v", size_bytes=1) for r in (1, 2, 3)])
+    await db.commit()
+    items = {i["name"]: i["revision_no"] for i in await files_ext._file_items(db, files)}
+    assert items == {"backfilled": 4, "versions": 3, "bare": 1}
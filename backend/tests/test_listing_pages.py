@@ -0,0 +1,80 @@
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.models import ProjectFile
+from app.routers import files_ext
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = SimpleNamespace(id=1, role_id=1)
+T0 = datetime(2026, 1, 1)
+
+@pytest.fixture
+async def listing(db):
+    rng = random.Random(7)
+    rows = []
+    for i in range(30):
+        rows.append(ProjectFile(contract_id=7, original_name=f"f{rng.randint(0, 9)}.txt", stored_path=str(i),
+                                size_bytes=rng.choice([0, 10, 20, 30]), latest_revision_no=rng.choice([None, 1, 2, 3]),
+                                uploaded_at=rng.choice([None, T0, T0 + timedelta(days=1), T0 + timedelta(days=2)])))
+    # outside the listing: another folder, another project, deleted
+    rows += [ProjectFile(contract_id=7, original_name="a", stored_path="x", folder="A"),
+             ProjectFile(contract_id=8, original_name="a", stored_path="y"),
+             ProjectFile(contract_id=7, original_name="a", stored_path="z", deleted_at=T0)]
+    db.add_all(rows)
+    await db.commit()
+    return rows[:30]
+
+def expected(files, sort, order):
+    key = {"name": lambda f: f.original_name, "size": lambda f: f.size_bytes, "uploaded_at": lambda f: f.uploaded_at,
+           "revision": lambda f: f.latest_revision_no or 1}[sort]
+    keyed = sorted((f for f in files if key(f) is not None), key=lambda f: (key(f), f.id), reverse=order == "desc")
+    nulls = sorted((f.id for f in files if key(f) is None), reverse=order == "desc")
+    ids = [f.id for f in keyed]
+    return ids + nulls if order == "asc" else nulls + ids
+
+async def pages(db, sort, order, limit):
+    ids, cursor, calls = [], None, 0
+    while True:
+        page = await files_ext.list_file_items_page(7, folder=None, sort=sort, order=order, limit=limit, cursor=cursor, db=db, u=ADMIN)
+        ids += [i["id"] for i in page["items"]]
+        calls += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, calls
+
+@pytest.mark.parametrize("sort", ["name", "size", "uploaded_at", "revision"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("limit", [1, 4, 30])
+async def test_pages_cover_the_folder_in_order(db, listing, sort, order, limit):
+    ids, calls = await pages(db, sort, order, limit)
+    assert ids == expected(listing, sort, order)
+    assert calls == -(-len(listing) // limit)
+
+def test_cursor_round_trip():
+    cursor = files_ext._encode_cursor("uploaded_at", T0, 5)
+    assert "=" not in cursor
+    assert files_ext._decode_cursor(cursor, "uploaded_at") == (T0, 5)
+    assert files_ext._decode_cursor(files_ext._encode_cursor("uploaded_at", None, 5), "uploaded_at") == (None, 5)
+
+@pytest.mark.parametrize("cursor, sort", [
+    ("not base64!", "name"),
+    (files_ext._encode_cursor("size", 10, 1), "name"),
+    (files_ext._encode_cursor("size", "10", 1), "size"),
+    (files_ext._encode_cursor("name", 3, 1), "name"),
+    (files_ext._encode_cursor("name", "a", "1"), "name"),
+])
+def test_bad_cursors_are_refused(cursor, sort):
+    with pytest.raises(HTTPException) as e:
+        files_ext._decode_cursor(cursor, sort)
+    assert e.value.status_code == 400
+
+async def test_null_cursor_only_for_nullable_sorts(db, listing):
+    with pytest.raises(HTTPException) as e:
+        await files_ext.list_file_items_page(7, folder=None, sort="size", order="asc", limit=5,
+                                             cursor=files_ext._encode_cursor("size", None, 1), db=db, u=ADMIN)
+    assert e.value.status_code == 400
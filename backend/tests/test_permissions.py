@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import permissions
+from app.usage import ROOT_FOLDER
+
+# folder tree: 1 -> 2 -> 3, 1 -> 4, 5 at the root
+PARENTS = {1: None, 2: 1, 3: 2, 4: 1, 5: None}
+
+class Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def scalar_one_or_none(self):
+        return self._rows[0][0] if self._rows else None
+
+    def all(self):
+        return self._rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+class ScriptedDB:
+    """Answers perm_matrix's queries in order: stamp, the user's rows, (any row), folders."""
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.queries = 0
+
+    async def execute(self, q):
+        self.queries += 1
+        return Result(self.answers.pop(0))
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(permissions, "_PERM_CACHE", type(permissions._PERM_CACHE)())
+
+def test_inherits_from_the_nearest_explicit_ancestor():
+    m = permissions.FolderPermMatrix(True, PARENTS, {None: (True, False), 2: (True, True), 4: (False, False)})
+    assert m.get(None) == (True, False)
+    assert m.get(1) == (True, False)
+    assert m.get(2) == m.get(3) == (True, True)
+    assert m.get(4) == (False, False)
+    assert m.get(5) == (True, False)
+
+def test_no_root_entry_denies():
+    m = permissions.FolderPermMatrix(True, PARENTS, {2: (True, False)})
+    assert m.get(None) == (False, False)
+    assert m.get(1) == (False, False)
+    assert m.get(3) == (True, False)
+
+def test_unknown_folder_uses_its_entry_or_the_root():
+    m = permissions.FolderPermMatrix(True, PARENTS, {None: (True, False), 99: (True, True)})
+    assert m.get(99) == (True, True)
+    assert m.get(100) == (True, False)
+
+def test_cycle_falls_back_to_root():
+    m = permissions.FolderPermMatrix(True, {1: 2, 2: 1, 3: 1}, {None: (True, False)})
+    assert m.get(1) == m.get(2) == m.get(3) == (True, False)
+
+def test_disabled_allows_everything():
+    assert permissions.ALLOW_ALL.get(None) == (True, True)
+    assert permissions.ALLOW_ALL.get(42) == (True, True)
+
+def test_readable():
+    m = permissions.FolderPermMatrix(True, PARENTS, {None: (True, False), 1: (False, False), 3: (True, False)})
+    assert sorted(m.readable()) == sorted([3, 5, ROOT_FOLDER])
+    m = permissions.FolderPermMatrix(True, PARENTS, {2: (True, False)})
+    assert sorted(m.readable()) == [2, 3]
+
+def test_admin_bypasses_without_queries():
+    db = ScriptedDB()
+    admin = SimpleNamespace(id=1, role_id=1)
+    assert asyncio.run(permissions.user_matrix(db, 7, admin)) is permissions.ALLOW_ALL
+    assert db.queries == 0
+
+def test_matrix_is_reused_until_the_stamp_changes():
+    user = SimpleNamespace(id=5, role_id=2)
+    rows = [(None, True, False), (2, True, True)]
+    folders = list(PARENTS.items())
+    first = asyncio.run(permissions.perm_matrix(ScriptedDB([(3,)], rows, folders), 7, user))
+    assert first.get(3) == (True, True)
+    db = ScriptedDB([(3,)])
+    assert asyncio.run(permissions.perm_matrix(db, 7, user)) is first
+    assert db.queries == 1
+    db = ScriptedDB([(4,)], [(None, True, False)], folders)
+    second = asyncio.run(permissions.perm_matrix(db, 7, user))
+    assert second is not first and second.get(3) == (True, False)
+
+def test_project_without_rows_is_open_to_members():
+    user = SimpleNamespace(id=5, role_id=2)
+    m = asyncio.run(permissions.perm_matrix(ScriptedDB([], [], []), 7, user))
+    assert not m.enabled and m.get(3) == (True, True)
+
+def test_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(permissions, "_CACHE_CONTRACTS", 2)
+    monkeypatch.setattr(permissions, "_CACHE_USERS", 2)
+    entry = (1, permissions.ALLOW_ALL)
+    permissions._cache_put(1, 1, entry)
+    permissions._cache_put(2, 1, entry)
+    assert permissions._cache_get(1, 1) == entry  # contract 1 is now the most recent
+    permissions._cache_put(3, 1, entry)
+    assert permissions._cache_get(2, 1) is None
+    assert permissions._cache_get(1, 1) == entry
+    permissions._cache_put(1, 2, entry)
+    permissions._cache_get(1, 1)
+    permissions._cache_put(1, 3, entry)
+    assert permissions._cache_get(1, 2) is None
+    assert permissions._cache_get(1, 1) == entry and permissions._cache_get(1, 3) == entry
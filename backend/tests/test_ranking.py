@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from app import ranking
+
+def test_between_orders_strictly():
+    assert ranking.between(None, None)
+    for a, b in [("V", "W"), ("V", "V1"), ("z", "z1"), ("0V", "1"), ("A", "B0V")]:
+        k = ranking.between(a, b)
+        assert a < k < b
+        assert not k.endswith("0")
+
+def test_between_rejects_inverted_neighbours():
+    with pytest.raises(ValueError):
+        ranking.between("W", "V")
+    with pytest.raises(ValueError):
+        ranking.between("V", "V")
+
+def test_first_and_last():
+    assert ranking.first("V") < "V"
+    assert ranking.last("V") > "V"
+
+def test_appends_stay_short():
+    key, keys = None, []
+    for _ in range(2000):
+        key = ranking.last(key)
+        keys.append(key)
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    assert max(map(len, keys)) <= 40
+
+def test_repeated_inserts_at_one_spot():
+    lo, hi = "V", "W"
+    for _ in range(200):
+        k = ranking.between(lo, hi)
+        assert lo < k < hi
+        hi = k
+
+def test_spread():
+    assert ranking.spread(0) == []
+    for n in (1, 5, 61, 62, 500):
+        keys = ranking.spread(n)
+        assert len(keys) == n
+        assert keys == sorted(keys) and len(set(keys)) == n
+        assert not any(k.endswith("0") for k in keys)
+
+def test_append_batch():
+    for before in (None, "V", "zz", "zzk3"):
+        keys = ranking.append(before, 100)
+        assert keys == sorted(keys) and len(set(keys)) == 100
+        if before is not None:
+            assert keys[0] > before
+
+def test_place_matches_list_order():
+    rng = random.Random(7)
+    keys = []
+    for _ in range(300):
+        idx = rng.randint(0, len(keys))
+        keys.insert(idx, ranking.place(keys, idx))
+        assert keys == sorted(keys)
+
+def test_apply_moves_changes_only_moved_rows():
+    groups = {"todo": [[1, "F"], [2, "V"], [3, "k"]], "done": [[4, "V"]]}
+    changed = ranking.apply_moves(groups, [(3, "todo", None, 1), (2, "done", 4, None)])
+    assert set(changed) == {2, 3}
+    assert [r[0] for r in groups["todo"]] == [3, 1]
+    assert [r[0] for r in groups["done"]] == [4, 2]
+    for rows in groups.values():
+        keys = [r[1] for r in rows]
+        assert keys == sorted(keys)
+
+def test_apply_moves_respaces_unranked_group():
+    groups = {None: [[1, None], [2, None], [3, "V"]]}
+    changed = ranking.apply_moves(groups, [(3, None, None, 1)])
+    assert set(changed) == {1, 2, 3}
+    keys = [r[1] for r in groups[None]]
+    assert [r[0] for r in groups[None]] == [3, 1, 2]
+    assert keys == sorted(keys) and None not in keys
+
+def test_front_inserts_respace_before_keys_get_long():
+    groups = {None: [[i, k] for i, k in enumerate(ranking.spread(3), start=1)]}
+    for _ in range(1000):
+        last_id = groups[None][-1][0]
+        ranking.apply_moves(groups, [(last_id, None, None, groups[None][0][0])])
+        keys = [r[1] for r in groups[None]]
+        assert keys == sorted(keys) and len(set(keys)) == len(keys)
+        assert max(map(len, keys)) <= ranking.REBALANCE_LENGTH
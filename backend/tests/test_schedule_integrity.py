@@ -0,0 +1,35 @@
+from app.schedule_integrity import HealReport, find_problems
+
+def test_clean_tree():
+    report = HealReport(1)
+    assert find_problems({1: None, 2: 1, 3: 2, 4: None}, report) == {}
+    assert not report.self_parents and not report.dangling and not report.cycles
+
+def test_self_parent():
+    report = HealReport(1)
+    assert find_problems({1: None, 2: 2, 3: 2}, report) == {2: "self_parent"}
+    assert report.self_parents == [2]
+
+def test_dangling_parent():
+    report = HealReport(1)
+    assert find_problems({1: None, 2: 99, 3: 2}, report) == {2: "dangling_parent"}
+    assert report.dangling == [2]
+
+def test_cycle_broken_at_lowest_id():
+    report = HealReport(1)
+    fix = find_problems({1: None, 5: 7, 6: 5, 7: 6, 8: 7}, report)
+    assert fix == {5: "cycle"}
+    assert len(report.cycles) == 1 and sorted(report.cycles[0]) == [5, 6, 7]
+
+def test_separate_cycles_and_tails():
+    report = HealReport(1)
+    parents = {1: 2, 2: 1, 3: 4, 4: 3, 10: 1, 11: 10}
+    assert find_problems(parents, report) == {1: "cycle", 3: "cycle"}
+    assert len(report.cycles) == 2
+
+def test_large_chain():
+    n = 100_000
+    parents = {i: i - 1 if i > 1 else None for i in range(1, n + 1)}
+    assert find_problems(parents, HealReport(1)) == {}
+    parents[1] = n
+    assert find_problems(parents, HealReport(1)) == {1: "cycle"}
@@ -0,0 +1,79 @@
+import asyncio, os, time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import blobstore, scrubber
+from app.models.models import ProjectFile
+from app.models.models_files import UploadSession
+
+pytestmark = pytest.mark.anyio
+
+OLD = time.time() - 3 * 3600
+
+def put(path, data=b"x", mtime=OLD):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+    return path
+
+@pytest.fixture
+def tree(db, files_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(scrubber, "SessionLocal", lambda: AsyncSession(db.bind, expire_on_commit=False))
+    monkeypatch.setattr(scrubber, "_ticket_upload_dir", lambda: str(tmp_path / "tickets"))
+    j = lambda *p: os.path.join(files_dir, *p)
+    return {
+        "blob": put(blobstore.blob_path("0" * 64), b"not the hashed content"),
+        "orphan": put(j("projects", "7", "old.pdf")),
+        "young": put(j("projects", "7", "new.pdf"), mtime=time.time()),
+        "thumb": put(j("thumbs", "ab", "x.jpg")),
+        "index": put(j("search.sqlite")),
+        "live_chunk": put(j("tmp", "sessions", "live", "0-a")),
+        "dead_chunk": put(j("tmp", "sessions", "dead", "0-a")),
+        "ticket": put(str(tmp_path / "tickets" / "boq.xlsx")),
+    }
+
+async def seed(db, tree, files_dir):
+    db.add(ProjectFile(contract_id=7, original_name="a", stored_path=tree["blob"]))
+    db.add(ProjectFile(contract_id=7, original_name="b", stored_path=os.path.join(files_dir, "projects", "7", "lost.pdf")))
+    db.add(UploadSession(id="live", contract_id=7, user_id=1, filename="f", total_size=1, expires_at=datetime.utcnow() + timedelta(hours=1)))
+    await db.commit()
+
+async def test_report_lists_orphans_and_missing_files(db, files_dir, tree):
+    await seed(db, tree, files_dir)
+    report = await scrubber.scrub("report", verify_checksums=True)
+    assert sorted(report.orphans) == sorted([tree["orphan"], tree["dead_chunk"], tree["ticket"]])
+    assert report.orphan_files == 3 and report.orphan_bytes == 3
+    assert report.missing_files == 1 and report.missing[0].endswith("lost.pdf")
+    assert report.checksum_mismatches == [tree["blob"]]
+    assert report.quarantined == report.removed == 0
+    assert all(os.path.exists(p) for p in tree.values())
+
+async def test_quarantine_moves_orphans_aside(db, files_dir, tree):
+    await seed(db, tree, files_dir)
+    report = await scrubber.scrub("quarantine")
+    assert report.quarantined == 3 and not report.errors
+    stamp = report.started_at.strftime("%Y%m%d-%H%M%S")
+    assert os.path.exists(os.path.join(files_dir, "quarantine", stamp, "projects", "7", "old.pdf"))
+    assert not os.path.exists(tree["orphan"]) and os.path.exists(tree["young"]) and os.path.exists(tree["live_chunk"])
+
+async def test_delete_removes_orphans(db, files_dir, tree):
+    await seed(db, tree, files_dir)
+    report = await scrubber.scrub("delete")
+    assert report.removed == 3
+    assert not os.path.exists(tree["dead_chunk"]) and not os.path.exists(tree["ticket"])
+    assert os.path.exists(tree["blob"]) and os.path.exists(tree["thumb"]) and os.path.exists(tree["index"])
+
+def test_quarantine_target(files_dir):
+    assert scrubber._quarantine_target(os.path.join(files_dir, "a", "b.pdf"), "s") == os.path.join(files_dir, "quarantine", "s", "a", "b.pdf")
+    assert scrubber._quarantine_target("/srv/tickets/c.xlsx", "s") == os.path.join(files_dir, "quarantine", "s", "srv", "tickets", "c.xlsx")
+
+async def test_walk_skips_top_level_dirs_only(tmp_path):
+    put(str(tmp_path / "thumbs" / "a"))
+    put(str(tmp_path / "x" / "thumbs" / "b"))
+    put(str(tmp_path / "c"))
+    found = await scrubber._walk(str(tmp_path), asyncio.Semaphore(2), {"thumbs"})
+    assert sorted(os.path.relpath(p, tmp_path) for p, _, _ in found) == ["c", os.path.join("x", "thumbs", "b")]
+    assert await scrubber._walk(str(tmp_path / "missing"), asyncio.Semaphore(2), set()) == []
@@ -0,0 +1,85 @@
+import threading, zipfile
+
+import pytest
+
+from app import search_index
+from app.search_index import UNKNOWN_FOLDER
+from app.usage import ROOT_FOLDER
+
+@pytest.fixture
+def index(files_dir, monkeypatch):
+    monkeypatch.setattr(search_index, "_local", threading.local())
+    yield search_index
+    conn = getattr(search_index._local, "conn", None)
+    if conn is not None:
+        conn.close()
+
+def write(tmp_path, name, text):
+    p = tmp_path / name
+    p.write_text(text)
+    return str(p)
+
+def doc(key, kind, contract_id, folder_id, path, title="doc.txt", sha256=None, file_id=1):
+    return {"key": key, "kind": kind, "contract_id": contract_id, "file_id": file_id, "revision_no": 1,
+            "sha256": sha256 or key, "title": title, "path": path, "content_type": "text/plain", "folder_id": folder_id}
+
+def keys(hits):
+    return sorted(h["key"] for h in hits)
+
+def test_extract_text(tmp_path):
+    assert search_index.extract_text(write(tmp_path, "a.txt", "plain words"), "a.txt", None) == "plain words"
+    assert search_index.extract_text(write(tmp_path, "a.xml", "<a>beam</a><b>column</b>"), "a.xml", None).split() == ["beam", "column"]
+    docx = tmp_path / "a.docx"
+    with zipfile.ZipFile(docx, "w") as zf:
+        zf.writestr("word/document.xml", "<w:p><w:t>slab</w:t></w:p>")
+        zf.writestr("word/styles.xml", "<w:style>ignored</w:style>")
+    assert search_index.extract_text(str(docx), "a.docx", None).split() == ["slab"]
+    assert search_index.extract_text(write(tmp_path, "bad.docx", "not a zip"), "bad.docx", None) == ""
+    assert search_index.extract_text(write(tmp_path, "a.bin", "x"), "a.bin", "application/octet-stream") == ""
+
+@pytest.mark.skipif(search_index.fitz is None, reason="PyMuPDF not installed")
+def test_extract_pdf_text(tmp_path):
+    path = str(tmp_path / "a.pdf")
+    with search_index.fitz.open() as pdf:
+        pdf.new_page().insert_text((72, 72), "foundation drawing")
+        pdf.save(path)
+    assert search_index.extract_text(path, "a.pdf", None).split() == ["foundation", "drawing"]
+
+def test_fts_query():
+    assert search_index.fts_query("steel beam") == '"steel" "beam"*'
+    assert search_index.fts_query('"quoted" OR') == '"quoted" "OR"*'
+    assert search_index.fts_query("  -- ") is None
+
+def test_search_applies_the_scope_in_the_query(index, tmp_path):
+    path = write(tmp_path, "a.txt", "reinforced concrete")
+    index.index_document(doc("pf:1", "file", 7, ROOT_FOLDER, path))
+    index.index_document(doc("pf:2", "file", 7, 11, path, sha256="s2"))
+    index.index_document(doc("pf:3", "file", 7, UNKNOWN_FOLDER, path, sha256="s3"))
+    index.index_document(doc("pf:4", "file", 8, 12, path, sha256="s4"))
+    index.index_document(doc("lib:1", "library", None, UNKNOWN_FOLDER, path, sha256="s5"))
+    kinds = ("file", "library")
+    assert keys(index.search("concr", None, kinds, 10)) == ["lib:1", "pf:1", "pf:2", "pf:3", "pf:4"]
+    assert keys(index.search("concrete", {7: None}, kinds, 10)) == ["lib:1", "pf:1", "pf:2", "pf:3"]
+    assert keys(index.search("concrete", {7: [11], 8: [ROOT_FOLDER]}, kinds, 10)) == ["lib:1", "pf:2"]
+    assert keys(index.search("concrete", {7: [ROOT_FOLDER, 11], 8: [12]}, ("file",), 10)) == ["pf:1", "pf:2", "pf:4"]
+    assert keys(index.search("concrete", {}, kinds, 10)) == ["lib:1"]
+    assert index.search("timber", None, kinds, 10) == []
+    hit = index.search("reinforced", {7: None}, ("file",), 1)[0]
+    assert "<mark>reinforced</mark>" in hit["snippet"]
+
+def test_identical_content_is_extracted_once(index, tmp_path):
+    path = write(tmp_path, "a.txt", "precast stairs")
+    index.index_document(doc("pf:1", "file", 7, ROOT_FOLDER, path, sha256="same"))
+    index.index_document(doc("pf:2", "file", 7, ROOT_FOLDER, str(tmp_path / "gone.txt"), sha256="same", file_id=2))
+    assert keys(index.search("stairs", None, ("file",), 10)) == ["pf:1", "pf:2"]
+
+def test_moving_a_file_moves_its_revisions(index, tmp_path):
+    path = write(tmp_path, "a.txt", "facade panel")
+    index.index_document(doc("pfv:5", "revision", 7, 11, path, sha256="v1"))
+    index.index_document(doc("pf:1", "file", 7, 11, path, sha256="v1"))
+    assert keys(index.search("facade", {7: [11]}, ("revision",), 10)) == ["pfv:5"]
+    index.index_document(doc("pf:1", "file", 7, 12, path, sha256="v1"))
+    assert index.search("facade", {7: [11]}, ("file", "revision"), 10) == []
+    assert keys(index.search("facade", {7: [12]}, ("file", "revision"), 10)) == ["pf:1", "pfv:5"]
+    index.remove_documents(["pf:1", "pfv:5"])
+    assert index.search("facade", None, ("file", "revision"), 10) == []
@@ -0,0 +1,105 @@
+import io, os
+from collections import defaultdict
+from types import SimpleNamespace
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pytest
+from fastapi import HTTPException, Request, UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import Headers
+
+from app.config import config
+from app.file_responses import SendfileResponse
+from app.models.models import FileDownloadLog, FileShare
+from app.routers import shares
+
+pytestmark = pytest.mark.anyio
+
+OWNER = SimpleNamespace(id=4, role_id=2)
+
+@pytest.fixture(autouse=True)
+def buffers(monkeypatch):
+    monkeypatch.setattr(shares, "_hits", defaultdict(int))
+    monkeypatch.setattr(shares, "_last_hit", {})
+    monkeypatch.setattr(shares, "_log_rows", [])
+    monkeypatch.setattr(config.storage, "share_secret", "test-secret")
+    monkeypatch.setattr(config.storage, "share_offload", "sendfile")
+
+def request() -> Request:
+    return Request({"type": "http", "method": "GET", "headers": [], "client": ("10.0.0.9", 5000)})
+
+def link_args(url: str) -> dict:
+    parts = urlsplit(url)
+    _, share_id, stored_name = parts.path.rsplit("/", 2)
+    q = {k: v[0] for k, v in parse_qs(parts.query).items()}
+    return {"share_id": int(share_id), "stored_name": unquote(stored_name), "e": int(q["e"]), "n": q["n"], "sig": q["sig"]}
+
+async def share(db, name="Plan é.pdf", data=b"%PDF shared"):
+    upload = UploadFile(io.BytesIO(data), filename=name, headers=Headers({"content-type": "application/pdf"}))
+    return await shares.create_share(upload, db=db, u=OWNER)
+
+async def test_signed_link_serves_without_the_db(db, files_dir):
+    out = await share(db)
+    args = link_args(out["url"])
+    assert args["n"] == "Plan é.pdf" and args["stored_name"].endswith(".pdf")
+    resp = await shares.signed_download(request=request(), **args)
+    assert isinstance(resp, SendfileResponse) and resp.size == len(b"%PDF shared")
+    assert resp.path == os.path.abspath(os.path.join(files_dir, "shares", args["stored_name"]))
+    assert "filename*=UTF-8''Plan%20%C3%A9.pdf" in resp.headers["content-disposition"]
+    assert dict(shares._hits) == {out["id"]: 1} and shares._log_rows[0]["ip_address"] == "10.0.0.9"
+
+@pytest.mark.parametrize("field, value, status", [
+    ("n", "other.pdf", 403),
+    ("share_id", 999, 403),
+    ("sig", "0" * 64, 403),
+    ("e", 1, 410),
+])
+async def test_tampered_or_expired_links_are_refused(db, files_dir, field, value, status):
+    args = link_args((await share(db))["url"])
+    args[field] = value
+    with pytest.raises(HTTPException) as e:
+        await shares.signed_download(request=request(), **args)
+    assert e.value.status_code == status
+    assert not shares._hits
+
+async def test_rotating_the_secret_revokes_links(db, files_dir, monkeypatch):
+    args = link_args((await share(db))["url"])
+    monkeypatch.setattr(config.storage, "share_secret", "rotated")
+    with pytest.raises(HTTPException) as e:
+        await shares.signed_download(request=request(), **args)
+    assert e.value.status_code == 403
+
+async def test_deleting_the_share_revokes_links(db, files_dir):
+    out = await share(db)
+    args = link_args(out["url"])
+    assert await shares.delete_share(out["id"], db=db, u=OWNER) == {"ok": True}
+    with pytest.raises(HTTPException) as e:
+        await shares.signed_download(request=request(), **args)
+    assert e.value.status_code == 404
+
+async def test_signed_names_stay_inside_the_share_dir(files_dir):
+    sig = shares._sign(1, "../secret.txt", "a.txt", 2**40)
+    with pytest.raises(HTTPException) as e:
+        await shares.signed_download(1, "../secret.txt", request(), e=2**40, n="a.txt", sig=sig)
+    assert e.value.status_code == 404
+
+async def test_accel_offload_hands_the_file_to_nginx(db, files_dir, monkeypatch):
+    monkeypatch.setattr(config.storage, "share_offload", "accel")
+    args = link_args((await share(db))["url"])
+    resp = await shares.signed_download(request=request(), **args)
+    assert resp.headers["x-accel-redirect"] == f"/_protected/shares/{args['stored_name']}"
+    assert resp.body == b""
+
+async def test_hits_are_flushed_in_batches(db, files_dir, monkeypatch):
+    monkeypatch.setattr(shares, "SessionLocal", lambda: AsyncSession(db.bind, expire_on_commit=False))
+    out = await share(db)
+    args = link_args(out["url"])
+    for _ in range(3):
+        await shares.signed_download(request=request(), **args)
+    await shares.flush_downloads()
+    assert not shares._hits and not shares._log_rows
+    row = await db.get(FileShare, out["id"], populate_existing=True)
+    assert row.downloads == 3 and row.last_download_at is not None
+    logs = (await db.execute(select(FileDownloadLog.file_id))).scalars().all()
+    assert logs == [out["id"]] * 3
@@ -0,0 +1,125 @@
+import hashlib, io, os
+
+import pytest
+
+from app import blobstore, storage
+from app.config import config
+
+pytestmark = pytest.mark.anyio
+
+needs_boto3 = pytest.mark.skipif(storage.boto3 is None, reason="boto3 not installed")
+
+class FakeS3:
+    """The slice of the boto3 client S3Backend uses, over a dict."""
+    def __init__(self):
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.ranges: list[str] = []
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None, Config=None):
+        with open(path, "rb") as f:
+            self.objects[bucket, key] = f.read()
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise storage.ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Bucket, Key]
+        if Range:
+            self.ranges.append(Range)
+            start, end = map(int, Range.removeprefix("bytes=").split("-"))
+            data = data[start:end + 1]
+        return {"Body": io.BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def download_file(self, bucket, key, path, Config=None):
+        with open(path, "wb") as f:
+            f.write(self.objects[bucket, key])
+
+    def generate_presigned_url(self, op, Params, ExpiresIn):
+        return f"https://s3.example/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+@pytest.fixture
+def s3(files_dir, monkeypatch):
+    monkeypatch.setattr(config.s3, "bucket", "files")
+    monkeypatch.setattr(config.s3, "prefix", "/intranet/")
+    backend = storage.S3Backend()
+    backend.client = FakeS3()
+    monkeypatch.setattr(storage, "_s3", backend)
+    monkeypatch.setattr(config.storage, "backend", "s3")
+    return backend
+
+def staged(data: bytes) -> str:
+    path = storage.temp_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+async def read_all(reader, start, length):
+    return b"".join([c async for c in reader(start, length)])
+
+def test_incomplete_backends_cannot_be_instantiated():
+    class Partial(storage.StorageBackend):
+        def locator(self, key, local_path=None):
+            return key
+
+    with pytest.raises(TypeError):
+        Partial()
+
+async def test_local_backend(files_dir):
+    assert storage.default() is storage._local
+    loc = storage.locator("shares/a.pdf")
+    assert loc == os.path.join(files_dir, "shares", "a.pdf") and not storage.is_remote(loc)
+    assert storage.locator("x", local_path="/elsewhere/x") == "/elsewhere/x"
+    tmp = staged(b"0123456789")
+    assert await storage.put(tmp, loc) == loc
+    assert not os.path.exists(tmp) and await storage.exists(loc) and storage.exists_sync(loc)
+    with storage.open_stream(loc) as f:
+        assert f.read() == b"0123456789"
+    assert await read_all(storage.reader(loc), 3, 4) == b"3456"
+    with storage.local_copy(loc) as local:
+        assert local == loc
+    assert storage.presigned_url(loc) is None
+    await storage.delete(loc)
+    await storage.delete(loc)
+    assert not await storage.exists(loc)
+
+@needs_boto3
+async def test_s3_backend(s3):
+    loc = storage.locator("shares/a.pdf")
+    assert loc == "s3://files/intranet/shares/a.pdf" and storage.is_remote(loc)
+    assert storage.backend_for(loc) is s3 and storage.backend_for("/srv/a.pdf") is storage._local
+    tmp = staged(b"0123456789")
+    await storage.put(tmp, loc, "application/pdf")
+    assert not os.path.exists(tmp)
+    assert s3.client.objects["files", "intranet/shares/a.pdf"] == b"0123456789"
+    assert await storage.exists(loc) and not await storage.exists("s3://files/intranet/missing")
+    assert await read_all(storage.reader(loc), 3, 4) == b"3456" and s3.client.ranges == ["bytes=3-6"]
+    with storage.open_stream(loc) as f:
+        assert f.read() == b"0123456789"
+    with storage.local_copy(loc) as local:
+        with open(local, "rb") as f:
+            assert f.read() == b"0123456789"
+    assert not os.path.exists(local)
+    assert storage.presigned_url(loc, "a.pdf", 60) == "https://s3.example/files/intranet/shares/a.pdf?expires=60"
+    await storage.delete(loc)
+    assert not storage.exists_sync(loc)
+
+@needs_boto3
+async def test_blobs_follow_the_configured_backend(db, s3):
+    data = b"remote blob"
+    sha = hashlib.sha256(data).hexdigest()
+    dest = await blobstore.put(db, staged(data), sha, len(data))
+    assert dest == f"s3://files/intranet/{blobstore.blob_key(sha)}"
+    assert blobstore.locate(dest) == (dest, None) and blobstore.exists(dest)
+    with blobstore.open_blob(dest) as f:
+        assert f.read() == data
+    # rows stored before the switch keep reading from local disk
+    local = os.path.join(config.storage.files_dir, "old.bin")
+    with open(local, "wb") as f:
+        f.write(b"old")
+    with blobstore.open_blob(local) as f:
+        assert f.read() == b"old"
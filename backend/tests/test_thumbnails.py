@@ -0,0 +1,68 @@
+import hashlib, os
+from types import SimpleNamespace
+
+import pytest
+
+from app import search_index, storage, thumbnails
+from app.routers import files_ext
+from app.utils import StoredUpload
+
+needs_pillow = pytest.mark.skipif(thumbnails.Image is None, reason="Pillow not installed")
+
+@pytest.fixture
+def queued(monkeypatch):
+    items = []
+    monkeypatch.setattr(thumbnails, "_queue", SimpleNamespace(submit=lambda item: items.append(item) or True))
+    return items
+
+def test_can_preview():
+    assert not thumbnails.can_preview("application/zip")
+    assert not thumbnails.can_preview(None)
+    assert thumbnails.can_preview("image/png") == (thumbnails.Image is not None)
+    assert thumbnails.can_preview("application/pdf") == (thumbnails.Image is not None and thumbnails.fitz is not None)
+
+@needs_pillow
+def test_enqueue_skips_what_cannot_be_previewed(queued):
+    assert not thumbnails.enqueue("a.zip", "ab" * 32, "application/zip")
+    assert not thumbnails.enqueue("a.png", None, "image/png")
+    assert thumbnails.enqueue("a.png", "ab" * 32, "image/png")
+    assert queued == [("a.png", "ab" * 32, "image/png")]
+
+@needs_pillow
+def test_render_writes_every_size_once(files_dir, tmp_path):
+    src = tmp_path / "photo.png"
+    thumbnails.Image.new("RGB", (2000, 1000), "red").save(src)
+    sha = "cd" * 32
+    thumbnails.render(str(src), sha, "image/png")
+    for size in thumbnails.SIZES:
+        with thumbnails.Image.open(thumbnails.thumb_path(sha, size)) as img:
+            assert img.format == "JPEG" and img.size == (size, size // 2)
+    stamp = os.path.getmtime(thumbnails.thumb_path(sha, thumbnails.SIZES[0]))
+    os.remove(src)  # not read again: every size exists
+    thumbnails.render(str(src), sha, "image/png")
+    assert os.path.getmtime(thumbnails.thumb_path(sha, thumbnails.SIZES[0])) == stamp
+
+@pytest.mark.skipif(thumbnails.fitz is None or thumbnails.Image is None, reason="PyMuPDF or Pillow not installed")
+def test_render_first_pdf_page(files_dir, tmp_path):
+    src = tmp_path / "plan.pdf"
+    with thumbnails.fitz.open() as doc:
+        doc.new_page(width=595, height=842)
+        doc.save(src)
+    thumbnails.render(str(src), "ef" * 32, "application/pdf")
+    with thumbnails.Image.open(thumbnails.thumb_path("ef" * 32, max(thumbnails.SIZES))) as img:
+        assert img.size[1] == max(thumbnails.SIZES)
+
+@needs_pillow
+@pytest.mark.anyio
+async def test_previews_are_queued_only_when_published(db, files_dir, queued, monkeypatch):
+    monkeypatch.setattr(search_index, "enqueue", lambda doc: True)
+    data = b"\x89PNG not really"
+    path = storage.temp_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    stored = StoredUpload(path=path, size=len(data), sha256=hashlib.sha256(data).hexdigest(), content_type="image/png")
+    _, publish = await files_ext._store_upload(db, SimpleNamespace(id=1), 7, None, None, "a.png", "image/png", stored)
+    assert queued == []
+    await db.commit()
+    publish()
+    assert queued == [(files_ext.blobstore.blob_path(stored.sha256), stored.sha256, "image/png")]
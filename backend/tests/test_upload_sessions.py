@@ -0,0 +1,97 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, Request
+from sqlalchemy import select
+
+from app import storage
+from app.models.models import ProjectFile
+from app.models.models_files import UploadSession, UploadSessionChunk
+from app.routers import files_ext
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = SimpleNamespace(id=1, role_id=1)
+DATA = os.urandom(100_000)
+
+def body(data: bytes) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": data, "more_body": False}
+    return Request({"type": "http", "method": "PUT", "headers": []}, receive)
+
+@pytest.fixture(autouse=True)
+def no_publish(monkeypatch):
+    monkeypatch.setattr(files_ext, "_publish_upload", lambda *a: None)
+
+async def start(db, size=len(DATA)):
+    out = await files_ext.create_upload_session(7, filename="model.ifc", size=size, content_type=None, folder=None,
+                                                replace_file_id=None, db=db, u=ADMIN)
+    return out["id"]
+
+async def put(db, sid, start, end):
+    return await files_ext.put_upload_chunk(sid, body(DATA[start:end]), offset=start, db=db, u=ADMIN)
+
+async def chunk_paths(db, sid):
+    return (await db.execute(select(UploadSessionChunk.stored_path).where(UploadSessionChunk.session_id == sid))).scalars().all()
+
+def test_merge_ranges():
+    assert files_ext._merge_ranges([(50, 10), (0, 20), (10, 20), (70, 5), (60, 5)]) == [(0, 30), (50, 65), (70, 75)]
+    assert files_ext._merge_ranges([]) == []
+
+async def test_chunks_in_any_order_with_overlap(db, files_dir):
+    sid = await start(db)
+    await put(db, sid, 60_000, 100_000)
+    await put(db, sid, 0, 30_000)
+    state = await files_ext.get_upload_session(sid, db=db, u=ADMIN)
+    assert state["received"] == [[0, 30_000], [60_000, 100_000]] and not state["complete"]
+    with pytest.raises(HTTPException) as e:
+        await files_ext.finalize_upload_session(sid, db=db, u=ADMIN)
+    assert e.value.status_code == 409
+    await put(db, sid, 20_000, 70_000)
+    state = await files_ext.get_upload_session(sid, db=db, u=ADMIN)
+    assert state["complete"] and state["received_bytes"] == len(DATA)
+
+    chunks = await chunk_paths(db, sid)
+    assert all(p.startswith(os.path.join(files_dir, "tmp", "sessions", sid)) for p in chunks)
+    out = await files_ext.finalize_upload_session(sid, db=db, u=ADMIN)
+    pf = await db.get(ProjectFile, out["id"])
+    with storage.open_stream(pf.stored_path) as f:
+        assert f.read() == DATA
+    assert pf.size_bytes == len(DATA) and pf.original_name == "model.ifc"
+    assert not any(os.path.exists(p) for p in chunks)
+    assert await db.get(UploadSession, sid) is None and await chunk_paths(db, sid) == []
+
+async def test_lost_chunk_asks_for_a_resend(db, files_dir):
+    sid = await start(db)
+    await put(db, sid, 0, 50_000)
+    await put(db, sid, 50_000, 100_000)
+    os.remove((await chunk_paths(db, sid))[0])
+    with pytest.raises(HTTPException) as e:
+        await files_ext.finalize_upload_session(sid, db=db, u=ADMIN)
+    assert e.value.status_code == 409
+    assert os.listdir(os.path.join(files_dir, "tmp")) == ["sessions"]
+
+async def test_chunk_past_the_declared_size_is_refused(db, files_dir):
+    sid = await start(db, size=1000)
+    with pytest.raises(HTTPException) as e:
+        await put(db, sid, 500, 1500)
+    assert e.value.status_code == 400
+    assert await chunk_paths(db, sid) == []
+    assert os.listdir(os.path.join(files_dir, "tmp")) == []
+
+async def test_abort_drops_the_chunks(db, files_dir):
+    sid = await start(db)
+    await put(db, sid, 0, 10_000)
+    chunks = await chunk_paths(db, sid)
+    assert await files_ext.abort_upload_session(sid, db=db, u=ADMIN) == {"ok": True}
+    assert not any(os.path.exists(p) for p in chunks)
+    with pytest.raises(HTTPException) as e:
+        await files_ext.get_upload_session(sid, db=db, u=ADMIN)
+    assert e.value.status_code == 404
+
+async def test_sessions_belong_to_their_user(db, files_dir):
+    sid = await start(db)
+    with pytest.raises(HTTPException) as e:
+        await files_ext.get_upload_session(sid, db=db, u=SimpleNamespace(id=2, role_id=1))
+    assert e.value.status_code == 404
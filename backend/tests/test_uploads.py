@@ -0,0 +1,43 @@
+import hashlib, io, os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+
+from app import utils
+from app.config import config
+
+pytestmark = pytest.mark.anyio
+
+DATA = os.urandom(utils.CHUNK_SIZE * 2 + 123)
+
+def upload(data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename="a.bin", headers=Headers({"content-type": "application/pdf"}))
+
+async def test_stream_upload_hashes_while_writing(tmp_path):
+    path = str(tmp_path / "a.part")
+    stored = await utils.stream_upload(upload(DATA), path)
+    assert (stored.size, stored.sha256) == (len(DATA), hashlib.sha256(DATA).hexdigest())
+    assert stored.content_type == "application/pdf"
+    with open(path, "rb") as f:
+        assert f.read() == DATA
+    assert utils.file_sha256(path) == (stored.sha256, stored.size)
+
+async def test_over_the_limit_removes_the_partial_file(tmp_path):
+    path = str(tmp_path / "a.part")
+    with pytest.raises(HTTPException) as e:
+        await utils.stream_upload(upload(DATA), path, max_bytes=utils.CHUNK_SIZE)
+    assert e.value.status_code == 413
+    assert not os.path.exists(path)
+
+async def test_exactly_the_limit_is_accepted(tmp_path):
+    stored = await utils.stream_upload(upload(DATA), str(tmp_path / "a.part"), max_bytes=len(DATA))
+    assert stored.size == len(DATA)
+
+def test_upload_limit_per_project(monkeypatch):
+    monkeypatch.setattr(config.storage, "max_upload_mb", 0)
+    monkeypatch.setattr(config.storage, "project_max_upload_mb", {"12": 5})
+    assert utils.upload_limit() is None
+    assert utils.upload_limit(12) == 5 * 1024 * 1024
+    monkeypatch.setattr(config.storage, "max_upload_mb", 2)
+    assert utils.upload_limit(13) == 2 * 1024 * 1024
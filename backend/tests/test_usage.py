@@ -0,0 +1,95 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app import search_index, storage, usage
+from app.models.models_files import ContractStorageUsage, FolderStorageUsage
+from app.routers import files_ext, projects
+from app.utils import StoredUpload
+
+pytestmark = pytest.mark.anyio
+
+ADMIN = SimpleNamespace(id=1, role_id=1)
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr(files_ext, "_CLOSURE_READY", set())
+    monkeypatch.setattr(search_index, "enqueue", lambda doc: True)
+
+async def upload(db, data: bytes, folder=None, folder_id=None, pf=None):
+    path = storage.temp_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    stored = StoredUpload(path=path, size=len(data), sha256=hashlib.sha256(data).hexdigest(), content_type="text/plain")
+    out, _ = await files_ext._store_upload(db, ADMIN, 7, folder, pf, "a.txt", "text/plain", stored, folder_id=folder_id)
+    await db.commit()
+    return out["id"]
+
+async def counters(db):
+    db.expire_all()
+    total = await db.get(ContractStorageUsage, 7)
+    res = await db.execute(select(FolderStorageUsage.folder_id, FolderStorageUsage.bytes_used, FolderStorageUsage.file_count)
+                           .where(FolderStorageUsage.contract_id == 7))
+    folders = {fid: (b, n) for fid, b, n in res.all() if b or n}
+    return (total.bytes_used, total.file_count, total.version_count), folders
+
+async def assert_matches_recount(db):
+    kept = await counters(db)
+    await usage.recount(db, 7)
+    await db.commit()
+    assert await counters(db) == kept
+    return kept
+
+async def test_counters_follow_uploads_moves_and_deletes(db, files_dir):
+    a = (await files_ext.create_folder(7, name="A", parent_id=None, db=db, u=ADMIN))["id"]
+    b = (await files_ext.create_folder(7, name="B", parent_id=None, db=db, u=ADMIN))["id"]
+    first = await upload(db, b"12345", "A", a)
+    await upload(db, b"123", None, None)
+    assert await assert_matches_recount(db) == ((8, 2, 2), {a: (5, 1), usage.ROOT_FOLDER: (3, 1)})
+
+    pf = await db.get(files_ext.ProjectFile, first)
+    await upload(db, b"1234567", pf=pf)
+    assert await assert_matches_recount(db) == ((15, 2, 3), {a: (12, 1), usage.ROOT_FOLDER: (3, 1)})
+
+    await files_ext.update_file(first, folder="B", name=None, db=db, u=ADMIN)
+    assert (await assert_matches_recount(db))[1] == {b: (12, 1), usage.ROOT_FOLDER: (3, 1)}
+    await projects.update_file(first, folder=0, description=None, db=db, u=ADMIN)
+    assert (await assert_matches_recount(db))[1] == {usage.ROOT_FOLDER: (15, 2)}
+
+    await projects.delete_file(first, db=db, u=ADMIN)
+    assert await assert_matches_recount(db) == ((3, 1, 1), {usage.ROOT_FOLDER: (3, 1)})
+
+async def test_blob_bytes_count_shared_content_once(db, files_dir):
+    await upload(db, b"same")
+    await upload(db, b"same")
+    total = await db.get(ContractStorageUsage, 7)
+    assert (total.bytes_used, total.blob_bytes) == (8, 4)
+
+async def test_quota_caps_uploads(db, files_dir, monkeypatch):
+    monkeypatch.setattr(files_ext.config.storage, "max_upload_mb", 0)
+    monkeypatch.setattr(files_ext.config.storage, "project_max_upload_mb", {})
+    assert await usage.remaining_quota(db, 7) is None
+    assert await files_ext._upload_cap(db, 7) is None
+    await upload(db, b"x" * 60)
+    (await db.get(ContractStorageUsage, 7)).quota_bytes = 100
+    await db.commit()
+    assert await usage.remaining_quota(db, 7) == 40
+    assert await files_ext._upload_cap(db, 7) == 40
+    await upload(db, b"y" * 40)
+    with pytest.raises(HTTPException) as e:
+        await files_ext._upload_cap(db, 7)
+    assert e.value.status_code == 507
+
+async def test_usage_reports_subtree_totals(db, files_dir):
+    a = (await files_ext.create_folder(7, name="A", parent_id=None, db=db, u=ADMIN))["id"]
+    b = (await files_ext.create_folder(7, name="B", parent_id=a, db=db, u=ADMIN))["id"]
+    await upload(db, b"12", "A", a)
+    await upload(db, b"12345", "A/B", b)
+    out = await files_ext.project_usage(7, db=db, u=ADMIN)
+    assert out["bytes_used"] == 7 and out["file_count"] == 2
+    folders = {f["folder_id"]: f for f in out["folders"]}
+    assert (folders[a]["bytes_used"], folders[a]["subtree_bytes"], folders[a]["subtree_files"]) == (2, 7, 2)
+    assert (folders[b]["bytes_used"], folders[b]["subtree_bytes"]) == (5, 5)
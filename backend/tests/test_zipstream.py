@@ -0,0 +1,65 @@
+import io, os, zipfile
+from datetime import datetime
+
+import pytest
+
+from app import zipstream
+from app.zipstream import ZipEntry
+
+BIG = os.urandom(zipstream.CHUNK_SIZE * 3 + 17)
+
+def archive(entries, **kw) -> zipfile.ZipFile:
+    return zipfile.ZipFile(io.BytesIO(b"".join(zipstream.stream_zip(entries, **kw))))
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "plan.pdf").write_bytes(BIG)
+    (tmp_path / "notes.txt").write_bytes(b"note " * 1000)
+    (tmp_path / "empty.txt").write_bytes(b"")
+    return tmp_path
+
+def test_round_trip(files):
+    when = datetime(2026, 5, 4, 3, 2, 10)
+    zf = archive([ZipEntry("a/plan.pdf", str(files / "plan.pdf"), when), ZipEntry("a/notes.txt", str(files / "notes.txt")),
+                  ZipEntry("empty.txt", str(files / "empty.txt"))])
+    assert zf.testzip() is None
+    assert zf.namelist() == ["a/plan.pdf", "a/notes.txt", "empty.txt"]
+    assert zf.read("a/plan.pdf") == BIG and zf.read("a/notes.txt") == b"note " * 1000 and zf.read("empty.txt") == b""
+    pdf, txt = zf.getinfo("a/plan.pdf"), zf.getinfo("a/notes.txt")
+    # already compressed formats are stored, the rest deflated
+    assert pdf.compress_type == zipfile.ZIP_STORED and txt.compress_type == zipfile.ZIP_DEFLATED
+    assert txt.compress_size < txt.file_size
+    assert pdf.date_time == (2026, 5, 4, 3, 2, 10)
+    # sizes and CRC follow the data in a descriptor (flag bit 3)
+    assert pdf.flag_bits & 0x08 and txt.flag_bits & 0x08
+
+def test_missing_files_are_skipped(files):
+    zf = archive([ZipEntry("gone.txt", str(files / "gone.txt")), ZipEntry("notes.txt", str(files / "notes.txt"))])
+    assert zf.namelist() == ["notes.txt"]
+
+def test_old_dates_are_clamped(files):
+    zf = archive([ZipEntry("notes.txt", str(files / "notes.txt"), datetime(1970, 1, 1))])
+    assert zf.getinfo("notes.txt").date_time == (1980, 1, 1, 0, 0, 0)
+
+def test_first_bytes_go_out_before_the_file_is_read():
+    reads = []
+
+    class Tracked(io.BytesIO):
+        def read(self, n=-1):
+            reads.append(n)
+            return super().read(n)
+
+    chunks = zipstream.stream_zip([ZipEntry("plan.pdf", "plan.pdf", size=len(BIG))], opener=lambda p: Tracked(BIG))
+    next(chunks)
+    assert len(reads) == 1
+    rest = list(chunks)
+    assert len(rest) > 2 and len(reads) == 5
+
+def test_large_members_switch_to_zip64(files, monkeypatch):
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1024)
+    data = b"".join(zipstream.stream_zip([ZipEntry("plan.pdf", str(files / "plan.pdf"))]))
+    monkeypatch.undo()
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    assert zf.read("plan.pdf") == BIG
+    # members written with zip64 extra fields need version 4.5 to extract
+    assert zf.getinfo("plan.pdf").extract_version >= zipfile.ZIP64_VERSION
@@ -0,0 +1,5 @@
+-- v038: Lookups for share tokens, owners and download logs
+
+CREATE INDEX IF NOT EXISTS ix_file_shares_token ON file_shares(token);
+CREATE INDEX IF NOT EXISTS ix_file_shares_owner ON file_shares(owner_id);
+CREATE INDEX IF NOT EXISTS ix_file_download_logs_file ON file_download_logs(file_id);
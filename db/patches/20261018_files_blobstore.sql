@@ -0,0 +1,20 @@
+-- v031: Content-addressed blob store for project file revisions
+
+CREATE TABLE IF NOT EXISTS storage_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    stored_path VARCHAR(500) NOT NULL,
+    size_bytes BIGINT NOT NULL DEFAULT 0,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    unreferenced_at DATETIME NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_storage_blobs_ref_count ON storage_blobs(ref_count);
+
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS sha256 CHAR(64) NULL;
+ALTER TABLE project_file_versions ADD COLUMN IF NOT EXISTS sha256 CHAR(64) NULL;
+
+CREATE INDEX IF NOT EXISTS ix_project_files_sha256 ON project_files(sha256);
+CREATE INDEX IF NOT EXISTS ix_project_file_versions_sha256 ON project_file_versions(sha256);
+
+-- Existing uuid-named blobs keep sha256 = NULL and are not reference counted.
@@ -0,0 +1,13 @@
+-- v030: Denormalized latest revision number on project files
+
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS latest_revision_no INT NULL;
+
+-- Files without version rows stay NULL: the first replace records their current content as revision 1
+UPDATE project_files pf
+    JOIN (
+        SELECT file_id, MAX(revision_no) AS max_rev
+        FROM project_file_versions
+        GROUP BY file_id
+    ) v ON v.file_id = pf.id
+SET pf.latest_revision_no = v.max_rev
+WHERE pf.latest_revision_no IS NULL;
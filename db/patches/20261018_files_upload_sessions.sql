@@ -0,0 +1,29 @@
+-- v032: Resumable chunked upload sessions
+
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id CHAR(32) PRIMARY KEY,
+    contract_id INT NOT NULL,
+    user_id INT NOT NULL,
+    folder VARCHAR(255) NULL,
+    filename VARCHAR(255) NOT NULL,
+    content_type VARCHAR(100),
+    total_size BIGINT NOT NULL,
+    replace_file_id INT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    CONSTRAINT fk_upsess_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_upload_sessions_contract ON upload_sessions(contract_id);
+CREATE INDEX IF NOT EXISTS ix_upload_sessions_expires ON upload_sessions(expires_at);
+
+CREATE TABLE IF NOT EXISTS upload_session_chunks (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    session_id CHAR(32) NOT NULL,
+    `offset` BIGINT NOT NULL,
+    length BIGINT NOT NULL,
+    stored_path VARCHAR(500) NOT NULL,
+    CONSTRAINT fk_upchunk_session FOREIGN KEY (session_id) REFERENCES upload_sessions(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_upload_session_chunks_session ON upload_session_chunks(session_id);
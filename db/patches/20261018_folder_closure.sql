@@ -0,0 +1,25 @@
+-- v033: Closure table (ancestor index) for project folder trees
+
+CREATE TABLE IF NOT EXISTS project_folder_closure (
+    ancestor_id INT NOT NULL,
+    descendant_id INT NOT NULL,
+    depth INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (ancestor_id, descendant_id),
+    CONSTRAINT fk_pfclos_anc FOREIGN KEY (ancestor_id) REFERENCES project_folders(id) ON DELETE CASCADE,
+    CONSTRAINT fk_pfclos_desc FOREIGN KEY (descendant_id) REFERENCES project_folders(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_project_folder_closure_descendant_id ON project_folder_closure(descendant_id);
+CREATE INDEX IF NOT EXISTS ix_project_folders_parent_name ON project_folders(contract_id, parent_id, name);
+
+-- Backfill (MariaDB 10.2+ / MySQL 8: recursive CTE)
+INSERT IGNORE INTO project_folder_closure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE chain (ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM project_folders
+    UNION ALL
+    SELECT f.parent_id, c.descendant_id, c.depth + 1
+    FROM chain c
+    JOIN project_folders f ON f.id = c.ancestor_id
+    WHERE f.parent_id IS NOT NULL AND c.depth < 256
+)
+SELECT ancestor_id, descendant_id, depth FROM chain;
@@ -0,0 +1,10 @@
+-- v043: Persisted "closure rows complete" flag per contract (replaces a per-process check)
+
+CREATE TABLE IF NOT EXISTS project_folder_closure_ready (
+    contract_id INT PRIMARY KEY,
+    built_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- v033 backfilled the closure of every existing folder and new folders maintain their rows
+INSERT IGNORE INTO project_folder_closure_ready (contract_id)
+SELECT DISTINCT contract_id FROM project_folders;
@@ -0,0 +1,4 @@
+-- v034: Content hash on library items (thumbnail cache key)
+
+ALTER TABLE library_items ADD COLUMN IF NOT EXISTS sha256 CHAR(64) NULL;
+CREATE INDEX IF NOT EXISTS ix_library_items_sha256 ON library_items(sha256);
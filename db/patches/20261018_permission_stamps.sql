@@ -0,0 +1,6 @@
+-- v042: Per-contract permission stamps (cross-process invalidation of cached folder permissions)
+
+CREATE TABLE IF NOT EXISTS project_permission_stamps (
+    contract_id INT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
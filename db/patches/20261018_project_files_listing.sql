@@ -0,0 +1,12 @@
+-- v036: Composite indexes for keyset-paginated folder listings
+
+-- The project root is stored as NULL only, so a listing filters on one value
+UPDATE project_files SET folder = NULL WHERE folder = '';
+
+-- Stored sort key for the revision column (not-yet-backfilled rows count as revision 1)
+ALTER TABLE project_files ADD COLUMN IF NOT EXISTS revision_sort INT AS (COALESCE(latest_revision_no, 1)) PERSISTENT;
+
+CREATE INDEX IF NOT EXISTS ix_project_files_folder_name ON project_files(contract_id, folder, deleted_at, original_name);
+CREATE INDEX IF NOT EXISTS ix_project_files_folder_size ON project_files(contract_id, folder, deleted_at, size_bytes);
+CREATE INDEX IF NOT EXISTS ix_project_files_folder_uploaded ON project_files(contract_id, folder, deleted_at, uploaded_at);
+CREATE INDEX IF NOT EXISTS ix_project_files_folder_revision ON project_files(contract_id, folder, deleted_at, revision_sort);
@@ -0,0 +1,20 @@
+-- v039: Fractional rank keys for schedule siblings and kanban tasks
+
+ALTER TABLE project_schedule_items ADD COLUMN IF NOT EXISTS sort_key VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NULL;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS sort_key VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NULL;
+
+-- seed keys from the current order: zero-padded positions, suffixed so no key ends in '0'
+UPDATE project_schedule_items i
+JOIN (SELECT id, ROW_NUMBER() OVER (PARTITION BY contract_id, parent_id ORDER BY sort_index, id) AS rn
+      FROM project_schedule_items) r ON r.id = i.id
+SET i.sort_key = CONCAT(LPAD(r.rn, 8, '0'), 'V')
+WHERE i.sort_key IS NULL;
+
+UPDATE tasks t
+JOIN (SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, status ORDER BY order_index, id) AS rn
+      FROM tasks) r ON r.id = t.id
+SET t.sort_key = CONCAT(LPAD(r.rn, 8, '0'), 'V')
+WHERE t.sort_key IS NULL;
+
+CREATE INDEX IF NOT EXISTS ix_schedule_items_sibling_key ON project_schedule_items(contract_id, parent_id, sort_key);
+CREATE INDEX IF NOT EXISTS ix_tasks_column_key ON tasks(user_id, status, sort_key);
@@ -0,0 +1,14 @@
+-- v037: Revision retention policies and the compressed cold blob tier
+
+ALTER TABLE storage_blobs ADD COLUMN IF NOT EXISTS tier VARCHAR(8) NOT NULL DEFAULT 'hot';
+ALTER TABLE storage_blobs ADD COLUMN IF NOT EXISTS cold_path VARCHAR(500) NULL;
+ALTER TABLE storage_blobs ADD COLUMN IF NOT EXISTS codec VARCHAR(8) NULL;
+ALTER TABLE storage_blobs ADD COLUMN IF NOT EXISTS cold_size_bytes BIGINT NULL;
+
+CREATE TABLE IF NOT EXISTS file_retention_policies (
+    contract_id INT PRIMARY KEY,
+    enabled TINYINT(1) NOT NULL DEFAULT 1,
+    keep_hot_revisions INT NOT NULL DEFAULT 3,
+    cold_after_days INT NOT NULL DEFAULT 30,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
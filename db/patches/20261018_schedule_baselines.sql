@@ -0,0 +1,27 @@
+-- v041: Schedule baselines (one row per item per snapshot)
+
+CREATE TABLE IF NOT EXISTS schedule_baselines (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    contract_id INT NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    item_count INT NOT NULL DEFAULT 0,
+    created_by INT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY ix_schedule_baselines_contract_id (contract_id),
+    CONSTRAINT fk_sched_baseline_contract FOREIGN KEY (contract_id) REFERENCES contracts(id) ON DELETE CASCADE,
+    CONSTRAINT fk_sched_baseline_user FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS schedule_baseline_items (
+    baseline_id INT NOT NULL,
+    item_id INT NOT NULL,
+    parent_id INT NULL,
+    title VARCHAR(255) NOT NULL,
+    planned_start DATE NULL,
+    planned_end DATE NULL,
+    actual_start DATE NULL,
+    actual_end DATE NULL,
+    progress INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (baseline_id, item_id),
+    CONSTRAINT fk_sched_baseline_item FOREIGN KEY (baseline_id) REFERENCES schedule_baselines(id) ON DELETE CASCADE
+);
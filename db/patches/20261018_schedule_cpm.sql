@@ -0,0 +1,24 @@
+-- v040: Schedule dependencies and stored critical path results
+
+CREATE TABLE IF NOT EXISTS project_schedule_dependencies (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    contract_id INT NOT NULL,
+    predecessor_id INT NOT NULL,
+    successor_id INT NOT NULL,
+    type VARCHAR(2) NOT NULL DEFAULT 'FS',
+    lag_days INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_schedule_dependency_pair (predecessor_id, successor_id),
+    KEY ix_project_schedule_dependencies_contract_id (contract_id),
+    KEY ix_project_schedule_dependencies_successor_id (successor_id),
+    CONSTRAINT fk_schedule_dep_contract FOREIGN KEY (contract_id) REFERENCES contracts(id) ON DELETE CASCADE,
+    CONSTRAINT fk_schedule_dep_pred FOREIGN KEY (predecessor_id) REFERENCES project_schedule_items(id) ON DELETE CASCADE,
+    CONSTRAINT fk_schedule_dep_succ FOREIGN KEY (successor_id) REFERENCES project_schedule_items(id) ON DELETE CASCADE
+);
+
+ALTER TABLE project_schedule_items ADD COLUMN IF NOT EXISTS early_start DATE NULL;
+ALTER TABLE project_schedule_items ADD COLUMN IF NOT EXISTS early_finish DATE NULL;
+ALTER TABLE project_schedule_items ADD COLUMN IF NOT EXISTS late_start DATE NULL;
+ALTER TABLE project_schedule_items ADD COLUMN IF NOT EXISTS late_finish DATE NULL;
+ALTER TABLE project_schedule_items ADD COLUMN IF NOT EXISTS total_float INT NULL;
+ALTER TABLE project_schedule_items ADD COLUMN IF NOT EXISTS critical TINYINT(1) NOT NULL DEFAULT 0;
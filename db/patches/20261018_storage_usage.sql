@@ -0,0 +1,41 @@
+-- v035: Incrementally maintained storage usage and quotas
+
+ALTER TABLE storage_blobs ADD COLUMN IF NOT EXISTS contract_id INT NULL;
+
+CREATE TABLE IF NOT EXISTS contract_storage_usage (
+    contract_id INT PRIMARY KEY,
+    bytes_used BIGINT NOT NULL DEFAULT 0,
+    file_count INT NOT NULL DEFAULT 0,
+    version_count INT NOT NULL DEFAULT 0,
+    blob_bytes BIGINT NOT NULL DEFAULT 0,
+    quota_bytes BIGINT NULL
+);
+
+CREATE TABLE IF NOT EXISTS folder_storage_usage (
+    contract_id INT NOT NULL,
+    folder_id INT NOT NULL,          -- 0 = project root
+    bytes_used BIGINT NOT NULL DEFAULT 0,
+    file_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (contract_id, folder_id)
+);
+
+-- Backfill: every revision counts; files without version rows count once
+INSERT INTO contract_storage_usage (contract_id, bytes_used, file_count, version_count)
+SELECT pf.contract_id,
+       SUM(COALESCE(v.bytes, pf.size_bytes)),
+       COUNT(*),
+       SUM(COALESCE(v.n, 0))
+FROM project_files pf
+LEFT JOIN (SELECT file_id, SUM(size_bytes) AS bytes, COUNT(*) AS n FROM project_file_versions GROUP BY file_id) v ON v.file_id = pf.id
+WHERE pf.deleted_at IS NULL
+GROUP BY pf.contract_id
+ON DUPLICATE KEY UPDATE bytes_used = VALUES(bytes_used), file_count = VALUES(file_count), version_count = VALUES(version_count);
+
+INSERT INTO folder_storage_usage (contract_id, folder_id, bytes_used, file_count)
+SELECT pf.contract_id, COALESCE(f.id, 0), SUM(COALESCE(v.bytes, pf.size_bytes)), COUNT(*)
+FROM project_files pf
+LEFT JOIN project_folders f ON f.contract_id = pf.contract_id AND f.path = pf.folder
+LEFT JOIN (SELECT file_id, SUM(size_bytes) AS bytes FROM project_file_versions GROUP BY file_id) v ON v.file_id = pf.id
+WHERE pf.deleted_at IS NULL
+GROUP BY pf.contract_id, COALESCE(f.id, 0)
+ON DUPLICATE KEY UPDATE bytes_used = VALUES(bytes_used), file_count = VALUES(file_count);